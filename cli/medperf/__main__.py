@@ -12,6 +12,7 @@ import medperf.commands.result.result as result
 import medperf.commands.mlcube.mlcube as mlcube
 import medperf.commands.dataset.dataset as dataset
 import medperf.commands.benchmark.benchmark as benchmark
+import medperf.commands.storage.storage as storage
 from medperf.utils import init_storage, storage_path, cleanup
 import medperf.commands.association.association as association
 from medperf.commands.compatibility_test import CompatibilityTestExecution
@@ -25,6 +26,7 @@ app.add_typer(benchmark.app, name="benchmark", help="Manage benchmarks")
 app.add_typer(mlcube.app, name="mlcube", help="Manage mlcubes")
 app.add_typer(result.app, name="result", help="Manage results")
 app.add_typer(association.app, name="association", help="Manage associations")
+app.add_typer(storage.app, name="storage", help="Manage local storage")
 
 
 @app.command("login")
@@ -109,10 +111,13 @@ def main(
     host: str = config.server,
     storage: str = config.storage,
     platform: str = config.platform,
+    storage_quota: float = None,
 ):
     # Set configuration variables
     config.storage = abspath(expanduser(storage))
     config.platform = platform
+    if storage_quota is not None:
+        config.storage_quota = int(storage_quota * 1024 ** 3)
     if log_file is None:
         log_file = storage_path(config.log_file)
     else:
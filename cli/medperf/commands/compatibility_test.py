@@ -13,6 +13,7 @@ from medperf.entities.benchmark import Benchmark
 from medperf.commands.dataset.create import DataPreparation
 from medperf.commands.result.create import BenchmarkExecution
 from medperf.utils import pretty_error, untar, get_file_sha1, get_uids, storage_path
+from medperf.storage import mark_access, enforce_quota, in_use, record_growth
 from medperf.commands.result.create import BenchmarkExecution
 
 
@@ -68,6 +69,7 @@ class CompatibilityTestExecution:
         self.benchmark = None
         self.data_uid = data_uid
         self.dataset = None
+        self.demo_path = None
         self.data_prep = data_prep
         self.model = model
         self.evaluator = evaluator
@@ -106,14 +108,15 @@ class CompatibilityTestExecution:
     def execute_benchmark(self):
         """Runs the benchmark execution flow given the specified testing parameters
         """
-        BenchmarkExecution.run(
-            self.benchmark_uid,
-            self.data_uid,
-            self.model,
-            self.comms,
-            self.ui,
-            run_test=True,
-        )
+        with in_use(self.dataset.dataset_path):
+            BenchmarkExecution.run(
+                self.benchmark_uid,
+                self.data_uid,
+                self.model,
+                self.comms,
+                self.ui,
+                run_test=True,
+            )
         return Result(self.benchmark_uid, self.dataset.uid, self.model)
 
     def set_cube_uid(self, attr: str, fallback: any = None):
@@ -159,14 +162,15 @@ class CompatibilityTestExecution:
                 "No dataset found with provided uid. Using benchmark demo dataset"
             )
             data_path, labels_path = self.download_demo_data(self.data_uid)
-            self.data_uid = DataPreparation.run(
-                self.benchmark_uid,
-                data_path,
-                labels_path,
-                self.comms,
-                self.ui,
-                run_test=True,
-            )
+            with in_use(self.demo_path):
+                self.data_uid = DataPreparation.run(
+                    self.benchmark_uid,
+                    data_path,
+                    labels_path,
+                    self.comms,
+                    self.ui,
+                    run_test=True,
+                )
             # Dataset will not be registered, so we must mock its uid
             logging.info("Defining local data uid")
             self.dataset = Dataset(self.data_uid, self.ui)
@@ -187,15 +191,20 @@ class CompatibilityTestExecution:
         else:
             dset_hash = self.benchmark.demo_dataset_hash
         dset_url = self.benchmark.demo_dataset_url
-        file_path = self.comms.get_benchmark_demo_dataset(dset_url, dset_hash)
-
-        # Check demo dataset integrity
-        file_hash = get_file_sha1(file_path)
-        # Alllow for empty datset hashes for benchmark registration purposes
-        if dset_hash and file_hash != dset_hash:
-            pretty_error("Demo dataset hash doesn't match expected hash", self.ui)
-
-        untar_path = untar(file_path, remove=False)
+        # Demo datasets may already be stored, so only the growth is tracked
+        with record_growth(storage_path(config.demo_data_storage)):
+            file_path = self.comms.get_benchmark_demo_dataset(dset_url, dset_hash)
+
+            # Check demo dataset integrity
+            file_hash = get_file_sha1(file_path)
+            # Alllow for empty datset hashes for benchmark registration purposes
+            if dset_hash and file_hash != dset_hash:
+                pretty_error("Demo dataset hash doesn't match expected hash", self.ui)
+
+            untar_path = untar(file_path, remove=False)
+        self.demo_path = untar_path
+        mark_access(untar_path)
+        enforce_quota(keep=[untar_path])
 
         # It is assumed that all demo datasets contain a file
         # which specifies the input of the data preparation step
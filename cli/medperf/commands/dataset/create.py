@@ -6,6 +6,7 @@ from medperf.comms.interface import Comms
 from medperf.entities.cube import Cube
 from medperf.entities.benchmark import Benchmark
 from medperf.entities.registration import Registration
+from medperf.storage import in_use
 from medperf.utils import (
     check_cube_validity,
     generate_tmp_datapath,
@@ -26,9 +27,11 @@ class DataPreparation:
         run_test=False,
     ):
         preparation = cls(benchmark_uid, data_path, labels_path, comms, ui, run_test)
-        with preparation.ui.interactive():
-            preparation.get_prep_cube()
-            preparation.run_cube_tasks()
+        # The temporary dataset must not be evicted while being prepared
+        with in_use(preparation.out_path):
+            with preparation.ui.interactive():
+                preparation.get_prep_cube()
+                preparation.run_cube_tasks()
         data_uid = preparation.create_registration()
         return data_uid
 
@@ -0,0 +1,34 @@
+from tabulate import tabulate
+
+import medperf.config as config
+from medperf.ui.interface import UI
+from medperf.utils import format_size
+from medperf.storage import enforce_quota
+
+
+class StorageGC:
+    @staticmethod
+    def run(ui: UI, quota: int = None):
+        """Evicts the least recently used cubes, demo datasets and temporary
+        datasets until the local storage fits inside the quota
+
+        Args:
+            ui (UI): UI interface
+            quota (int, optional): Maximum storage size in bytes. Defaults to config.storage_quota.
+        """
+        if quota is None:
+            quota = config.storage_quota
+        if quota is None:
+            ui.print("No storage quota specified. Nothing to remove")
+            return
+
+        evicted = enforce_quota(quota)
+        headers = ["Type", "Location", "Size"]
+        evicted_data = [
+            [entry.kind, entry.path, format_size(entry.size)] for entry in evicted
+        ]
+        freed = sum(entry.size for entry in evicted)
+
+        tab = tabulate(evicted_data, headers=headers)
+        ui.print(tab)
+        ui.print(f"Freed: {format_size(freed)}")
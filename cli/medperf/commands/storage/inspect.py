@@ -0,0 +1,45 @@
+import os
+from tabulate import tabulate
+
+import medperf.config as config
+from medperf.ui.interface import UI
+from medperf.utils import storage_path, list_dirs, get_folder_size, format_size
+
+
+class StorageInspect:
+    @staticmethod
+    def storage_levels() -> dict:
+        """Depth at which each storage folder keeps its entries.
+        Results are stored as <benchmark>/<model>/<dataset>
+        """
+        return {
+            config.cubes_storage: 1,
+            config.artifacts_storage: 1,
+            config.data_storage: 1,
+            config.results_storage: 3,
+            config.benchmarks_storage: 1,
+            config.demo_data_storage: 1,
+            config.tmp_storage: 1,
+        }
+
+    @staticmethod
+    def run(ui: UI):
+        """Reports the disk usage of every cube, dataset, result and
+        benchmark stored locally
+
+        Args:
+            ui (UI): UI interface
+        """
+        headers = ["Storage", "Entry", "Files", "Size"]
+        storage_data = []
+        total = 0
+        for storage, depth in StorageInspect.storage_levels().items():
+            path = storage_path(storage)
+            for entry in list_dirs(path, depth):
+                size, n_files = get_folder_size(os.path.join(path, entry))
+                total += size
+                storage_data.append([storage, entry, n_files, format_size(size)])
+
+        tab = tabulate(storage_data, headers=headers)
+        ui.print(tab)
+        ui.print(f"Total: {format_size(total)}")
@@ -0,0 +1,35 @@
+import typer
+
+import medperf.config as config
+from medperf.decorators import clean_except
+from medperf.commands.storage.gc import StorageGC
+from medperf.commands.storage.inspect import StorageInspect
+
+app = typer.Typer()
+
+
+@app.command("inspect")
+@clean_except
+def inspect():
+    """Shows the disk usage of the cubes, datasets and results stored locally"""
+    ui = config.ui
+    StorageInspect.run(ui)
+
+
+@app.command("gc")
+@clean_except
+def gc(
+    quota: float = typer.Option(
+        None,
+        "--quota",
+        "-q",
+        help="Maximum storage size in GB. Defaults to the configured storage quota",
+    ),
+):
+    """Removes the least recently used cubes and demo or test datasets until the storage fits the quota.
+    Registered datasets and cubes in use are never removed
+    """
+    ui = config.ui
+    if quota is not None:
+        quota = int(quota * 1024 ** 3)
+    StorageGC.run(ui, quota)
@@ -1,4 +1,4 @@
-from typing import List
+from typing import BinaryIO, List
 from abc import ABC, abstractmethod
 
 from medperf.ui.interface import UI
@@ -165,6 +165,18 @@ class Comms(ABC):
             str: Location where the additional_files.tar.gz file is stored locally.
         """
 
+    @abstractmethod
+    def stream_cube_additional(self, url: str) -> BinaryIO:
+        """Opens a stream to the additional_files.tar.gz file, so that it can
+        be processed while being downloaded
+
+        Args:
+            url (str): URL where the additional_files.tar.gz file can be downloaded.
+
+        Returns:
+            BinaryIO: readable stream with the file contents. Must be closed by the caller.
+        """
+
     @abstractmethod
     def upload_benchmark(self, benchmark_dict: dict) -> int:
         """Uploads a new benchmark to the server.
@@ -1,4 +1,4 @@
-from typing import List
+from typing import BinaryIO, List
 import requests
 import logging
 import os
@@ -280,6 +280,25 @@ class REST(Comms):
         tball_file = config.tarball_filename
         return self.__get_cube_file(url, cube_uid, add_path, tball_file)
 
+    def stream_cube_additional(self, url: str) -> BinaryIO:
+        """Opens a stream to the additional_files.tar.gz file, so that it can
+        be processed while being downloaded
+
+        Args:
+            url (str): URL where the additional_files.tar.gz file can be downloaded.
+
+        Returns:
+            BinaryIO: readable stream with the file contents. Must be closed by the caller.
+        """
+        res = requests.get(url, stream=True)
+        if res.status_code != 200:
+            logging.error(f"Retrieving cube file failed with: {res.status_code}")
+            pretty_error(
+                "There was a problem retrieving the specified file at " + url, self.ui
+            )
+        res.raw.decode_content = True
+        return res.raw
+
     def __get_cube_file(self, url: str, cube_uid: int, path: str, filename: str):
         res = requests.get(url)
         if res.status_code != 200:
@@ -8,6 +8,7 @@ tmp_storage = "tmp"
 data_storage = "data"
 demo_data_storage = "demo"
 cubes_storage = "cubes"
+artifacts_storage = "artifacts"
 results_storage = "results"
 results_filename = "result.yaml"
 benchmarks_storage = "benchmarks"
@@ -19,6 +20,8 @@ cube_filename = "mlcube.yaml"
 params_filename = "parameters.yaml"
 additional_path = "workspace/additional_files"
 tarball_filename = "tmp.tar.gz"
+tar_read_size = 1048576
+parallel_gunzip_tools = ["pigz", "igzip"]
 reg_file = "registration-info.yaml"
 log_file = "medperf.log"
 test_cube_prefix = "test_"
@@ -28,6 +31,19 @@ demo_dset_paths_file = "paths.yaml"
 default_comms = "REST"
 default_ui = "CLI"
 platform = "docker"
+proc_read_size = 65536
+proc_output_max_lines = 1000
+proc_output_max_line_size = 65536
+proc_output_refresh_interval = 0.1
+cube_logs_storage = "logs"
+cube_log_max_bytes = 52428800
+cube_log_backup_count = 3
+cube_log_queue_size = 10000
+cube_logs_keep = 20
+storage_debug_max_depth = 3
+storage_debug_max_entries = 500
+storage_quota = None
+in_use_prefix = ".in_use_"
 git_file_domain = "https://raw.githubusercontent.com"
 comms = None
 ui = None
@@ -7,12 +7,21 @@ from pathlib import Path
 
 from medperf.utils import (
     approval_prompt,
-    get_file_sha1,
     pretty_error,
-    untar,
     combine_proc_sp_text,
     list_files,
     storage_path,
+    proc_log_path,
+    ProcLogWriter,
+)
+from medperf.storage import (
+    mark_access,
+    in_use,
+    enforce_quota,
+    has_artifact,
+    store_artifact,
+    link_artifact,
+    record_added,
 )
 from medperf.ui.interface import UI
 import medperf.config as config
@@ -104,22 +113,32 @@ class Cube(object):
             filter(lambda cube: str(cube.uid) == str(cube_uid), cls.all(ui))
         )
         if len(local_cube) == 1:
+            mark_access(os.path.join(storage_path(config.cubes_storage), str(cube_uid)))
             return local_cube[0]
 
         meta = comms.get_cube_metadata(cube_uid)
         cube_path = comms.get_cube(meta["git_mlcube_url"], cube_uid)
+        cube_loc = str(Path(cube_path).parent)
         params_path = None
-        additional_path = None
         additional_hash = None
         if "git_parameters_url" in meta and meta["git_parameters_url"]:
             url = meta["git_parameters_url"]
             params_path = comms.get_cube_params(url, cube_uid)
         if "tarball_url" in meta and meta["tarball_url"]:
-            url = meta["tarball_url"]
-            additional_path = comms.get_cube_additional(url, cube_uid)
-            additional_hash = get_file_sha1(additional_path)
-            untar(additional_path)
-
+            # Additional files are shared with other cubes through the artifact store
+            additional_hash = meta.get("tarball_hash", None)
+            if not has_artifact(additional_hash):
+                # The tarball is extracted while being downloaded
+                url = meta["tarball_url"]
+                with comms.stream_cube_additional(url) as stream:
+                    additional_hash = store_artifact(stream)
+            additional_loc = os.path.join(cube_loc, config.additional_path)
+            link_artifact(additional_hash, additional_loc)
+
+        record_added(cube_loc)
+        # The retrieved cube must not be evicted by later retrievals of this execution
+        mark_access(cube_loc)
+        enforce_quota()
         return cls(cube_uid, meta, cube_path, params_path, additional_hash)
 
     def is_valid(self) -> bool:
@@ -136,7 +155,8 @@ class Cube(object):
         return valid_additional
 
     def run(self, ui: UI, task: str, **kwargs):
-        """Executes a given task on the cube instance
+        """Executes a given task on the cube instance. The cube output is
+        stored in a log file inside the cube folder
 
         Args:
             ui (UI): an instance of an UI implementation
@@ -148,15 +168,26 @@ class Cube(object):
             cmd_arg = f"{k}={v}"
             cmd = " ".join([cmd, cmd_arg])
         logging.info(f"Running MLCube command: {cmd}")
-        proc = pexpect.spawn(cmd, timeout=None)
-        proc_out = combine_proc_sp_text(proc, ui)
-        proc.close()
-        logging.debug(proc_out)
+        log_path = proc_log_path(self.uid, task)
+        with in_use(str(Path(self.cube_path).parent)):
+            proc = pexpect.spawn(cmd, timeout=None)
+            with ProcLogWriter(log_path) as log_writer:
+                proc_out = combine_proc_sp_text(proc, ui, sink=log_writer)
+            proc.close()
+        logging.info(f"MLCube output stored at {log_path}")
         if proc.exitstatus != 0:
+            logging.error(f"MLCube output tail:\n{proc_out}")
             ui.text = "\n"
-            pretty_error("There was an error while executing the cube", ui)
+            msg = f"There was an error while executing the cube. Full output at {log_path}"
+            pretty_error(msg, ui)
 
-        logging.debug(list_files(config.storage))
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            storage_tree = list_files(
+                config.storage,
+                max_depth=config.storage_debug_max_depth,
+                max_entries=config.storage_debug_max_entries,
+            )
+            logging.debug(storage_tree)
         return proc
 
     def get_default_output(self, task: str, out_key: str, param_key: str = None) -> str:
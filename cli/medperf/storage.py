@@ -0,0 +1,351 @@
+import os
+import logging
+from pathlib import Path
+from shutil import rmtree, copy2
+from contextlib import contextmanager
+from typing import BinaryIO, List, NamedTuple, Tuple
+
+import medperf.config as config
+from medperf.utils import (
+    storage_path,
+    get_folder_size,
+    extract_tar,
+    HashingReader,
+)
+
+# Entries accessed by the current execution. They are kept on eviction,
+# since a running command may still need them
+accessed_paths = set()
+
+# Size of the medperf storage in bytes. Computed once per execution, when
+# first needed, and then updated with the entries stored and evicted by it
+tracked_size = None
+
+
+class StorageEntry(NamedTuple):
+    """A locally stored element that may be evicted to free space"""
+
+    kind: str
+    path: str
+    size: int
+    last_access: float
+
+
+def mark_access(path: str):
+    """Records that a storage entry has just been used. The entry folder
+    modification time is used as its last access time. Entries accessed by
+    the current execution are never evicted by it.
+
+    Args:
+        path (str): Location of the cube, dataset or demo dataset folder.
+    """
+    accessed_paths.add(os.path.abspath(path))
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+@contextmanager
+def in_use(path: str):
+    """Marks a storage entry as in use by the current process, so that it
+    is not evicted while the context is active, e.g. by a concurrent
+    medperf execution.
+
+    Args:
+        path (str): Location of the cube or dataset folder.
+    """
+    marker = os.path.join(path, f"{config.in_use_prefix}{os.getpid()}")
+    Path(marker).touch()
+    mark_access(path)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(marker)
+        except FileNotFoundError:
+            pass
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def is_in_use(path: str) -> bool:
+    """Checks if any running process marked the storage entry as in use
+
+    Args:
+        path (str): Location of the cube or dataset folder.
+
+    Returns:
+        bool: Wether the entry is being used
+    """
+    prefix = config.in_use_prefix
+    try:
+        with os.scandir(path) as entries:
+            pids = [e.name[len(prefix) :] for e in entries if e.name.startswith(prefix)]
+    except OSError:
+        return False
+    return any(pid.isdigit() and _pid_alive(int(pid)) for pid in pids)
+
+
+def _entry_usage(path: str) -> Tuple[int, bool]:
+    """Computes the space freed by removing path. Files hardlinked from
+    outside of path, e.g. stored artifacts linked by cubes, are not counted
+
+    Returns:
+        int: reclaimable size in bytes
+        bool: Wether any file inside path is hardlinked from elsewhere
+    """
+    size = 0
+    links = {}
+    nlinks = {}
+    for root, _, files in os.walk(path):
+        for file in files:
+            stat = os.stat(os.path.join(root, file), follow_symlinks=False)
+            inode = (stat.st_dev, stat.st_ino)
+            links[inode] = links.get(inode, 0) + 1
+            nlinks[inode] = stat.st_nlink
+            if links[inode] == stat.st_nlink:
+                size += stat.st_size
+    shared = any(links[inode] < nlink for inode, nlink in nlinks.items())
+    return size, shared
+
+
+def storage_size() -> int:
+    """Size of the medperf storage in bytes. The whole storage is only
+    walked the first time in an execution. Entries stored afterwards are
+    added through record_added, and evicted entries are subtracted.
+    """
+    global tracked_size
+    if tracked_size is None:
+        tracked_size, _ = get_folder_size(config.storage)
+    return tracked_size
+
+
+def record_added(path: str):
+    """Adds the space taken by a newly stored entry to the tracked storage
+    size. Nothing is done if the size hasn't been computed yet, since it
+    will already include the entry.
+
+    Args:
+        path (str): Location of the new cube, dataset, demo dataset or artifact folder.
+    """
+    global tracked_size
+    if tracked_size is not None:
+        tracked_size += _entry_usage(path)[0]
+
+
+@contextmanager
+def record_growth(path: str):
+    """Adds the space taken by whatever is stored inside path while the
+    context is active to the tracked storage size. Useful when the stored
+    entry may already exist.
+
+    Args:
+        path (str): Location of the folder that may grow, e.g. the demo datasets storage.
+    """
+    global tracked_size
+    tracking = tracked_size is not None
+    before = _entry_usage(path)[0] if tracking else 0
+    yield
+    if tracking:
+        tracked_size += _entry_usage(path)[0] - before
+
+
+def _entry_paths() -> List[Tuple[str, str]]:
+    cubes = storage_path(config.cubes_storage)
+    data = storage_path(config.data_storage)
+    demo = storage_path(config.demo_data_storage)
+    artifacts = storage_path(config.artifacts_storage)
+    clutter_prefixes = (config.tmp_prefix, config.test_dset_prefix)
+
+    paths = []
+    storages = [
+        ("cube", cubes),
+        ("dataset", data),
+        ("demo", demo),
+        ("artifact", artifacts),
+    ]
+    for kind, parent in storages:
+        try:
+            with os.scandir(parent) as entries:
+                dirs = [e for e in entries if e.is_dir(follow_symlinks=False)]
+        except OSError:
+            continue
+        for entry in dirs:
+            # Registered datasets are never evicted
+            if kind == "dataset" and not entry.name.startswith(clutter_prefixes):
+                continue
+            # Artifacts being extracted are staged in temporary folders
+            if kind == "artifact" and entry.name.startswith(config.tmp_prefix):
+                continue
+            paths.append((kind, entry.path))
+    return paths
+
+
+def evictable_entries(keep: List[str] = None) -> List[StorageEntry]:
+    """Retrieves the storage entries that may be evicted, least recently used first.
+    This includes cubes, demo datasets, temporary or test datasets and
+    stored artifacts no longer linked by any cube. Registered datasets,
+    entries in use and entries accessed by the current execution are never included.
+
+    Args:
+        keep (List[str], optional): Locations of additional entries to exclude.
+
+    Returns:
+        List[StorageEntry]: evictable entries, sorted by last access
+    """
+    keep = {os.path.abspath(path) for path in keep or []} | accessed_paths
+    entries = []
+    for kind, path in _entry_paths():
+        if os.path.abspath(path) in keep or is_in_use(path):
+            continue
+        size, shared = _entry_usage(path)
+        if kind == "artifact" and shared:
+            continue
+        last_access = os.stat(path).st_mtime
+        entries.append(StorageEntry(kind, path, size, last_access))
+
+    return sorted(entries, key=lambda entry: entry.last_access)
+
+
+def enforce_quota(quota: int = None, keep: List[str] = None) -> List[StorageEntry]:
+    """Evicts the least recently used entries until the medperf storage
+    fits inside the quota.
+
+    Args:
+        quota (int, optional): Maximum storage size in bytes. Defaults to config.storage_quota.
+            Nothing is evicted if no quota is set.
+        keep (List[str], optional): Locations of entries that must not be evicted.
+
+    Returns:
+        List[StorageEntry]: evicted entries
+    """
+    if quota is None:
+        quota = config.storage_quota
+    if quota is None:
+        return []
+
+    global tracked_size
+    total = storage_size()
+    if total <= quota:
+        return []
+
+    logging.info(f"Storage size of {total} bytes exceeds the quota of {quota} bytes")
+    evicted = []
+    # Evicting cubes may unlink stored artifacts, which become evictable
+    # on the next pass
+    pass_evicted = True
+    while total > quota and pass_evicted:
+        pass_evicted = False
+        for entry in evictable_entries(keep):
+            if total <= quota:
+                break
+            logging.info(f"Evicting {entry.kind} at {entry.path}")
+            rmtree(entry.path, ignore_errors=True)
+            total -= entry.size
+            evicted.append(entry)
+            pass_evicted = True
+    tracked_size = total
+
+    if total > quota:
+        logging.warning("Storage quota can't be met by evicting unused entries")
+    return evicted
+
+
+def artifact_path(hash: str) -> str:
+    """Location of an artifact inside the content-addressed store
+
+    Args:
+        hash (str): sha1 hash of the artifact tarball.
+
+    Returns:
+        str: folder containing the extracted artifact
+    """
+    return os.path.join(storage_path(config.artifacts_storage), hash)
+
+
+def has_artifact(hash: str) -> bool:
+    """Checks if an artifact has already been stored
+
+    Args:
+        hash (str): sha1 hash of the artifact tarball. May be empty.
+
+    Returns:
+        bool: Wether the extracted artifact is available locally
+    """
+    return bool(hash) and os.path.isdir(artifact_path(hash))
+
+
+def store_artifact(stream: BinaryIO) -> str:
+    """Extracts a tarball into the content-addressed store while it is
+    being read, e.g. directly from a download. Extraction happens in a
+    staging folder that is renamed once complete, so that partially
+    extracted artifacts are never used.
+
+    Args:
+        stream (BinaryIO): readable stream with the tarball contents.
+
+    Returns:
+        str: sha1 hash of the tarball, which identifies the stored artifact
+    """
+    staging_name = f"{config.tmp_prefix}{os.getpid()}_{id(stream)}"
+    staging = os.path.join(storage_path(config.artifacts_storage), staging_name)
+    os.makedirs(staging, exist_ok=True)
+    reader = HashingReader(stream)
+    try:
+        extract_tar(reader, staging)
+    except BaseException:
+        rmtree(staging, ignore_errors=True)
+        raise
+
+    # Stored files are shared by every cube linking them, so they are
+    # made read-only to prevent a cube from modifying them in place
+    for root, _, files in os.walk(staging):
+        for file in files:
+            file_path = os.path.join(root, file)
+            if not os.path.islink(file_path):
+                os.chmod(file_path, os.stat(file_path).st_mode & ~0o222)
+
+    hash = reader.hexdigest()
+    try:
+        os.rename(staging, artifact_path(hash))
+    except OSError:
+        # The same artifact was already stored, possibly by a concurrent execution
+        rmtree(staging, ignore_errors=True)
+    else:
+        record_added(artifact_path(hash))
+    return hash
+
+
+def link_artifact(hash: str, dest: str):
+    """Makes the contents of a stored artifact available at dest. Files are
+    hardlinked, so that the artifact contents are stored only once, and
+    copied when dest is on a different file system. Symlinks are not used,
+    since they wouldn't resolve inside the cube container.
+
+    Args:
+        hash (str): sha1 hash of the artifact tarball.
+        dest (str): Location where the artifact contents are expected.
+    """
+    src = artifact_path(hash)
+    mark_access(src)
+    for root, _, files in os.walk(src):
+        out_path = os.path.normpath(os.path.join(dest, os.path.relpath(root, src)))
+        os.makedirs(out_path, exist_ok=True)
+        for file in files:
+            src_file = os.path.join(root, file)
+            dest_file = os.path.join(out_path, file)
+            if os.path.lexists(dest_file):
+                os.remove(dest_file)
+            try:
+                os.link(src_file, dest_file)
+            except OSError:
+                copy2(src_file, dest_file)
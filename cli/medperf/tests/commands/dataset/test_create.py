@@ -35,6 +35,7 @@ def preparation(mocker, comms, ui, registration):
         return_value=(OUT_PATH, OUT_DATAPATH),
     )
     mocker.patch(PATCH_DATAPREP.format("Benchmark.get"), return_value=Benchmark())
+    mocker.patch(PATCH_DATAPREP.format("in_use"))
     preparation = DataPreparation(BENCHMARK_UID, DATA_PATH, LABELS_PATH, comms, ui)
     mocker.patch(PATCH_DATAPREP.format("Registration"), return_value=registration)
     mocker.patch(PATCH_DATAPREP.format("Cube.get"), return_value=MockCube(True))
@@ -227,3 +228,19 @@ def test_run_returns_registration_generated_uid(
 
     # Assert
     assert returned_uid == registration.generated_uid
+
+
+@pytest.mark.parametrize("registration", ["uid"], indirect=True)
+def test_run_marks_dataset_in_use_while_preparing(mocker, comms, ui, preparation):
+    # Arrange
+    spy = mocker.patch(PATCH_DATAPREP.format("in_use"))
+    mocker.patch(PATCH_DATAPREP.format("DataPreparation.get_prep_cube"))
+    mocker.patch(PATCH_DATAPREP.format("DataPreparation.run_cube_tasks"))
+    mocker.patch(PATCH_DATAPREP.format("DataPreparation.create_registration"))
+
+    # Act
+    DataPreparation.run("", "", "", comms, ui)
+
+    # Assert
+    spy.assert_called_once_with(OUT_PATH)
+    spy.return_value.__enter__.assert_called_once()
@@ -0,0 +1,44 @@
+import pytest
+
+import medperf.config as config
+from medperf.storage import StorageEntry
+from medperf.commands.storage.gc import StorageGC
+
+PATCH_GC = "medperf.commands.storage.gc.{}"
+
+
+def test_run_does_nothing_without_quota(mocker, ui):
+    # Arrange
+    mocker.patch.object(config, "storage_quota", None)
+    spy = mocker.patch(PATCH_GC.format("enforce_quota"), return_value=[])
+
+    # Act
+    StorageGC.run(ui)
+
+    # Assert
+    spy.assert_not_called()
+
+
+@pytest.mark.parametrize("quota,config_quota,exp_quota", [(1, 2, 1), (None, 2, 2)])
+def test_run_enforces_expected_quota(mocker, ui, quota, config_quota, exp_quota):
+    # Arrange
+    mocker.patch.object(config, "storage_quota", config_quota)
+    spy = mocker.patch(PATCH_GC.format("enforce_quota"), return_value=[])
+
+    # Act
+    StorageGC.run(ui, quota)
+
+    # Assert
+    spy.assert_called_once_with(exp_quota)
+
+
+def test_run_prints_freed_size(mocker, ui):
+    # Arrange
+    evicted = [StorageEntry("cube", "path", 1024, 0)] * 2
+    mocker.patch(PATCH_GC.format("enforce_quota"), return_value=evicted)
+
+    # Act
+    StorageGC.run(ui, 1)
+
+    # Assert
+    ui.print.assert_called_with("Freed: 2.0 KB")
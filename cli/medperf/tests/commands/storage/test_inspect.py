@@ -0,0 +1,60 @@
+import pytest
+
+import medperf.config as config
+from medperf.commands.storage.inspect import StorageInspect
+
+PATCH_INSPECT = "medperf.commands.storage.inspect.{}"
+
+
+@pytest.fixture
+def storage(mocker):
+    entries = {
+        config.cubes_storage: ["1", "2"],
+        config.results_storage: ["1/2/3"],
+    }
+    mocker.patch(
+        PATCH_INSPECT.format("list_dirs"),
+        side_effect=lambda path, depth: entries.get(path.split("/")[-1], []),
+    )
+    mocker.patch(PATCH_INSPECT.format("storage_path"), side_effect=lambda p: "st/" + p)
+    return entries
+
+
+def test_run_looks_for_results_three_levels_deep(mocker, ui, storage):
+    # Arrange
+    mocker.patch(PATCH_INSPECT.format("get_folder_size"), return_value=(0, 0))
+    spy = mocker.patch(PATCH_INSPECT.format("list_dirs"), return_value=[])
+
+    # Act
+    StorageInspect.run(ui)
+
+    # Assert
+    spy.assert_any_call("st/" + config.results_storage, 3)
+    spy.assert_any_call("st/" + config.cubes_storage, 1)
+
+
+def test_run_computes_size_of_every_entry(mocker, ui, storage):
+    # Arrange
+    spy = mocker.patch(PATCH_INSPECT.format("get_folder_size"), return_value=(0, 0))
+    exp_paths = [
+        f"st/{config.cubes_storage}/1",
+        f"st/{config.cubes_storage}/2",
+        f"st/{config.results_storage}/1/2/3",
+    ]
+
+    # Act
+    StorageInspect.run(ui)
+
+    # Assert
+    assert sorted(c.args[0] for c in spy.call_args_list) == sorted(exp_paths)
+
+
+def test_run_prints_total_size(mocker, ui, storage):
+    # Arrange
+    mocker.patch(PATCH_INSPECT.format("get_folder_size"), return_value=(1024, 1))
+
+    # Act
+    StorageInspect.run(ui)
+
+    # Assert
+    ui.print.assert_called_with("Total: 3.0 KB")
@@ -28,6 +28,7 @@ def benchmark(mocker):
 def dataset(mocker):
     dataset = mocker.create_autospec(spec=Dataset)
     dataset.uid = "uid"
+    dataset.dataset_path = "dataset_path"
     return dataset
 
 
@@ -41,6 +42,7 @@ def default_setup(mocker, benchmark, dataset):
     )
     mocker.patch(PATCH_TEST.format("DataPreparation.run"), return_value="")
     mocker.patch(PATCH_TEST.format("Dataset"), return_value=dataset)
+    mocker.patch(PATCH_TEST.format("in_use"))
     return bmk
 
 
@@ -236,6 +238,23 @@ def test_execute_benchmark_runs_benchmark_workflow(
     spy.assert_called_once()
 
 
+def test_execute_benchmark_marks_dataset_in_use(
+    mocker, dataset, default_setup, comms, ui
+):
+    # Arrange
+    mocker.patch(PATCH_TEST.format("BenchmarkExecution.run"))
+    mocker.patch(PATCH_TEST.format("Result.get_results"), return_value=[])
+    spy = mocker.patch(PATCH_TEST.format("in_use"))
+    exec = CompatibilityTestExecution(1, None, None, None, None, comms, ui)
+    exec.dataset = dataset
+
+    # Act
+    exec.execute_benchmark()
+
+    # Assert
+    spy.assert_called_once_with(dataset.dataset_path)
+
+
 def test_run_executes_all_the_expected_steps(mocker, default_setup, comms, ui):
     # Arrange
     validate_spy = mocker.patch(
@@ -347,6 +366,8 @@ def test_download_demo_data_extracts_expected_paths(
     paths_dict = {"data_path": paths[0], "labels_path": paths[1]}
     mocker.patch("yaml.safe_load", return_value=paths_dict)
     mocker.patch(PATCH_TEST.format("untar"), return_value=untar_path)
+    mocker.patch(PATCH_TEST.format("mark_access"))
+    mocker.patch(PATCH_TEST.format("enforce_quota"), return_value=[])
     mocker.patch("builtins.open", mock_open())
     exp_data_path = os.path.join(untar_path, paths[0])
     exp_labels_path = os.path.join(untar_path, paths[1])
@@ -360,3 +381,30 @@ def test_download_demo_data_extracts_expected_paths(
     # Assert
     assert data_path == exp_data_path
     assert labels_path == exp_labels_path
+
+
+def test_download_demo_data_keeps_demo_dataset_when_enforcing_quota(
+    mocker, benchmark, comms, ui
+):
+    # Arrange
+    bmk = benchmark("1", "2", "3", "4")
+    bmk.demo_dataset_url = "url"
+    bmk.demo_dataset_hash = "hash"
+    mocker.patch(PATCH_TEST.format("Benchmark.get"), return_value=bmk)
+    mocker.patch.object(comms, "get_benchmark_demo_dataset", return_value=("", ""))
+    mocker.patch(PATCH_TEST.format("get_file_sha1"), return_value="hash")
+    untar_path = "untar/path"
+    mocker.patch("yaml.safe_load", return_value={"data_path": "", "labels_path": ""})
+    mocker.patch(PATCH_TEST.format("untar"), return_value=untar_path)
+    mocker.patch(PATCH_TEST.format("mark_access"))
+    spy = mocker.patch(PATCH_TEST.format("enforce_quota"), return_value=[])
+    mocker.patch("builtins.open", mock_open())
+
+    exec = CompatibilityTestExecution("1", "1", "2", "3", "4", comms, ui)
+    exec.prepare_test()
+
+    # Act
+    exec.download_demo_data()
+
+    # Assert
+    spy.assert_called_once_with(keep=[untar_path])
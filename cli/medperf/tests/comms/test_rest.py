@@ -1,3 +1,4 @@
+import io
 import os
 import pytest
 import requests
@@ -417,6 +418,34 @@ def test_get_cube_methods_run_get_cube_file(mocker, server, method):
     spy.assert_called_once()
 
 
+def test_stream_cube_additional_requests_streamed_download(mocker, server):
+    # Arrange
+    res = MockResponse({}, 200)
+    res.raw = io.BytesIO(b"tarball")
+    spy = mocker.patch("requests.get", return_value=res)
+
+    # Act
+    stream = server.stream_cube_additional(url)
+
+    # Assert
+    spy.assert_called_once_with(url, stream=True)
+    assert stream.read() == b"tarball"
+
+
+def test_stream_cube_additional_fails_if_download_fails(mocker, server):
+    # Arrange
+    res = MockResponse({}, 404)
+    res.raw = io.BytesIO()
+    mocker.patch("requests.get", return_value=res)
+    spy = mocker.patch(patch_server.format("pretty_error"))
+
+    # Act
+    server.stream_cube_additional(url)
+
+    # Assert
+    spy.assert_called_once()
+
+
 def test_get_user_cubes_calls_auth_get_for_expected_path(mocker, server):
     # Arrange
     cubes = [
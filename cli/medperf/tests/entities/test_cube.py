@@ -1,8 +1,9 @@
 import os
 import pytest
-from unittest.mock import MagicMock, mock_open, ANY
+from unittest.mock import MagicMock, mock_open, call, ANY
 
 import medperf
+from medperf import storage
 from medperf.ui.interface import UI
 import medperf.config as config
 from medperf.comms.interface import Comms
@@ -15,9 +16,9 @@ from medperf.tests.mocks.requests import cube_metadata_generator
 
 PATCH_SERVER = "medperf.entities.benchmark.Comms.{}"
 PATCH_CUBE = "medperf.entities.cube.{}"
+PATCH_STORAGE = "medperf.storage.{}"
 CUBE_PATH = "cube_path"
 PARAMS_PATH = "params_path"
-TARBALL_PATH = "tarball_path"
 TARBALL_HASH = "tarball_hash"
 
 TASK = "task"
@@ -38,13 +39,30 @@ def comms(mocker):
     comms = mocker.create_autospec(spec=Comms)
     mocker.patch.object(comms, "get_cube", return_value=CUBE_PATH)
     mocker.patch.object(comms, "get_cube_params", return_value=PARAMS_PATH)
-    mocker.patch.object(comms, "get_cube_additional", return_value=TARBALL_PATH)
-    mocker.patch(PATCH_CUBE.format("get_file_sha1"), return_value=TARBALL_HASH)
-    mocker.patch(PATCH_CUBE.format("untar"))
+    mocker.patch.object(comms, "stream_cube_additional", return_value=MagicMock())
+    mocker.patch(PATCH_CUBE.format("has_artifact"), return_value=False)
+    mocker.patch(PATCH_CUBE.format("store_artifact"), return_value=TARBALL_HASH)
+    mocker.patch(PATCH_CUBE.format("link_artifact"))
 
     return comms
 
 
+@pytest.fixture(autouse=True)
+def storage_manager(mocker):
+    mocker.patch(PATCH_CUBE.format("mark_access"))
+    mocker.patch(PATCH_CUBE.format("in_use"))
+    mocker.patch(PATCH_CUBE.format("record_added"))
+    return mocker.patch(PATCH_CUBE.format("enforce_quota"), return_value=[])
+
+
+@pytest.fixture
+def log_writer(mocker):
+    writer = MagicMock()
+    writer.__enter__.return_value = writer
+    mocker.patch(PATCH_CUBE.format("ProcLogWriter"), return_value=writer)
+    return writer
+
+
 @pytest.fixture
 def no_local(mocker):
     mocker.patch(PATCH_CUBE.format("Cube.all"), return_value=[])
@@ -172,7 +190,7 @@ def test_get_basic_cube_doesnt_retrieve_parameters(mocker, comms, basic_body, no
 
 def test_get_basic_cube_doesnt_retrieve_tarball(mocker, comms, basic_body, no_local):
     # Arrange
-    spy = mocker.spy(comms, "get_cube_additional")
+    spy = mocker.spy(comms, "stream_cube_additional")
 
     # Act
     uid = 1
@@ -199,7 +217,7 @@ def test_get_cube_with_parameters_retrieves_parameters(
 
 def test_get_cube_with_tarball_retrieves_tarball(mocker, comms, tar_body, no_local):
     # Arrange
-    spy = mocker.spy(comms, "get_cube_additional")
+    spy = mocker.spy(comms, "stream_cube_additional")
 
     # Act
     uid = 1
@@ -207,33 +225,57 @@ def test_get_cube_with_tarball_retrieves_tarball(mocker, comms, tar_body, no_loc
     Cube.get(uid, comms, ui)
 
     # Assert
-    spy.assert_called_once_with(body["tarball_url"], uid)
+    spy.assert_called_once_with(body["tarball_url"])
 
 
-def test_get_cube_with_tarball_generates_tarball_hash(
+def test_get_cube_with_tarball_stores_artifact_while_downloading(
     mocker, comms, tar_body, no_local
 ):
     # Arrange
-    spy = mocker.spy(medperf.entities.cube, "get_file_sha1")
+    stream = MagicMock()
+    stream.__enter__.return_value = stream
+    mocker.patch.object(comms, "stream_cube_additional", return_value=stream)
+    spy = mocker.spy(medperf.entities.cube, "store_artifact")
 
     # Act
     uid = 1
     Cube.get(uid, comms, ui)
 
     # Assert
-    spy.assert_called_once_with(TARBALL_PATH)
+    spy.assert_called_once_with(stream)
+    stream.__exit__.assert_called_once()
 
 
-def test_get_cube_with_tarball_untars_files(mocker, comms, tar_body, no_local):
+def test_get_cube_with_tarball_links_artifact(mocker, comms, tar_body, no_local):
     # Arrange
-    spy = mocker.spy(medperf.entities.cube, "untar")
+    mocker.patch.object(comms, "get_cube", return_value="cubes/1/mlcube.yaml")
+    spy = mocker.spy(medperf.entities.cube, "link_artifact")
+    exp_path = os.path.join("cubes/1", config.additional_path)
 
     # Act
     uid = 1
     Cube.get(uid, comms, ui)
 
     # Assert
-    spy.assert_called_once_with(TARBALL_PATH)
+    spy.assert_called_once_with(TARBALL_HASH, exp_path)
+
+
+def test_get_cube_with_stored_artifact_doesnt_retrieve_tarball(
+    mocker, comms, tar_body, no_local
+):
+    # Arrange
+    mocker.patch(PATCH_CUBE.format("has_artifact"), return_value=True)
+    spy = mocker.spy(comms, "stream_cube_additional")
+    store_spy = mocker.spy(medperf.entities.cube, "store_artifact")
+
+    # Act
+    uid = 1
+    cube = Cube.get(uid, comms, ui)
+
+    # Assert
+    spy.assert_not_called()
+    store_spy.assert_not_called()
+    assert cube.is_valid()
 
 
 def test_get_cube_calls_all(mocker, comms, basic_body):
@@ -282,6 +324,63 @@ def test_get_cube_requests_server_if_not_local(mocker, comms, basic_body, local_
     metadata_spy.assert_called_once()
 
 
+def test_get_cube_marks_retrieved_cube_before_enforcing_quota(
+    mocker, comms, basic_body, no_local, storage_manager
+):
+    # Arrange
+    mocker.patch.object(comms, "get_cube", return_value="cubes/1/mlcube.yaml")
+    manager = MagicMock()
+    manager.attach_mock(storage_manager, "enforce_quota")
+    manager.attach_mock(mocker.patch(PATCH_CUBE.format("mark_access")), "mark_access")
+
+    # Act
+    Cube.get(1, comms, ui)
+
+    # Assert
+    assert manager.mock_calls == [call.mark_access("cubes/1"), call.enforce_quota()]
+
+
+def test_get_cube_doesnt_evict_cubes_retrieved_by_same_execution(
+    mocker, comms, basic_body, no_local
+):
+    # Arrange
+    cubes = storage_path(config.cubes_storage)
+    retrieved = []
+
+    def get_cube(url, uid):
+        retrieved.append(os.path.join(cubes, str(uid)))
+        return os.path.join(cubes, str(uid), config.cube_filename)
+
+    mocker.patch.object(comms, "get_cube", side_effect=get_cube)
+    mocker.patch(PATCH_CUBE.format("mark_access"), side_effect=storage.mark_access)
+    mocker.patch(PATCH_CUBE.format("enforce_quota"), side_effect=storage.enforce_quota)
+    mocker.patch(PATCH_CUBE.format("record_added"), side_effect=storage.record_added)
+    mocker.patch.object(storage, "accessed_paths", set())
+    mocker.patch.object(config, "storage_quota", 1500000)
+    mocker.patch("os.utime")
+    mocker.patch(
+        PATCH_STORAGE.format("_entry_paths"),
+        side_effect=lambda: [("cube", path) for path in retrieved],
+    )
+    mocker.patch(
+        PATCH_STORAGE.format("get_folder_size"),
+        side_effect=lambda path: (1000000 * len(retrieved), 0),
+    )
+    mocker.patch.object(storage, "tracked_size", None)
+    mocker.patch(PATCH_STORAGE.format("_entry_usage"), return_value=(1000000, False))
+    mocker.patch(PATCH_STORAGE.format("is_in_use"), return_value=False)
+    spy = mocker.patch(PATCH_STORAGE.format("rmtree"))
+
+    # Act
+    Cube.get(1, comms, ui)
+    Cube.get(2, comms, ui)
+
+    # Assert
+    spy.assert_not_called()
+    assert {os.path.abspath(path) for path in retrieved} <= storage.accessed_paths
+    assert storage.tracked_size == 2000000
+
+
 def test_cube_is_valid_if_no_tarball(mocker, comms, basic_body, no_local):
     # Act
     uid = 1
@@ -302,7 +401,7 @@ def test_cube_is_valid_with_correct_hash(mocker, comms, tar_body, no_local):
 
 def test_cube_is_invalid_with_incorrect_hash(mocker, comms, tar_body, no_local):
     # Arrange
-    mocker.patch(PATCH_CUBE.format("get_file_sha1"), return_value="incorrect_hash")
+    mocker.patch(PATCH_CUBE.format("store_artifact"), return_value="incorrect_hash")
 
     # Act
     uid = 1
@@ -312,7 +411,7 @@ def test_cube_is_invalid_with_incorrect_hash(mocker, comms, tar_body, no_local):
     assert not cube.is_valid()
 
 
-def test_cube_runs_command_with_pexpect(mocker, ui, comms, basic_body, no_local):
+def test_cube_runs_command_with_pexpect(mocker, ui, comms, basic_body, no_local, log_writer):
     # Arrange
     mpexpect = MockPexpect(0)
     mocker.patch(PATCH_CUBE.format("pexpect.spawn"), side_effect=mpexpect.spawn)
@@ -330,7 +429,7 @@ def test_cube_runs_command_with_pexpect(mocker, ui, comms, basic_body, no_local)
     spy.assert_called_once_with(expected_cmd, timeout=None)
 
 
-def test_cube_runs_command_with_extra_args(mocker, ui, comms, basic_body, no_local):
+def test_cube_runs_command_with_extra_args(mocker, ui, comms, basic_body, no_local, log_writer):
     # Arrange
     mpexpect = MockPexpect(0)
     spy = mocker.patch("pexpect.spawn", side_effect=mpexpect.spawn)
@@ -347,7 +446,7 @@ def test_cube_runs_command_with_extra_args(mocker, ui, comms, basic_body, no_loc
     spy.assert_called_once_with(expected_cmd, timeout=None)
 
 
-def test_run_stops_execution_if_child_fails(mocker, ui, comms, basic_body, no_local):
+def test_run_stops_execution_if_child_fails(mocker, ui, comms, basic_body, no_local, log_writer):
     # Arrange
     mpexpect = MockPexpect(1)
     mocker.patch("pexpect.spawn", side_effect=mpexpect.spawn)
@@ -366,6 +465,81 @@ def test_run_stops_execution_if_child_fails(mocker, ui, comms, basic_body, no_lo
     spy.assert_called_once()
 
 
+def test_run_writes_output_to_cube_log(
+    mocker, ui, comms, basic_body, no_local, log_writer
+):
+    # Arrange
+    mpexpect = MockPexpect(0, [b"line 1\n", b"line 2\n"])
+    mocker.patch("pexpect.spawn", side_effect=mpexpect.spawn)
+    mocker.patch(PATCH_CUBE.format("list_files"), return_value="")
+    mocker.patch(PATCH_CUBE.format("proc_log_path"), return_value="log_path")
+    spy = mocker.patch(PATCH_CUBE.format("ProcLogWriter"), return_value=log_writer)
+
+    # Act
+    cube = Cube.get(1, comms, ui)
+    cube.run(ui, "task")
+
+    # Assert
+    spy.assert_called_once_with("log_path")
+    log_writer.write.assert_has_calls([call("line 1\n"), call("line 2\n")])
+    log_writer.__exit__.assert_called_once()
+
+
+@pytest.mark.parametrize("debug", [True, False])
+def test_run_lists_storage_only_on_debug(
+    mocker, ui, comms, basic_body, no_local, log_writer, debug
+):
+    # Arrange
+    mpexpect = MockPexpect(0)
+    mocker.patch("pexpect.spawn", side_effect=mpexpect.spawn)
+    mocker.patch("logging.Logger.isEnabledFor", return_value=debug)
+    spy = mocker.patch(PATCH_CUBE.format("list_files"), return_value="")
+
+    # Act
+    cube = Cube.get(1, comms, ui)
+    cube.run(ui, "task")
+
+    # Assert
+    assert spy.called == debug
+
+
+def test_run_marks_cube_in_use(mocker, ui, comms, basic_body, no_local, log_writer):
+    # Arrange
+    mpexpect = MockPexpect(0)
+    mocker.patch("pexpect.spawn", side_effect=mpexpect.spawn)
+    mocker.patch(PATCH_CUBE.format("list_files"), return_value="")
+    spy = mocker.patch(PATCH_CUBE.format("in_use"))
+    mocker.patch.object(comms, "get_cube", return_value="cubes/1/mlcube.yaml")
+
+    # Act
+    cube = Cube.get(1, comms, ui)
+    cube.run(ui, "task")
+
+    # Assert
+    spy.assert_called_once_with("cubes/1")
+    spy.return_value.__enter__.assert_called_once()
+
+
+def test_run_reports_log_path_if_child_fails(
+    mocker, ui, comms, basic_body, no_local, log_writer
+):
+    # Arrange
+    mpexpect = MockPexpect(1)
+    mocker.patch("pexpect.spawn", side_effect=mpexpect.spawn)
+    mocker.patch(PATCH_CUBE.format("proc_log_path"), return_value="log_path")
+    spy = mocker.patch(
+        PATCH_CUBE.format("pretty_error"), side_effect=lambda *args, **kwargs: exit()
+    )
+
+    # Act
+    cube = Cube.get(1, comms, ui)
+    with pytest.raises(SystemExit):
+        cube.run(ui, "task")
+
+    # Assert
+    assert "log_path" in spy.call_args.args[0]
+
+
 def test_default_output_reads_cube_manifest(mocker, comms, basic_body, no_local):
     # Arrange
     cube_contents = {"tasks": {TASK: {"parameters": {"outputs": {OUT_KEY: VALUE}}}}}
@@ -1,18 +1,37 @@
+import pexpect
+
+
 class MockChild:
-    def __init__(self, exitstatus):
+    def __init__(self, exitstatus, chunks=None):
+        """Mocks a pexpect child
+
+        Args:
+            exitstatus (int): exit status of the child
+            chunks (list, optional): outputs returned by successive reads. A pexpect.TIMEOUT
+                entry simulates a read without available output. Defaults to no output.
+        """
         self.exitstatus = exitstatus
+        self.chunks = list(chunks or [])
 
     def isalive(self):
         return False
 
+    def read_nonblocking(self, size=1, timeout=-1):
+        if not self.chunks:
+            raise pexpect.EOF("End of output")
+        chunk = self.chunks.pop(0)
+        if chunk is pexpect.TIMEOUT:
+            raise pexpect.TIMEOUT("No output")
+        return chunk
+
     def close(self):
         pass
 
 
 class MockPexpect:
-    def __init__(self, exitstatus):
+    def __init__(self, exitstatus, chunks=None):
         self.exitstatus = exitstatus
+        self.chunks = chunks
 
     def spawn(self, command: str, timeout: int = 30) -> MockChild:
-        return MockChild(self.exitstatus)
-
+        return MockChild(self.exitstatus, self.chunks)
@@ -0,0 +1,57 @@
+import os
+from types import SimpleNamespace
+
+
+class MockDirEntry:
+    def __init__(self, path, content):
+        """Mocks an os.DirEntry
+
+        Args:
+            path (str): path of the entry
+            content (dict or int): folder contents, or file size
+        """
+        self.path = path
+        self.name = os.path.basename(path)
+        self.content = content
+
+    def is_dir(self, follow_symlinks=True):
+        return isinstance(self.content, dict)
+
+    def stat(self, follow_symlinks=True):
+        return SimpleNamespace(
+            st_size=self.content, st_nlink=1, st_dev=0, st_ino=id(self)
+        )
+
+
+class MockScandirIterator(list):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class MockScandir:
+    def __init__(self, root, tree):
+        """Mocks os.scandir over an in-memory tree
+
+        Args:
+            root (str): path of the tree root
+            tree (dict): nested dictionaries of folders, with file sizes as leaves
+        """
+        self.root = root
+        self.tree = tree
+
+    def scandir(self, path):
+        content = self.tree
+        relpath = os.path.relpath(path, self.root)
+        if relpath != ".":
+            for name in relpath.split(os.sep):
+                if not isinstance(content, dict) or name not in content:
+                    raise FileNotFoundError(path)
+                content = content[name]
+        entries = [
+            MockDirEntry(os.path.join(path, name), value)
+            for name, value in content.items()
+        ]
+        return MockScandirIterator(entries)
@@ -0,0 +1,385 @@
+import io
+import os
+import pytest
+import hashlib
+import tarfile
+from unittest.mock import MagicMock, call
+
+import medperf.config as config
+from medperf import storage
+from medperf.storage import StorageEntry
+from medperf.utils import storage_path
+from medperf.tests.mocks.scandir import MockScandir
+
+PATCH_STORAGE = "medperf.storage.{}"
+
+
+@pytest.fixture
+def entries(mocker):
+    tree = {
+        config.cubes_storage: {"1": {}, "2": {}},
+        config.data_storage: {
+            "registered": {},
+            config.tmp_prefix + "a": {},
+            config.test_dset_prefix + "b": {},
+        },
+        config.demo_data_storage: {"hash": {}},
+        config.results_storage: {"1": {}},
+    }
+    mocker.patch("os.scandir", side_effect=MockScandir(config.storage, tree).scandir)
+    mocker.patch(PATCH_STORAGE.format("is_in_use"), return_value=False)
+    mocker.patch(PATCH_STORAGE.format("_entry_usage"), return_value=(10, False))
+    mocker.patch.object(storage, "accessed_paths", set())
+    mtimes = {}
+
+    def stat(path):
+        return MagicMock(st_mtime=mtimes.get(os.path.basename(path), 0))
+
+    mocker.patch("os.stat", side_effect=stat)
+    return mtimes
+
+
+def test_evictable_entries_excludes_registered_datasets_and_results(entries):
+    # Arrange
+    exp_paths = [
+        os.path.join(storage_path(config.cubes_storage), "1"),
+        os.path.join(storage_path(config.cubes_storage), "2"),
+        os.path.join(storage_path(config.data_storage), config.tmp_prefix + "a"),
+        os.path.join(storage_path(config.data_storage), config.test_dset_prefix + "b"),
+        os.path.join(storage_path(config.demo_data_storage), "hash"),
+    ]
+
+    # Act
+    evictable = storage.evictable_entries()
+
+    # Assert
+    assert sorted(entry.path for entry in evictable) == sorted(exp_paths)
+
+
+def test_evictable_entries_sorts_by_last_access(entries):
+    # Arrange
+    entries.update({"1": 30, "2": 10, "hash": 20})
+
+    # Act
+    evictable = storage.evictable_entries()
+
+    # Assert
+    names = [os.path.basename(entry.path) for entry in evictable]
+    assert names[-3:] == ["2", "hash", "1"]
+
+
+def test_evictable_entries_excludes_entries_in_use(mocker, entries):
+    # Arrange
+    mocker.patch(
+        PATCH_STORAGE.format("is_in_use"), side_effect=lambda path: path.endswith("1")
+    )
+
+    # Act
+    evictable = storage.evictable_entries()
+
+    # Assert
+    assert all(not entry.path.endswith("1") for entry in evictable)
+
+
+def test_evictable_entries_excludes_kept_and_accessed_entries(mocker, entries):
+    # Arrange
+    cubes = storage_path(config.cubes_storage)
+    mocker.patch.object(storage, "accessed_paths", {os.path.join(cubes, "2")})
+
+    # Act
+    evictable = storage.evictable_entries(keep=[os.path.join(cubes, "1")])
+
+    # Assert
+    assert all(os.path.dirname(entry.path) != cubes for entry in evictable)
+
+
+@pytest.fixture(autouse=True)
+def tracked_size(mocker):
+    mocker.patch.object(storage, "tracked_size", None)
+
+
+@pytest.fixture
+def evictable(mocker):
+    entries = [StorageEntry("cube", f"cube{i}", 10, i) for i in range(5)]
+    mocker.patch(PATCH_STORAGE.format("evictable_entries"), return_value=entries)
+    return entries
+
+
+def test_enforce_quota_does_nothing_without_quota(mocker, evictable):
+    # Arrange
+    mocker.patch.object(config, "storage_quota", None)
+    spy = mocker.patch(PATCH_STORAGE.format("get_folder_size"))
+
+    # Act
+    evicted = storage.enforce_quota()
+
+    # Assert
+    assert evicted == []
+    spy.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "total,quota,exp_evicted", [(50, 50, 0), (50, 35, 2), (50, 0, 5)]
+)
+def test_enforce_quota_evicts_least_recently_used_first(
+    mocker, evictable, total, quota, exp_evicted
+):
+    # Arrange
+    mocker.patch(PATCH_STORAGE.format("get_folder_size"), return_value=(total, 0))
+    spy = mocker.patch(PATCH_STORAGE.format("rmtree"))
+
+    # Act
+    evicted = storage.enforce_quota(quota)
+
+    # Assert
+    assert evicted == evictable[:exp_evicted]
+    assert spy.call_count == exp_evicted
+
+
+@pytest.mark.parametrize(
+    "pids,alive,exp_in_use",
+    [([], True, False), ([1], False, False), ([1, 2], True, True)],
+)
+def test_is_in_use_checks_marker_processes(mocker, pids, alive, exp_in_use):
+    # Arrange
+    tree = {f"{config.in_use_prefix}{pid}": 0 for pid in pids}
+    tree["mlcube.yaml"] = 0
+    mocker.patch("os.scandir", side_effect=MockScandir("cube", tree).scandir)
+    mocker.patch(PATCH_STORAGE.format("_pid_alive"), return_value=alive)
+
+    # Act
+    in_use = storage.is_in_use("cube")
+
+    # Assert
+    assert in_use == exp_in_use
+
+
+def test_mark_access_records_accessed_path(mocker):
+    # Arrange
+    mocker.patch.object(storage, "accessed_paths", set())
+    spy = mocker.patch("os.utime")
+
+    # Act
+    storage.mark_access("cube")
+
+    # Assert
+    spy.assert_called_once_with("cube")
+    assert os.path.abspath("cube") in storage.accessed_paths
+
+
+def test_evictable_entries_excludes_linked_and_staged_artifacts(mocker, entries):
+    # Arrange
+    tree = {
+        config.artifacts_storage: {
+            "linked": {},
+            "unlinked": {},
+            config.tmp_prefix + "staging": {},
+        }
+    }
+    mocker.patch("os.scandir", side_effect=MockScandir(config.storage, tree).scandir)
+    mocker.patch(
+        PATCH_STORAGE.format("_entry_usage"),
+        side_effect=lambda p: (10, p.endswith("/linked")),
+    )
+
+    # Act
+    evictable = storage.evictable_entries()
+
+    # Assert
+    assert [os.path.basename(entry.path) for entry in evictable] == ["unlinked"]
+
+
+@pytest.fixture
+def staging(mocker):
+    mocker.patch("os.makedirs")
+    mocker.patch("os.walk", return_value=[])
+    spy = mocker.patch(PATCH_STORAGE.format("extract_tar"))
+    return spy
+
+
+def test_store_artifact_extracts_in_staging_folder(mocker, staging):
+    # Arrange
+    stream = io.BytesIO(b"tarball")
+    spy = mocker.patch("os.rename")
+    exp_hash = hashlib.sha1(b"tarball").hexdigest()
+
+    def extract_tar(reader, path):
+        reader.read()
+
+    staging.side_effect = extract_tar
+
+    # Act
+    hash = storage.store_artifact(stream)
+
+    # Assert
+    staging_path = staging.call_args.args[1]
+    assert hash == exp_hash
+    assert os.path.basename(staging_path).startswith(config.tmp_prefix)
+    spy.assert_called_once_with(staging_path, storage.artifact_path(exp_hash))
+
+
+def test_store_artifact_discards_already_stored_artifact(mocker, staging):
+    # Arrange
+    mocker.patch("os.rename", side_effect=OSError)
+    spy = mocker.patch(PATCH_STORAGE.format("rmtree"))
+
+    # Act
+    storage.store_artifact(io.BytesIO(b""))
+
+    # Assert
+    spy.assert_called_once_with(staging.call_args.args[1], ignore_errors=True)
+
+
+def test_store_artifact_removes_staging_folder_on_failure(mocker, staging):
+    # Arrange
+    staging.side_effect = tarfile.ReadError
+    rename_spy = mocker.patch("os.rename")
+    spy = mocker.patch(PATCH_STORAGE.format("rmtree"))
+
+    # Act
+    with pytest.raises(tarfile.ReadError):
+        storage.store_artifact(io.BytesIO(b""))
+
+    # Assert
+    spy.assert_called_once_with(staging.call_args.args[1], ignore_errors=True)
+    rename_spy.assert_not_called()
+
+
+@pytest.mark.parametrize("can_link", [True, False])
+def test_link_artifact_links_or_copies_every_file(mocker, can_link):
+    # Arrange
+    src = storage.artifact_path("hash")
+    walk = [(src, ["sub"], ["a"]), (os.path.join(src, "sub"), [], ["b"])]
+    mocker.patch("os.walk", return_value=walk)
+    mocker.patch("os.makedirs")
+    mocker.patch("os.path.lexists", return_value=False)
+    mocker.patch(PATCH_STORAGE.format("mark_access"))
+    link_spy = mocker.patch("os.link", side_effect=None if can_link else OSError)
+    copy_spy = mocker.patch(PATCH_STORAGE.format("copy2"))
+    exp_calls = [
+        call(os.path.join(src, "a"), os.path.join("dest", "a")),
+        call(os.path.join(src, "sub", "b"), os.path.join("dest", "sub", "b")),
+    ]
+
+    # Act
+    storage.link_artifact("hash", "dest")
+
+    # Assert
+    link_spy.assert_has_calls(exp_calls)
+    if can_link:
+        copy_spy.assert_not_called()
+    else:
+        copy_spy.assert_has_calls(exp_calls)
+
+
+def test_store_artifact_makes_files_read_only(mocker, staging):
+    # Arrange
+    mocker.patch("os.rename")
+    mocker.patch("os.walk", return_value=[("staging", [], ["weights"])])
+    mocker.patch("os.path.islink", return_value=False)
+    mocker.patch("os.stat", return_value=MagicMock(st_mode=0o100664))
+    spy = mocker.patch("os.chmod")
+
+    # Act
+    storage.store_artifact(io.BytesIO(b""))
+
+    # Assert
+    spy.assert_called_once_with(os.path.join("staging", "weights"), 0o100444)
+
+
+@pytest.mark.parametrize(
+    "files,exp_size,exp_shared",
+    [
+        # (inode, links to the inode, size) of every file inside the entry
+        ([(1, 1, 10), (2, 1, 20)], 30, False),
+        ([(1, 2, 10), (2, 1, 20)], 20, True),
+        ([(1, 2, 10), (1, 2, 10), (2, 1, 20)], 30, False),
+        ([(1, 3, 10), (1, 3, 10)], 0, True),
+    ],
+)
+def test_entry_usage_ignores_files_linked_from_outside(
+    mocker, files, exp_size, exp_shared
+):
+    # Arrange
+    names = [str(i) for i in range(len(files))]
+    stats = {
+        os.path.join("entry", name): MagicMock(
+            st_dev=0, st_ino=ino, st_nlink=nlink, st_size=size
+        )
+        for name, (ino, nlink, size) in zip(names, files)
+    }
+    mocker.patch("os.walk", return_value=[("entry", [], names)])
+    real_stat = os.stat
+    mocker.patch(
+        "os.stat",
+        side_effect=lambda p, **kwargs: stats[p] if p in stats else real_stat(p),
+    )
+
+    # Act
+    size, shared = storage._entry_usage("entry")
+
+    # Assert
+    assert size == exp_size
+    assert shared == exp_shared
+
+
+def test_enforce_quota_evicts_artifacts_unlinked_by_evicted_cubes(mocker):
+    # Arrange
+    cube = StorageEntry("cube", "cube", 0, 0)
+    artifact = StorageEntry("artifact", "artifact", 10, 0)
+    mocker.patch(
+        PATCH_STORAGE.format("evictable_entries"), side_effect=[[cube], [artifact]]
+    )
+    mocker.patch(PATCH_STORAGE.format("get_folder_size"), return_value=(10, 0))
+    mocker.patch(PATCH_STORAGE.format("rmtree"))
+
+    # Act
+    evicted = storage.enforce_quota(5)
+
+    # Assert
+    assert evicted == [cube, artifact]
+
+
+def test_enforce_quota_walks_storage_once_per_execution(mocker, evictable):
+    # Arrange
+    spy = mocker.patch(PATCH_STORAGE.format("get_folder_size"), return_value=(50, 0))
+    mocker.patch(PATCH_STORAGE.format("rmtree"))
+
+    # Act
+    storage.enforce_quota(100)
+    storage.enforce_quota(35)
+    evicted = storage.enforce_quota(35)
+
+    # Assert
+    spy.assert_called_once()
+    assert len(evicted) == 0
+    assert storage.tracked_size == 30
+
+
+@pytest.mark.parametrize("tracked,exp_size", [(None, None), (50, 60)])
+def test_record_added_updates_tracked_size(mocker, tracked, exp_size):
+    # Arrange
+    mocker.patch.object(storage, "tracked_size", tracked)
+    mocker.patch(PATCH_STORAGE.format("_entry_usage"), return_value=(10, False))
+
+    # Act
+    storage.record_added("entry")
+
+    # Assert
+    assert storage.tracked_size == exp_size
+
+
+@pytest.mark.parametrize("tracked,exp_size", [(None, None), (50, 65)])
+def test_record_growth_adds_stored_size(mocker, tracked, exp_size):
+    # Arrange
+    mocker.patch.object(storage, "tracked_size", tracked)
+    mocker.patch(
+        PATCH_STORAGE.format("_entry_usage"), side_effect=[(10, False), (25, False)]
+    )
+
+    # Act
+    with storage.record_growth("demo"):
+        pass
+
+    # Assert
+    assert storage.tracked_size == exp_size
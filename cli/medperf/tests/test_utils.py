@@ -1,16 +1,22 @@
+import io
 import os
 import pytest
+import hashlib
+import tarfile
 import random
+import pexpect
 import time_machine
 import datetime as dt
 from pathlib import Path
-from unittest.mock import mock_open, call, ANY
+from unittest.mock import MagicMock, PropertyMock, mock_open, call, ANY
 
 from medperf import utils
 from medperf.ui.interface import UI
 import medperf.config as config
 from medperf.tests.utils import rand_l
-from medperf.tests.mocks import MockCube, MockTar
+from medperf.tests.mocks import MockCube
+from medperf.tests.mocks.pexpect import MockChild
+from medperf.tests.mocks.scandir import MockScandir
 
 
 parent = config.storage
@@ -251,24 +257,23 @@ def test_cube_validity_fails_when_invalid(mocker, ui, is_valid):
 @pytest.mark.parametrize("file", ["test.tar.bz", "path/to/file.tar.bz"])
 def test_untar_opens_specified_file(mocker, file):
     # Arrange
-    spy = mocker.patch("tarfile.open")
-    mocker.patch("tarfile.TarFile.extractall")
-    mocker.patch("tarfile.TarFile.close")
+    spy = mocker.patch("builtins.open", mock_open())
+    mocker.patch(patch_utils.format("extract_tar"))
     mocker.patch("os.remove")
 
     # Act
     utils.untar(file)
 
     # Assert
-    spy.assert_called_once_with(file)
+    spy.assert_called_once_with(file, "rb")
 
 
 @pytest.mark.parametrize("file", ["./test.tar.bz", "path/to/file.tar.bz"])
 def test_untar_extracts_to_parent_directory(mocker, file):
     # Arrange
     parent_path = str(Path(file).parent)
-    mocker.patch("tarfile.open", return_value=MockTar())
-    spy = mocker.spy(MockTar, "extractall")
+    mocker.patch("builtins.open", mock_open())
+    spy = mocker.patch(patch_utils.format("extract_tar"))
     mocker.patch("os.remove")
 
     # Act
@@ -281,9 +286,8 @@ def test_untar_extracts_to_parent_directory(mocker, file):
 @pytest.mark.parametrize("file", ["./test.tar.bz", "path/to/file.tar.bz"])
 def test_untar_removes_tarfile(mocker, file):
     # Arrange
-    mocker.patch("tarfile.open")
-    mocker.patch("tarfile.TarFile.extractall")
-    mocker.patch("tarfile.TarFile.close")
+    mocker.patch("builtins.open", mock_open())
+    mocker.patch(patch_utils.format("extract_tar"))
     spy = mocker.patch("os.remove")
 
     # Act
@@ -293,6 +297,124 @@ def test_untar_removes_tarfile(mocker, file):
     spy.assert_called_once_with(file)
 
 
+def tar_member(name, type=tarfile.REGTYPE, linkname=""):
+    member = tarfile.TarInfo(name)
+    member.type = type
+    member.linkname = linkname
+    return member
+
+
+@pytest.mark.parametrize(
+    "member,exp_safe",
+    [
+        (tar_member("model/weights.pt"), True),
+        (tar_member("./model/weights.pt"), True),
+        (tar_member("model/._weights.pt"), False),
+        (tar_member("._model", tarfile.DIRTYPE), False),
+        (tar_member("../weights.pt"), False),
+        (tar_member("/etc/passwd"), False),
+        (tar_member("model/link", tarfile.SYMTYPE, "weights.pt"), True),
+        (tar_member("model/link", tarfile.SYMTYPE, "../../etc/passwd"), False),
+        (tar_member("model/link", tarfile.LNKTYPE, "model/weights.pt"), True),
+        (tar_member("model/link", tarfile.LNKTYPE, "/etc/passwd"), False),
+        (tar_member("dev", tarfile.CHRTYPE), False),
+    ],
+)
+def test_is_safe_member_detects_unsafe_members(member, exp_safe):
+    # Act
+    safe = utils.is_safe_member(member, "/path/to/extraction")
+
+    # Assert
+    assert safe == exp_safe
+
+
+def test_extract_tar_extracts_only_safe_members(mocker):
+    # Arrange
+    names = ["a", "._a", "../b", "sub/c"]
+    members = [tar_member(name) for name in names]
+    tar = MagicMock()
+    tar.__enter__.return_value = tar
+    tar.__iter__.return_value = iter(members)
+    mocker.patch("tarfile.open", return_value=tar)
+
+    # Act
+    utils.extract_tar(io.BytesIO(b"tar contents"), "path")
+
+    # Assert
+    extracted = [c.args[0].name for c in tar.extract.call_args_list]
+    assert extracted == ["a", "sub/c"]
+
+
+@pytest.mark.parametrize("content", [b"", b"tar contents" * 1000])
+def test_extract_tar_reads_whole_stream(mocker, content):
+    # Arrange
+    tar = MagicMock()
+    tar.__enter__.return_value = tar
+    tar.__iter__.return_value = iter([])
+    mocker.patch("tarfile.open", return_value=tar)
+    stream = io.BytesIO(content)
+
+    # Act
+    utils.extract_tar(stream, "path")
+
+    # Assert
+    assert stream.read() == b""
+
+
+def test_extract_tar_uses_python_if_no_gunzip_tool(mocker):
+    # Arrange
+    mocker.patch(patch_utils.format("which"), return_value=None)
+    spy = mocker.patch("tarfile.open")
+    popen_spy = mocker.patch("subprocess.Popen")
+    stream = io.BytesIO(b"\x1f\x8bgzipped")
+
+    # Act
+    utils.extract_tar(stream, "path")
+
+    # Assert
+    spy.assert_called_once_with(fileobj=ANY, mode="r|*")
+    popen_spy.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "installed,exp_cmd",
+    [
+        ([], None),
+        (["igzip"], ["/bin/igzip", "-d", "-c"]),
+        (["pigz", "igzip"], ["/bin/pigz", "-d", "-c"]),
+    ],
+)
+def test_gunzip_command_prefers_configured_order(mocker, installed, exp_cmd):
+    # Arrange
+    mocker.patch(
+        patch_utils.format("which"),
+        side_effect=lambda tool: f"/bin/{tool}" if tool in installed else None,
+    )
+    mocker.patch.object(config, "parallel_gunzip_tools", ["pigz", "igzip"])
+
+    # Act
+    cmd = utils.gunzip_command()
+
+    # Assert
+    assert cmd == exp_cmd
+
+
+@pytest.mark.parametrize("read_size", [1, 7, 1024])
+def test_hashing_reader_computes_sha1_of_read_data(read_size):
+    # Arrange
+    content = b"some tarball contents" * 10
+    reader = utils.HashingReader(io.BytesIO(content))
+
+    # Act
+    data = b""
+    for chunk in iter(lambda: reader.read(read_size), b""):
+        data += chunk
+
+    # Assert
+    assert data == content
+    assert reader.hexdigest() == hashlib.sha1(content).hexdigest()
+
+
 def test_approval_prompt_asks_for_user_input(mocker, ui):
     # Arrange
     spy = mocker.patch.object(ui, "prompt", return_value="y")
@@ -409,3 +531,249 @@ def test__results_path_returns_expected_path(bmark_uid, model_uid, generated_uid
 
     # Assert
     assert path == expected_path
+
+
+@pytest.mark.parametrize(
+    "chunks,exp_out",
+    [
+        ([b"line 1\r\nline 2\r\n"], "line 1\r\nline 2\r\n"),
+        ([b"li", b"ne 1\r", b"\nline", b" 2"], "line 1\r\nline 2"),
+        ([b"10%\r", pexpect.TIMEOUT, b"100%\r\n"], "10%\r100%\r\n"),
+    ],
+)
+def test_combine_proc_sp_text_captures_split_chunks(mocker, ui, chunks, exp_out):
+    # Arrange
+    proc = MockChild(0, chunks)
+
+    # Act
+    out = utils.combine_proc_sp_text(proc, ui)
+
+    # Assert
+    assert out == exp_out
+
+
+@pytest.mark.parametrize("max_lines", [1, 3, 10])
+def test_combine_proc_sp_text_keeps_last_lines(mocker, ui, max_lines):
+    # Arrange
+    lines = [f"line {i}\n" for i in range(20)]
+    proc = MockChild(0, [line.encode() for line in lines])
+
+    # Act
+    out = utils.combine_proc_sp_text(proc, ui, max_lines=max_lines)
+
+    # Assert
+    assert out == "".join(lines[-max_lines:])
+
+
+def test_combine_proc_sp_text_writes_every_line_to_sink(mocker, ui):
+    # Arrange
+    lines = [f"line {i}\n" for i in range(20)]
+    proc = MockChild(0, [line.encode() for line in lines])
+    sink = io.StringIO()
+
+    # Act
+    utils.combine_proc_sp_text(proc, ui, sink=sink, max_lines=1)
+
+    # Assert
+    assert sink.getvalue() == "".join(lines)
+
+
+def test_combine_proc_sp_text_flushes_long_partial_lines(mocker, ui):
+    # Arrange
+    mocker.patch(patch_utils.format("config.proc_output_max_line_size"), 4)
+    proc = MockChild(0, [b"ab", b"cd", b"efgh", b"ij\n"])
+    sink = MagicMock()
+
+    # Act
+    out = utils.combine_proc_sp_text(proc, ui, sink=sink)
+
+    # Assert
+    writes = [c.args[0] for c in sink.write.call_args_list]
+    assert "abcd" in writes
+    assert "efgh" in writes
+    assert "".join(writes) == "abcdefghij\n"
+    assert out == "abcdefghij\n"
+
+
+def test_combine_proc_sp_text_rate_limits_spinner_updates(mocker):
+    # Arrange
+    ui = MagicMock(text="")
+    setter = PropertyMock()
+    type(ui).text = setter
+    mocker.patch(patch_utils.format("time.monotonic"), return_value=10)
+    proc = MockChild(0, [f"line {i}\n".encode() for i in range(20)])
+
+    # Act
+    utils.combine_proc_sp_text(proc, ui, refresh_interval=1)
+
+    # Assert
+    # one update for the first chunk, and a final one at the end of the output
+    assert len([c for c in setter.call_args_list if c.args]) == 2
+    assert "line 19" in setter.call_args_list[-1].args[0]
+
+
+def test_proc_log_writer_writes_text_in_background(mocker):
+    # Arrange
+    mocker.patch(patch_utils.format("os.makedirs"))
+    mocker.patch(patch_utils.format("prune_proc_logs"))
+    handler = MagicMock()
+    mocker.patch(patch_utils.format("RotatingFileHandler"), return_value=handler)
+    lines = [f"line {i}\n" for i in range(20)]
+
+    # Act
+    with utils.ProcLogWriter("logs/task.log") as writer:
+        for line in lines:
+            writer.write(line)
+
+    # Assert
+    written = [c.args[0].getMessage() for c in handler.handle.call_args_list]
+    assert written == lines
+    handler.close.assert_called_once()
+
+
+def test_proc_log_writer_rotates_with_config_limits(mocker):
+    # Arrange
+    mocker.patch(patch_utils.format("os.makedirs"))
+    mocker.patch(patch_utils.format("prune_proc_logs"))
+    spy = mocker.patch(patch_utils.format("RotatingFileHandler"))
+
+    # Act
+    utils.ProcLogWriter("logs/task.log").close()
+
+    # Assert
+    spy.assert_called_once_with(
+        "logs/task.log",
+        maxBytes=config.cube_log_max_bytes,
+        backupCount=config.cube_log_backup_count,
+        encoding="utf-8",
+    )
+
+
+def test_proc_log_writer_bounds_queue_and_prunes_old_runs(mocker):
+    # Arrange
+    mocker.patch(patch_utils.format("os.makedirs"))
+    mocker.patch(patch_utils.format("RotatingFileHandler"))
+    spy = mocker.patch(patch_utils.format("prune_proc_logs"))
+
+    # Act
+    writer = utils.ProcLogWriter("logs/task.log", keep_runs=5)
+    writer.close()
+
+    # Assert
+    spy.assert_called_once_with("logs", 4)
+    assert writer.queue.maxsize == config.cube_log_queue_size
+
+
+@pytest.mark.parametrize("keep", [0, 1, 2, 5])
+def test_prune_proc_logs_keeps_most_recent_runs(mocker, keep):
+    # Arrange
+    mtimes = {
+        "infer_1.log": 1,
+        "infer_1.log.1": 0,
+        "evaluate_2.log": 2,
+        "infer_3.log": 3,
+        "infer_3.log.1": 3,
+        "infer_3.log.2": 3,
+    }
+    runs = [["infer_3.log", "infer_3.log.1", "infer_3.log.2"], ["evaluate_2.log"]]
+    runs.append(["infer_1.log", "infer_1.log.1"])
+    mocker.patch("os.listdir", return_value=list(mtimes.keys()))
+    mocker.patch(
+        "os.path.getmtime",
+        side_effect=lambda path: mtimes[os.path.basename(path)],
+    )
+    spy = mocker.patch("os.remove")
+    exp_removed = [os.path.join("logs", f) for run in runs[keep:] for f in run]
+
+    # Act
+    utils.prune_proc_logs("logs", keep)
+
+    # Assert
+    removed = [c.args[0] for c in spy.call_args_list]
+    assert sorted(removed) == sorted(exp_removed)
+
+
+@time_machine.travel(dt.datetime(2022, 1, 2, 3, 4, 5), tick=False)
+def test_proc_log_path_is_inside_cube_logs_folder():
+    # Arrange
+    exp_path = os.path.join(
+        utils.cube_path(1), config.cube_logs_storage, "task_20220102-030405-000000.log"
+    )
+
+    # Act
+    path = utils.proc_log_path(1, "task")
+
+    # Assert
+    assert path == exp_path
+
+
+@pytest.fixture
+def tree(mocker):
+    tree = {
+        "a.txt": 10,
+        "sub": {"b.txt": 20, "deep": {"c.txt": 30, "d.txt": 40}},
+        "empty": {},
+    }
+    mocker.patch("os.scandir", side_effect=MockScandir("root", tree).scandir)
+    return tree
+
+
+def test_list_files_lists_whole_tree(tree):
+    # Act
+    out = utils.list_files("root")
+
+    # Assert
+    for name in ["root/", "a.txt", "sub/", "b.txt", "deep/", "c.txt", "d.txt", "empty/"]:
+        assert name in out.split()
+    assert "..." not in out
+
+
+def test_list_files_stops_at_max_depth(tree):
+    # Act
+    out = utils.list_files("root", max_depth=1)
+
+    # Assert
+    assert "b.txt" in out
+    assert "c.txt" not in out
+    assert "..." in out
+
+
+@pytest.mark.parametrize("max_entries", [1, 3, 5])
+def test_list_files_stops_at_max_entries(tree, max_entries):
+    # Act
+    out = utils.list_files("root", max_entries=max_entries)
+
+    # Assert
+    lines = out.splitlines()
+    assert len(lines) == max_entries + 2
+    assert lines[-1].strip() == "..."
+
+
+@pytest.mark.parametrize("depth,exp_dirs", [(1, ["empty", "sub"]), (2, ["sub/deep"])])
+def test_list_dirs_returns_folders_at_depth(tree, depth, exp_dirs):
+    # Act
+    dirs = utils.list_dirs("root", depth)
+
+    # Assert
+    assert dirs == exp_dirs
+
+
+def test_get_folder_size_adds_all_files(tree):
+    # Act
+    size, n_files = utils.get_folder_size("root")
+
+    # Assert
+    assert size == 100
+    assert n_files == 4
+
+
+@pytest.mark.parametrize(
+    "size,exp_str",
+    [(0, "0 B"), (1023, "1023 B"), (1024, "1.0 KB"), (1536 * 1024 ** 2, "1.5 GB")],
+)
+def test_format_size_uses_largest_unit(size, exp_str):
+    # Act
+    out = utils.format_size(size)
+
+    # Assert
+    assert out == exp_str
@@ -1,22 +1,32 @@
 from __future__ import annotations
 
+import io
 import re
 import os
+import time
 import yaml
+import pexpect
 import hashlib
 import logging
 import tarfile
-from glob import glob
+import subprocess
+from queue import Queue
+from threading import Thread
 from pathlib import Path
-from shutil import rmtree
+from shutil import rmtree, which
 from pexpect import spawn
+from logging.handlers import QueueListener, RotatingFileHandler
 from datetime import datetime
-from typing import List, Tuple
+from collections import deque
+from typing import BinaryIO, List, Tuple, TextIO
 from colorama import Fore, Style
 
 import medperf.config as config
 from medperf.ui.interface import UI
 
+# A line of process output, ending with a carriage return, a new line or both
+PROC_LINE = re.compile(b"[^\r\n]*(?:\r\n|[\r\n])|[^\r\n]+$")
+
 
 def storage_path(subpath: str):
     """Helper function that converts a path to storage-related path"""
@@ -54,8 +64,9 @@ def init_storage():
     tmp = storage_path(config.tmp_storage)
     bmks = storage_path(config.benchmarks_storage)
     demo = storage_path(config.demo_data_storage)
+    artifacts = storage_path(config.artifacts_storage)
 
-    dirs = [parent, bmks, data, cubes, results, tmp, demo]
+    dirs = [parent, bmks, data, cubes, results, tmp, demo, artifacts]
     for dir in dirs:
         if not os.path.isdir(dir):
             logging.info(f"Creating {dir} directory")
@@ -226,21 +237,149 @@ def untar(filepath: str, remove: bool = True) -> str:
     """
     logging.info(f"Uncompressing tar.gz at {filepath}")
     addpath = str(Path(filepath).parent)
-    tar = tarfile.open(filepath)
-    tar.extractall(addpath)
-    tar.close()
-
-    # OS Specific issue: Mac Creates superfluous files with tarfile library
-    [
-        os.remove(spurious_file)
-        for spurious_file in glob(addpath + "/**/._*", recursive=True)
-    ]
+    with open(filepath, "rb") as f:
+        extract_tar(f, addpath)
+
     if remove:
         logging.info(f"Deleting {filepath}")
         os.remove(filepath)
     return addpath
 
 
+class HashingReader(io.RawIOBase):
+    """Readable stream that computes the sha1 hash of the data read through it"""
+
+    def __init__(self, fileobj: BinaryIO):
+        self.fileobj = fileobj
+        self.sha1 = hashlib.sha1()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.fileobj.read(len(buffer))
+        size = len(data)
+        buffer[:size] = data
+        self.sha1.update(data)
+        return size
+
+    def hexdigest(self) -> str:
+        return self.sha1.hexdigest()
+
+
+def is_safe_member(member: tarfile.TarInfo, path: str) -> bool:
+    """Checks if a tar member can be extracted inside path. Members
+    escaping path, links pointing outside of it, device files and
+    superfluous files created by Mac (._*) are considered unsafe.
+
+    Args:
+        member (tarfile.TarInfo): member of the tar file.
+        path (str): Location where the tar file is extracted.
+
+    Returns:
+        bool: Wether the member should be extracted
+    """
+    if os.path.basename(member.name.rstrip("/")).startswith("._"):
+        return False
+    if member.isdev():
+        return False
+
+    root = os.path.realpath(path)
+    target = os.path.realpath(os.path.join(root, member.name))
+    if os.path.commonpath([root, target]) != root:
+        return False
+    if member.issym() or member.islnk():
+        link_base = os.path.dirname(target) if member.issym() else root
+        link_target = os.path.realpath(os.path.join(link_base, member.linkname))
+        if os.path.commonpath([root, link_target]) != root:
+            return False
+    return True
+
+
+def _extract_members(tar: tarfile.TarFile, path: str):
+    # Use the standard extraction filter when available, which also
+    # drops special permission bits
+    kwargs = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+    for member in tar:
+        if not is_safe_member(member, path):
+            logging.debug(f"Skipping tar member {member.name}")
+            continue
+        tar.extract(member, path, **kwargs)
+
+
+def _drain(stream: BinaryIO):
+    while stream.read(config.tar_read_size):
+        pass
+
+
+def _feed(src: BinaryIO, dest: BinaryIO):
+    try:
+        for chunk in iter(lambda: src.read(config.tar_read_size), b""):
+            dest.write(chunk)
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            dest.close()
+        except BrokenPipeError:
+            pass
+
+
+def gunzip_command() -> List[str]:
+    """Finds an installed parallel gzip decompressor
+
+    Returns:
+        List[str]: command decompressing stdin into stdout. None if no tool is available
+    """
+    for tool in config.parallel_gunzip_tools:
+        tool_path = which(tool)
+        if tool_path is not None:
+            return [tool_path, "-d", "-c"]
+    return None
+
+
+def extract_tar(fileobj: BinaryIO, path: str):
+    """Extracts a tar file member by member while it is being read, so that
+    it can be extracted directly from a download. Unsafe members are
+    skipped, see is_safe_member. Gzip compressed data is decompressed by an
+    installed parallel gzip tool if available, or by python otherwise.
+    The stream is read until its end.
+
+    Args:
+        fileobj (BinaryIO): readable stream with the (optionally compressed) tar file.
+        path (str): Location where the contents are extracted.
+    """
+    if not hasattr(fileobj, "peek"):
+        fileobj = io.BufferedReader(fileobj, config.tar_read_size)
+    gzipped = fileobj.peek(2)[:2] == b"\x1f\x8b"
+    cmd = gunzip_command() if gzipped else None
+
+    if cmd is None:
+        with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+            _extract_members(tar, path)
+        _drain(fileobj)
+        return
+
+    logging.debug(f"Decompressing tar file with {cmd[0]}")
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    feeder = Thread(target=_feed, args=(fileobj, proc.stdin), daemon=True)
+    feeder.start()
+    try:
+        with tarfile.open(fileobj=proc.stdout, mode="r|") as tar:
+            _extract_members(tar, path)
+        _drain(proc.stdout)
+    except BaseException:
+        proc.kill()
+        raise
+    finally:
+        feeder.join()
+        proc.stdout.close()
+        returncode = proc.wait()
+
+    if returncode != 0:
+        raise tarfile.ReadError(f"{cmd[0]} failed with exit code {returncode}")
+
+
 def approval_prompt(msg: str, ui: "UI") -> bool:
     """Helper function for prompting the user for things they have to explicitly approve.
 
@@ -272,37 +411,183 @@ def dict_pretty_print(in_dict: dict, ui: "UI"):
     ui.print("=" * 20)
 
 
-def combine_proc_sp_text(proc: spawn, ui: "UI") -> str:
+def combine_proc_sp_text(
+    proc: spawn,
+    ui: "UI",
+    sink: TextIO = None,
+    max_lines: int = None,
+    refresh_interval: float = None,
+) -> str:
     """Combines the output of a process and the spinner. 
     Joins any string captured from the process with the 
-    spinner current text. Any strings ending with any other 
-    character from the subprocess will be returned later.
+    spinner current text.
+
+    Output is read in chunks as soon as it is available, and split
+    into lines ending with a carriage return, a new line or both. Partial
+    lines longer than config.proc_output_max_line_size are flushed as they
+    are, so output without line breaks doesn't accumulate. Only the
+    last max_lines lines are kept in memory, and the spinner text is
+    updated at most once per refresh_interval seconds.
 
     Args:
         proc (spawn): a pexpect spawned child
         ui (UI): An instance of an UI implementation
+        sink (TextIO, optional): Stream receiving every captured line, e.g. a log file.
+        max_lines (int, optional): Number of lines to keep and return.
+            Defaults to config.proc_output_max_lines.
+        refresh_interval (float, optional): Minimum time in seconds between spinner updates.
+            Defaults to config.proc_output_refresh_interval.
 
     Returns:
-        str: all non-carriage-return-ending string captured from proc
+        str: last max_lines lines captured from proc
     """
+    if max_lines is None:
+        max_lines = config.proc_output_max_lines
+    if refresh_interval is None:
+        refresh_interval = config.proc_output_refresh_interval
+
     static_text = ui.text
-    proc_out = ""
-    while proc.isalive():
-        line = byte = proc.read(1)
-        while byte and not re.match(b"[\r\n]", byte):
-            byte = proc.read(1)
-            line += byte
-        if not byte:
-            break
-        line = line.decode("utf-8", "ignore")
-        if line:
-            # add to proc_out list for logging
-            proc_out += line
-        ui.text = (
-            f"{static_text} {Fore.WHITE}{Style.DIM}{line.strip()}{Style.RESET_ALL}"
+    tail = deque(maxlen=max_lines)
+    buffer = b""
+    last_line = ""
+    last_refresh = 0
+    eof = False
+
+    while not eof:
+        try:
+            buffer += proc.read_nonblocking(config.proc_read_size, refresh_interval)
+        except pexpect.TIMEOUT:
+            continue
+        except pexpect.EOF:
+            eof = True
+
+        # a trailing carriage return may be followed by a new line in the next chunk
+        search = buffer[:-1] if buffer.endswith(b"\r") else buffer
+        end = max(search.rfind(b"\r"), search.rfind(b"\n")) + 1
+        if eof or len(buffer) - end >= config.proc_output_max_line_size:
+            end = len(buffer)
+        if not end and not eof:
+            continue
+
+        lines = PROC_LINE.findall(buffer[:end])
+        buffer = buffer[end:]
+        for line in lines:
+            line = line.decode("utf-8", "ignore")
+            tail.append(line)
+            if sink is not None:
+                sink.write(line)
+            if line.strip():
+                last_line = line.strip()
+
+        now = time.monotonic()
+        if eof or now - last_refresh >= refresh_interval:
+            last_refresh = now
+            ui.text = (
+                f"{static_text} {Fore.WHITE}{Style.DIM}{last_line}{Style.RESET_ALL}"
+            )
+
+    return "".join(tail)
+
+
+class ProcLogWriter:
+    """File-like sink that stores process output in a rotating log file.
+
+    Written text is queued and flushed to disk by a background thread, so
+    reading the process output never waits for the file system, unless
+    the queue is full. The log file is rotated once it reaches max_bytes,
+    keeping backup_count old files. Logs of older runs in the same folder
+    are pruned, keeping only the most recent ones.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = None,
+        backup_count: int = None,
+        keep_runs: int = None,
+    ):
+        """Starts the writer thread
+
+        Args:
+            path (str): Location of the log file. Parent folders are created if needed.
+            max_bytes (int, optional): Size at which the log file is rotated.
+                Defaults to config.cube_log_max_bytes.
+            backup_count (int, optional): Number of rotated files to keep.
+                Defaults to config.cube_log_backup_count.
+            keep_runs (int, optional): Number of run logs to keep in the folder,
+                including this one. Defaults to config.cube_logs_keep.
+        """
+        if max_bytes is None:
+            max_bytes = config.cube_log_max_bytes
+        if backup_count is None:
+            backup_count = config.cube_log_backup_count
+        if keep_runs is None:
+            keep_runs = config.cube_logs_keep
+
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        prune_proc_logs(folder, keep_runs - 1)
+        self.path = path
+        self.queue = Queue(maxsize=config.cube_log_queue_size)
+        self.handler = RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
         )
+        # written text already contains its line endings
+        self.handler.terminator = ""
+        self.listener = QueueListener(self.queue, self.handler)
+        self.listener.start()
+
+    def write(self, text: str):
+        self.queue.put(logging.makeLogRecord({"msg": text}))
 
-    return proc_out
+    def close(self):
+        """Writes any pending text and stops the writer thread"""
+        self.listener.stop()
+        self.handler.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def prune_proc_logs(folder: str, keep: int):
+    """Removes the logs of all but the most recent runs inside a folder.
+    Rotated files are removed along with the log they belong to.
+
+    Args:
+        folder (str): Location of the logs folder.
+        keep (int): Number of run logs to keep.
+    """
+    runs = {}
+    for file in os.listdir(folder):
+        # rotated files are named <log>.1, <log>.2, ...
+        run = file[: file.find(".log") + len(".log")] if ".log" in file else file
+        runs.setdefault(run, []).append(os.path.join(folder, file))
+
+    def last_modified(run):
+        return max(os.path.getmtime(file) for file in runs[run])
+
+    old_runs = sorted(runs, key=last_modified, reverse=True)[max(keep, 0) :]
+    for run in old_runs:
+        for file in runs[run]:
+            os.remove(file)
+
+
+def proc_log_path(uid: str, task: str) -> str:
+    """Builds the location of the log file for a new cube execution
+
+    Args:
+        uid (str): Cube UID.
+        task (str): Task being executed.
+
+    Returns:
+        str: Location of the log file, unique to this execution
+    """
+    ts = datetime.utcnow().strftime("%Y%m%d-%H%M%S-%f")
+    filename = f"{task}_{ts}.log"
+    return os.path.join(cube_path(uid), config.cube_logs_storage, filename)
 
 
 def get_folder_sha1(path: str) -> str:
@@ -368,16 +653,127 @@ def setup_logger(logger, log_lvl):
     logger.addHandler(fh)
 
 
-def list_files(startpath):
-    tree_str = ""
-    for root, dirs, files in os.walk(startpath):
-        level = root.replace(startpath, "").count(os.sep)
-        indent = " " * 4 * (level)
+def list_files(startpath: str, max_depth: int = None, max_entries: int = None) -> str:
+    """Builds a tree representation of a folder contents. Folders are read
+    with os.scandir and listing stops as soon as any limit is reached,
+    so that large folders can be inspected cheaply.
+
+    Args:
+        startpath (str): Location of the folder to list.
+        max_depth (int, optional): Deepest folder level listed. Defaults to no limit.
+        max_entries (int, optional): Maximum number of files and folders listed.
+            Defaults to no limit.
 
-        tree_str += "{}{}/\n".format(indent, os.path.basename(root))
+    Returns:
+        str: tree of files and folders. Omitted contents are marked with "..."
+    """
+    lines = []
+
+    def list_dir(path: str, level: int) -> bool:
+        lines.append("{}{}/".format(" " * 4 * level, os.path.basename(path)))
         subindent = " " * 4 * (level + 1)
-        for f in files:
-            tree_str += "{}{}\n".format(subindent, f)
+        dirs = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if max_entries is not None and len(lines) > max_entries:
+                        lines.append(f"{subindent}...")
+                        return False
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.path)
+                    else:
+                        lines.append(f"{subindent}{entry.name}")
+        except OSError:
+            return True
+
+        if dirs and max_depth is not None and level >= max_depth:
+            lines.append(f"{subindent}...")
+            return True
+        for dir in dirs:
+            if not list_dir(dir, level + 1):
+                return False
+        return True
+
+    list_dir(startpath, 0)
+    return "\n".join(lines) + "\n"
+
+
+def list_dirs(path: str, depth: int = 1) -> List[str]:
+    """Lists the folders found at a given depth inside path
 
-    return tree_str
+    Args:
+        path (str): Location of the folder to explore.
+        depth (int, optional): Level of the listed folders. Defaults to 1.
 
+    Returns:
+        List[str]: paths of the folders, relative to path
+    """
+    dirs = [""]
+    for _ in range(depth):
+        subdirs = []
+        for dir in dirs:
+            try:
+                with os.scandir(os.path.join(path, dir)) as entries:
+                    subdirs += [
+                        os.path.join(dir, entry.name)
+                        for entry in entries
+                        if entry.is_dir(follow_symlinks=False)
+                    ]
+            except OSError:
+                continue
+        dirs = subdirs
+    return sorted(dirs)
+
+
+def get_folder_size(path: str) -> Tuple[int, int]:
+    """Computes the size of a folder contents using os.scandir.
+    Symlinks are not followed, and files hardlinked more than once
+    inside the folder are only counted once.
+
+    Args:
+        path (str): Location of the folder of interest.
+
+    Returns:
+        int: size of the folder contents in bytes
+        int: number of files inside the folder
+    """
+    size = 0
+    n_files = 0
+    seen = set()
+    pending = [path]
+    while pending:
+        try:
+            entries = os.scandir(pending.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                    continue
+                n_files += 1
+                stat = entry.stat(follow_symlinks=False)
+                if stat.st_nlink > 1:
+                    inode = (stat.st_dev, stat.st_ino)
+                    if inode in seen:
+                        continue
+                    seen.add(inode)
+                size += stat.st_size
+    return size, n_files
+
+
+def format_size(size: int) -> str:
+    """Formats a size in bytes into a human readable string
+
+    Args:
+        size (int): size in bytes
+
+    Returns:
+        str: size using the largest fitting unit, e.g. "1.5 GB"
+    """
+    if size < 1024:
+        return f"{size} B"
+    for unit in ["KB", "MB", "GB", "TB"]:
+        size /= 1024
+        if size < 1024 or unit == "TB":
+            return f"{size:.1f} {unit}"
@@ -0,0 +1,105 @@
+# Input Staging
+#
+# Builds mirrors of input folders made of links to the original files instead
+# of copies of every volume. Model cubes need such a mirror inside their output
+# folder, because FeTS_CLI writes its outputs next to its inputs.
+#
+# Shared by the data preparation and model cubes, whose images copy it next to
+# their mlcube.py. Mirrors are persisted in the cube outputs, so symlinks aren't
+# used: they would point to container paths that don't exist on the host.
+# Docker mounts the input and output folders separately, and hardlinks can't
+# cross mount points even on the same filesystem, so inside a container files
+# are staged as copy-on-write clones when the filesystem and kernel support them,
+# and copied otherwise. Hardlinks are used when both folders share a mount.
+import os
+import shutil
+import fcntl
+
+# ioctl request cloning a file on copy-on-write filesystems (btrfs, xfs, ...)
+FICLONE = 0x40049409
+STAGING_MODES = ["hardlink", "copy"]
+
+
+def clone_file(src, dest):
+    """Copies src to dest, sharing the file blocks (copy-on-write) when the
+    filesystem supports it, and falling back to a regular copy otherwise.
+
+    Args:
+        src (str): file to copy
+        dest (str): destination path
+    """
+    try:
+        with open(src, "rb") as src_f, open(dest, "wb") as dest_f:
+            fcntl.ioctl(dest_f.fileno(), FICLONE, src_f.fileno())
+        shutil.copystat(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+def stage_file(src, dest, mode="hardlink"):
+    """Places src at dest, replacing any existing file.
+
+    Args:
+        src (str): file to stage
+        dest (str): destination path
+        mode (str): "hardlink" links dest to src and "copy" copies it. Hardlinks fall
+            back to a copy-on-write copy when they can't be created (e.g. across mounts).
+    """
+    if os.path.lexists(dest):
+        os.remove(dest)
+    if mode == "hardlink":
+        try:
+            os.link(src, dest)
+            return
+        except OSError:
+            pass
+    clone_file(src, dest)
+
+
+def stage_tree(src, dest, mode="hardlink"):
+    """Mirrors the src folder tree into dest without duplicating file contents.
+
+    Files must be treated as read-only in the mirror: hardlinked files share
+    their contents with the original files, so writing into them in place would
+    modify the input data. Creating, deleting or replacing files is safe.
+
+    Args:
+        src (str): folder to mirror
+        dest (str): destination folder. Created if needed
+        mode (str): staging mode of the files. See stage_file
+
+    Returns:
+        list: paths of the mirrored top-level subfolders (e.g. subjects)
+    """
+    assert mode in STAGING_MODES, "Unsupported staging mode: {}".format(mode)
+    os.makedirs(dest, exist_ok=True)
+
+    subjects = []
+    for root, dirs, files in os.walk(src):
+        rel_root = os.path.relpath(root, src)
+        dest_root = os.path.normpath(os.path.join(dest, rel_root))
+        for folder in dirs:
+            os.makedirs(os.path.join(dest_root, folder), exist_ok=True)
+            if rel_root == os.curdir:
+                subjects.append(os.path.join(dest_root, folder))
+        for file in files:
+            stage_file(os.path.join(root, file), os.path.join(dest_root, file), mode)
+    return subjects
+
+
+def collect_qc_segmentations(subjects, qc_folder="SegmentationsForQC", suffix="_seg.nii.gz"):
+    """Moves the segmentations written by FeTS_CLI into the subject folders.
+
+    Args:
+        subjects (list): subject folders, as returned by stage_tree
+        qc_folder (str): name of the subfolder where segmentations are written
+        suffix (str): suffix of the segmentation files to move
+    """
+    for subject in subjects:
+        qc_dir = os.path.join(subject, qc_folder)
+        if not os.path.isdir(qc_dir):
+            continue
+        with os.scandir(qc_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(suffix):
+                    os.replace(entry.path, os.path.join(subject, entry.name))
@@ -39,7 +39,7 @@ def prepare(
         params_file (str): Location of the parameters.yaml file. Required for Medperf Data Preparation MLCubes.
         out_path (str): Location to store transformed data. Required for Medperf Data Preparation MLCubes.
     """
-    cmd = f"python3 prepare.py --input_dir={data_path} --out={out_path}"
+    cmd = f"python3 prepare.py --input_dir={data_path} --out={out_path} --parameters_file={params_file}"
     exec_python(cmd)
 
 @app.command("sanity_check")
@@ -54,7 +54,7 @@ def sanity_check(
         data_path (str): Location of the prepared data. Required for Medperf Data Preparation MLCubes.
         params_file (str): Location of the parameters.yaml file. Required for Medperf Data Preparation MLCubes.
     """
-    cmd = f"python3 sanity_check.py --data_path={data_path}"
+    cmd = f"python3 sanity_check.py --data_path={data_path} --parameters_file={params_file}"
     exec_python(cmd)
 
 @app.command("statistics")
@@ -74,7 +74,7 @@ def statistics(
         params_file (str): Location of the parameters.yaml file. Required for Medperf Data Preparation MLCubes.
         output_path (str): File to store the statistics. Must be statistics.yaml. Required for Medperf Data Preparation MLCubes. 
     """
-    cmd = f"python3 statistics.py --data_path={data_path} --out_file={output_path}"
+    cmd = f"python3 statistics.py --data_path={data_path} --out_file={output_path} --parameters_file={params_file}"
     exec_python(cmd)
 
 if __name__ == "__main__":
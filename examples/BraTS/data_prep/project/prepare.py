@@ -1,14 +1,21 @@
-import os, pathlib
-import shutil
 import argparse
 
+import yaml
+
+from staging import stage_tree
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser("Medperf Data Preparator Example")
     parser.add_argument("--input_dir", dest="input", type=str, help="path containing raw names")
     parser.add_argument("--out", dest="out" , type=str, help="path to store prepared data")
+    parser.add_argument("--parameters_file", dest="params", type=str, default=None, help="parameters file")
 
     args = parser.parse_args()
 
-    pathlib.Path.mkdir(args.out, parents=True, exist_ok=True)
+    params = {}
+    if args.params is not None:
+        with open(args.params) as f:
+            params = yaml.safe_load(f) or {}
 
-    shutil.copytree(args.input, args.out)
+    # the prepared data is a link farm of the input data, rather than a copy
+    stage_tree(args.input, args.out, params.get("staging_mode", "hardlink"))
@@ -1,9 +1,16 @@
 import os
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 
+import yaml
 import SimpleITK as sitk
 import numpy as np
 
+# define base size and spacing
+BASE_SIZE = np.array([240, 240, 155])
+BASE_SPACING = np.array([1.0, 1.0, 1.0])
+BRATS_LABELS = [0, 1, 2, 4]
+
 def check_subject_validity(subject_dir):
     """Checks if a subject folder is valid.
 
@@ -24,43 +31,97 @@ def check_subject_validity(subject_dir):
     return subject_valid
 
 
-def sanity_check(data_path):
-    """Runs a few checks to ensure data quality and integrity
+def read_image_information(image_file):
+    """Reads the size and spacing of an image from its header, without loading pixel data.
 
     Args:
-        data_path (str): The input data folder.
+        image_file (str): The image file.
+
+    Returns:
+        tuple: size and spacing arrays of the image.
+    """
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(image_file)
+    reader.ReadImageInformation()
+    return np.array(reader.GetSize()), np.array(reader.GetSpacing())
+
+
+def check_segmentation_labels(seg_file, labels):
+    """Checks that a segmentation only contains the expected label values.
+    This requires decompressing the whole volume.
+
+    Args:
+        seg_file (str): The segmentation file.
+        labels (list): The accepted label values.
+    """
+    image = sitk.ReadImage(seg_file)
+    # the view shares the image buffer, so the image must outlive it
+    values = np.unique(sitk.GetArrayViewFromImage(image))
+    unexpected = np.setdiff1d(values, labels)
+    assert not len(unexpected), "Segmentation {} contains unexpected labels {}".format(seg_file, unexpected.tolist())
+
+
+def check_subject(subject_dir, deep=False, labels=BRATS_LABELS):
+    """Checks the modalities and segmentation of a subject.
+
+    Args:
+        subject_dir (str): The subject folder.
+        deep (bool): Whether to also check the label values of the segmentation.
+        labels (list): The accepted label values, used by the deep check.
     """
-    all_files = os.listdir(data_path)
+    assert check_subject_validity(subject_dir), "Subject {} does not contain all modalities or segmentation".format(subject_dir)
+
+    for entry in os.scandir(subject_dir):
+        # perform BraTS space check for all nifti images
+        if entry.is_file() and entry.name.endswith(".nii.gz"):
+            size_array, spacing_array = read_image_information(entry.path)
+
+            assert (BASE_SIZE==size_array).all(), "Image size is not [240,240,155] for " + entry.path
+            assert (BASE_SPACING==spacing_array).all(), "Image resolution is not [1,1,1] for " + entry.path
 
-    # define base size and spacing
-    base_size = np.array([240, 240, 155])
-    base_spacing = np.array([1.0, 1.0, 1.0])
+    if deep:
+        seg_file = os.path.join(subject_dir, os.path.basename(subject_dir) + "_seg.nii.gz")
+        check_segmentation_labels(seg_file, labels)
 
-    for folders in all_files:
-        current_subject = os.path.join(data_path, folders)
-        if os.path.isdir(current_subject):
 
-            assert check_subject_validity(current_subject), "Subject {} does not contain all modalities or segmentation".format(current_subject)
-                
-            for files in os.listdir(current_subject):
-                current_file = os.path.join(current_subject, files)
-                if os.path.isfile(current_file):
-                    # perform BraTS space check for all nifti images
-                    if current_file.endswith(".nii.gz"):
-                        image = sitk.ReadImage(current_file)
-                        size_array = np.array(image.GetSize())
-                        spacing_array = np.array(image.GetSpacing())
+def sanity_check(data_path, deep=False, labels=BRATS_LABELS, workers=None):
+    """Runs a few checks to ensure data quality and integrity.
+
+    Only image headers are read, unless deep is set. Subjects are checked
+    in parallel.
+
+    Args:
+        data_path (str): The input data folder.
+        deep (bool): Whether to also check the label values of the segmentations.
+        labels (list): The accepted segmentation label values.
+        workers (int, optional): The number of processes. Defaults to the number of CPUs.
+    """
+    subjects = sorted(entry.path for entry in os.scandir(data_path) if entry.is_dir())
 
-                        assert (base_size==size_array).all(), "Image size is not [240,240,155] for " + current_file
-                        assert (base_spacing==spacing_array).all(), "Image resolution is not [1,1,1] for " + current_file
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(check_subject, subject, deep, labels) for subject in subjects]
+        for future in futures:
+            # raises the AssertionError of the first invalid subject
+            future.result()
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser("BraTS Data Sanity Check")
     parser.add_argument("--data_path", dest="data", type=str, help="directory containing the prepared data")
+    parser.add_argument("--parameters_file", dest="params", type=str, default=None, help="parameters file")
 
     args = parser.parse_args()
 
-    sanity_check(args.data)
+    params = {}
+    if args.params is not None:
+        with open(args.params) as f:
+            params = yaml.safe_load(f) or {}
+
+    sanity_check(
+        args.data,
+        deep=params.get("deep_sanity_check", False),
+        labels=params.get("segmentation_labels", BRATS_LABELS),
+        workers=params.get("workers"),
+    )
 
     print("Finished")
\ No newline at end of file
@@ -1,41 +1,250 @@
 import os
-import yaml
+import gzip
+import struct
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import yaml
+import numpy as np
+import SimpleITK as sitk
+
+from sanity_check import check_subject_validity
+
+MODALITIES = ["t1", "t1ce", "t2", "flair"]
+CHUNK_BYTES = 8 << 20
+
+# NIfTI-1 datatype codes
+NIFTI_DTYPES = {
+    2: "u1", 4: "i2", 8: "i4", 16: "f4", 64: "f8", 256: "i1", 512: "u2", 768: "u4",
+}
+
+
+def read_nifti_header(f):
+    """Parses the fields of a NIfTI-1 header needed to stream the voxel data.
+
+    Args:
+        f (file-like): binary stream positioned at the start of the file
+
+    Returns:
+        dict: number of voxels, numpy dtype, data offset, scaling slope and intercept.
+            None if the file is not a supported single-file NIfTI-1 file, or if its
+            header is inconsistent (e.g. the data offset overlaps the header)
+    """
+    header = f.read(348)
+    if len(header) < 348:
+        return None
+    for endian in "<>":
+        if struct.unpack(endian + "i", header[:4])[0] == 348:
+            break
+    else:
+        return None # e.g. NIfTI-2
+    # "ni1" headers are stored apart from their data, in a .hdr/.img pair
+    if header[344:348] != b"n+1\0":
+        return None
 
-from .sanity_check import check_subject_validity            
+    dim = struct.unpack(endian + "8h", header[40:56])
+    datatype = struct.unpack(endian + "h", header[70:72])[0]
+    vox_offset, scl_slope, scl_inter = struct.unpack(endian + "3f", header[108:120])
+    if datatype not in NIFTI_DTYPES or not 1 <= dim[0] <= 7:
+        return None
+    # the header is followed by at least a 4 bytes extension flag
+    if vox_offset < 352:
+        return None
 
-def get_statistics(data_path: str) -> dict:
+    return {
+        "voxels": int(np.prod(dim[1:dim[0] + 1], dtype=np.int64)),
+        "dtype": np.dtype(endian + NIFTI_DTYPES[datatype]),
+        "offset": int(vox_offset),
+        "slope": scl_slope,
+        "inter": scl_inter,
+    }
+
+
+def iter_volume_chunks(image_file, chunk_bytes=CHUNK_BYTES):
+    """Yields the voxel values of a NIfTI volume in chunks, decompressing it
+    progressively, so that a whole volume is never held in memory.
+
+    Files that can't be streamed are read with SimpleITK in a single chunk.
+
+    Args:
+        image_file (str): .nii or .nii.gz file
+        chunk_bytes (int): maximum size of the raw data of a chunk
+
+    Yields:
+        np.ndarray: flat arrays of voxel values, with the header scaling applied
+    """
+    opener = gzip.open if image_file.endswith(".gz") else open
+    with opener(image_file, "rb") as f:
+        header = read_nifti_header(f)
+        if header is not None:
+            f.read(header["offset"] - 348)
+            dtype = header["dtype"]
+            scaled = header["slope"] not in (0.0, 1.0) or header["inter"] != 0.0
+            chunk_voxels = max(1, chunk_bytes // dtype.itemsize)
+            remaining = header["voxels"]
+            while remaining:
+                count = min(chunk_voxels, remaining)
+                data = f.read(count * dtype.itemsize)
+                assert len(data) == count * dtype.itemsize, "Truncated image " + image_file
+                values = np.frombuffer(data, dtype=dtype)
+                if scaled:
+                    values = values * header["slope"] + header["inter"]
+                yield values
+                remaining -= count
+            return
+
+    image = sitk.ReadImage(image_file)
+    yield sitk.GetArrayFromImage(image).ravel()
+
+
+def empty_statistics(bins, num_labels):
+    """Partial statistics of no subject. Partial statistics are mergeable by summing
+    every entry (see merge_statistics)
+    """
+    stats = {"valid": 0, "invalid": 0}
+    for modality in MODALITIES:
+        stats[modality] = {
+            "voxels": 0,
+            "nonzero": 0,
+            "sum": 0.0,
+            "sum_sq": 0.0,
+            "histogram": np.zeros(bins + 2, dtype=np.int64), # includes under/overflow bins
+        }
+    stats["labels"] = {
+        "voxels": np.zeros(num_labels, dtype=np.int64),
+        "subjects": np.zeros(num_labels, dtype=np.int64),
+        "other_voxels": 0,
+    }
+    return stats
+
+
+def merge_statistics(a, b):
+    """Merges two partial statistics, as returned by subject_statistics"""
+    if isinstance(a, dict):
+        return {key: merge_statistics(a[key], b[key]) for key in a}
+    return a + b
+
+
+def subject_statistics(subject_dir, labels, bins, value_range, chunk_bytes=CHUNK_BYTES):
+    """Computes the partial statistics of a single subject. Each volume is read once.
+
+    Args:
+        subject_dir (str): The subject folder.
+        labels (list): The expected segmentation label values.
+        bins (int): Number of bins of the intensity histograms.
+        value_range (list): Range of the intensity histograms. Values outside of it
+            are counted in underflow/overflow bins.
+        chunk_bytes (int): maximum size of the raw data decompressed at once.
+
+    Returns:
+        dict: partial statistics (see empty_statistics)
+    """
+    stats = empty_statistics(bins, len(labels))
+    if not check_subject_validity(subject_dir):
+        stats["invalid"] = 1
+        return stats
+    stats["valid"] = 1
+
+    prefix = os.path.join(subject_dir, os.path.basename(subject_dir))
+    low, high = value_range
+    bin_width = (high - low) / bins
+
+    for modality in MODALITIES:
+        modality_stats = stats[modality]
+        for values in iter_volume_chunks(f"{prefix}_{modality}.nii.gz", chunk_bytes):
+            modality_stats["voxels"] += len(values)
+            # background voxels are only counted
+            values = values[values != 0].astype(np.float64)
+            modality_stats["nonzero"] += len(values)
+            modality_stats["sum"] += float(values.sum())
+            modality_stats["sum_sq"] += float(np.square(values).sum())
+            # bin 0 and bin bins + 1 hold values below and above the range
+            indices = np.clip(np.floor((values - low) / bin_width) + 1, 0, bins + 1).astype(np.int64)
+            modality_stats["histogram"] += np.bincount(indices, minlength=bins + 2)
+
+    # label values are mapped to their position in labels, anything else is counted apart
+    max_label = max(labels)
+    label_index = np.full(max_label + 2, len(labels), dtype=np.int64)
+    label_index[labels] = np.arange(len(labels))
+    label_counts = np.zeros(len(labels) + 1, dtype=np.int64)
+    for values in iter_volume_chunks(f"{prefix}_seg.nii.gz", chunk_bytes):
+        values = np.clip(values.astype(np.int64), -1, max_label + 1)
+        label_counts += np.bincount(label_index[values], minlength=len(labels) + 1)
+
+    stats["labels"]["voxels"] = label_counts[:-1]
+    stats["labels"]["subjects"] = (label_counts[:-1] > 0).astype(np.int64)
+    stats["labels"]["other_voxels"] = int(label_counts[-1])
+    return stats
+
+
+def get_statistics(data_path: str, params: dict = None) -> dict:
     """Computes statistics about the data. This statistics are uploaded
     to the Medperf platform under the data owner's approval. Include
     every statistic you consider useful for determining the nature of the
     data, but keep in mind that we want to keep the data as private as 
     possible.
 
+    Only aggregates over all subjects are reported. Intensity histograms
+    and label counts are omitted when fewer than "statistics_min_subjects"
+    valid subjects are aggregated. Subjects are processed in parallel, and
+    their partial statistics merged as they complete.
+
     Args:
         data_path (str): The input data folder.
+        params (dict, optional): contents of the parameters file.
 
     Returns:
         dict: dictionary with all the computed statistics
     """
-    all_files = os.listdir(data_path)
+    params = params or {}
+    labels = params.get("segmentation_labels", [0, 1, 2, 4])
+    bins = params.get("histogram_bins", 64)
+    value_range = params.get("histogram_range", [0, 5000])
+    min_subjects = params.get("statistics_min_subjects", 5)
 
-    number_valid_subjects, number_of_invalid_subjects = 0, 0
+    subjects = sorted(entry.path for entry in os.scandir(data_path) if entry.is_dir())
 
-    for folders in all_files:
-        current_subject = os.path.join(data_path, folders)
-        if os.path.isdir(current_subject):
+    totals = empty_statistics(bins, len(labels))
+    with ProcessPoolExecutor(max_workers=params.get("workers")) as pool:
+        futures = [
+            pool.submit(subject_statistics, subject, labels, bins, value_range)
+            for subject in subjects
+        ]
+        for future in as_completed(futures):
+            totals = merge_statistics(totals, future.result())
 
-            if check_subject_validity(current_subject):
-                number_valid_subjects += 1
-            else:
-                number_of_invalid_subjects += 1
-            
-            ## this can be expanded to get more information about the data, such as the number labels in each segmentation, and so on.
-                
     stats = {
-        "Valid_Subjects": number_valid_subjects,
-        "Invalid_Subjects": number_of_invalid_subjects
+        "Valid_Subjects": totals["valid"],
+        "Invalid_Subjects": totals["invalid"]
+    }
+    if totals["valid"] < min_subjects:
+        return stats
+
+    modalities = {}
+    for modality in MODALITIES:
+        modality_stats = totals[modality]
+        nonzero = modality_stats["nonzero"]
+        mean = modality_stats["sum"] / nonzero if nonzero else 0.0
+        var = modality_stats["sum_sq"] / nonzero - mean ** 2 if nonzero else 0.0
+        histogram = modality_stats["histogram"]
+        modalities[modality] = {
+            "nonzero_ratio": float(nonzero / modality_stats["voxels"]) if modality_stats["voxels"] else 0.0,
+            "nonzero_mean": float(mean),
+            "nonzero_std": float(np.sqrt(max(var, 0.0))),
+            "histogram": {
+                "range": list(value_range),
+                "counts": histogram[1:-1].tolist(),
+                "below_range": int(histogram[0]),
+                "above_range": int(histogram[-1]),
+            },
+        }
+    stats["Modalities"] = modalities
+
+    stats["Labels"] = {
+        label: {"voxels": int(voxels), "subjects": int(subjects)}
+        for label, voxels, subjects in zip(labels, totals["labels"]["voxels"], totals["labels"]["subjects"])
     }
+    stats["Unexpected_Label_Voxels"] = int(totals["labels"]["other_voxels"])
 
     return stats
 
@@ -43,11 +252,16 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser("MedPerf Statistics Example")
     parser.add_argument("--data_path", dest="data", type=str, help="directory containing the prepared data")
     parser.add_argument("--out_file", dest="out_file", type=str, help="file to store statistics")
+    parser.add_argument("--parameters_file", dest="params", type=str, default=None, help="parameters file")
 
     args = parser.parse_args()
 
-    stats = get_statistics(args.data)
+    params = {}
+    if args.params is not None:
+        with open(args.params) as f:
+            params = yaml.safe_load(f) or {}
+
+    stats = get_statistics(args.data, params)
 
     with open(args.out_file, "w") as f:
         yaml.dump(stats, f)
-
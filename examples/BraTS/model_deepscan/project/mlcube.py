@@ -9,9 +9,10 @@
 
 import os, shutil
 import typer
+import yaml
 import subprocess
 
-from distutils.dir_util import copy_tree
+from staging import stage_tree, collect_qc_segmentations
 
 app = typer.Typer()
 
@@ -28,7 +29,7 @@ def exec_python(cmd: str) -> None:
 @app.command("infer")
 def infer(
     data_path: str = typer.Option(..., "--data_path"), # FeTS_CLI writes the output in the same path as data_path
-    params_file: str = typer.Option(..., "--parameters_file"), # FeTS_CLI does not need this
+    params_file: str = typer.Option(..., "--parameters_file"),
     out_path: str = typer.Option(..., "--output_path") # FeTS_CLI writes the output in the same path as data_path
 ):
     """infer task command. This is what gets executed when we run:
@@ -36,9 +37,14 @@ def infer(
 
     Args:
         data_path (str): Location of the data to run inference with. Required for Medperf Model MLCubes.
+        params_file (str): Location of the parameters.yaml file. Required for Medperf Model MLCubes.
         out_path (str): Location to store prediction results. Required for Medperf Model MLCubes.
     """
-    copy_tree(data_path, out_path) # FeTS_CLI writes the output in the same path as data_path
+    with open(params_file, "r") as f:
+        params = yaml.safe_load(f) or {}
+
+    # FeTS_CLI writes the output in the same path as data_path, so it runs on a link farm of the data
+    subjects = stage_tree(data_path, out_path, params.get("staging_mode", "hardlink"))
 
     arch_to_consider = "deepscan"
     cmd = f"FeTS_CLI -a {arch_to_consider} -g 1 -t 0 -d {out_path}"
@@ -47,18 +53,7 @@ def infer(
     if os.path.isdir(os.path.join(out_path,"logs")):
         shutil.rmtree(os.path.join(out_path,"logs"))
 
-    for subs in os.listdir(out_path):
-        current_subject = os.path.join(out_path, subs)
-
-        if os.path.isdir(current_subject):
-            current_subject_qc_dir = os.path.join(current_subject, "SegmentationsForQC")
-            if os.path.exists(current_subject_qc_dir):
-                all_qc_files = os.listdir(current_subject_qc_dir)
-                for qc_file in all_qc_files:
-                    full_file = os.path.join(current_subject_qc_dir, qc_file)
-                    if qc_file.endswith("_seg.nii.gz"):
-                        expected_file = os.path.join(current_subject, qc_file)
-                        shutil.move(full_file, expected_file)
+    collect_qc_segmentations(subjects)
 
 
 @app.command("hotfix")
@@ -7,9 +7,13 @@ from utils import get_image_data_df
 
 
 class Checker:
-    def __init__(self, data_path, data_file):
+    def __init__(self, data_path, data_file, img_data_file=None, workers=None):
         self.data_path = data_path
         self.data_file = os.path.join(data_path, data_file)
+        self.img_data_file = None
+        if img_data_file is not None:
+            self.img_data_file = os.path.join(data_path, img_data_file)
+        self.workers = workers
         self.df = pd.read_csv(self.data_file)
 
     def run(self):
@@ -22,7 +26,9 @@ class Checker:
         assert na_series.sum() == 0, f"Some columns contain null values: {na_cols}"
 
     def __check_images_data(self):
-        img_data = get_image_data_df(self.df, self.data_path)
+        img_data = get_image_data_df(
+            self.df, self.data_path, self.img_data_file, self.workers
+        )
         assert img_data["width"].min() >= 320, "Image width is less than 320"
         assert img_data["height"].min() >= 320, "Image width is less than 320"
         assert img_data["min"].min() >= 0, "Image pixel range goes below 0"
@@ -48,5 +54,10 @@ if __name__ == "__main__":
     with open(args.params_file, "r") as f:
         params = yaml.full_load(f)
 
-    checker = Checker(args.data_path, params["output_datafile"])
+    checker = Checker(
+        args.data_path,
+        params["output_datafile"],
+        params.get("image_datafile", "image_data.npz"),
+        params.get("image_data_workers"),
+    )
     checker.run()
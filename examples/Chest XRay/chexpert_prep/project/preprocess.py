@@ -1,9 +1,10 @@
 import pandas as pd
-from shutil import copyfile
 import os
 import yaml
 import argparse
 
+from utils import transfer_files, save_image_data
+
 
 class Preprocessor:
     def __init__(self, data_path, labels_path, params_file, output_path):
@@ -31,8 +32,23 @@ class Preprocessor:
         imgs_df = pd.concat([imgs_df, dest], axis=1)
         imgs_df["Destination"] = self.output_path + os.sep + imgs_df["Destination"]
 
-        # Copy images to destination path
-        imgs_df.apply(lambda x: copyfile(x["Path"], x["Destination"]), axis=1)
+        # Copy images to destination path. Rows sharing a destination would
+        # overwrite each other, so only the last one is transferred
+        imgs_df = imgs_df.drop_duplicates("Destination", keep="last")
+        read_data = self.params.get("extract_image_data", False)
+        img_data = transfer_files(
+            imgs_df["Path"].tolist(),
+            imgs_df["Destination"].tolist(),
+            mode=self.params.get("copy_mode", "copy"),
+            workers=self.params.get("copy_workers", 8),
+            read_data=read_data,
+        )
+        if read_data:
+            img_data.index = dest.loc[imgs_df.index]
+            img_data_path = os.path.join(
+                self.output_path, self.params.get("image_datafile", "image_data.npz")
+            )
+            save_image_data(img_data, img_data_path)
 
         # Point dataframe to destination paths
         df["Path"] = dest
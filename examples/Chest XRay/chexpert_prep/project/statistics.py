@@ -14,6 +14,10 @@ class Stats:
         self.df = pd.read_csv(self.data_file)
         self.out_file = out_file
         self.labels = params["labels"]
+        self.img_data_file = os.path.join(
+            data_path, params.get("image_datafile", "image_data.npz")
+        )
+        self.workers = params.get("image_data_workers")
 
     def run(self):
         stats_df = self.df.describe()
@@ -33,7 +37,9 @@ class Stats:
 
         col_stats.update(cat_stats)
 
-        img_data = get_image_data_df(self.df, self.data_path).describe()
+        img_data = get_image_data_df(
+            self.df, self.data_path, self.img_data_file, self.workers
+        ).describe()
         pixel_cols = ["min", "max", "mean", "std"]
         cols_rename = {col: "pixels_" + col for col in pixel_cols}
         img_data = img_data.rename(cols_rename, axis=1)
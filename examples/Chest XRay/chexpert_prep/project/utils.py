@@ -1,27 +1,159 @@
+import io
 import os
+from shutil import copyfile
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
 from PIL import Image
 import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+IMAGE_DATA_COLS = ["width", "height", "min", "max", "mean", "std"]
+
+
+def get_image_data_df(df, data_path, data_file=None, workers=None):
+    """Retrieves image data for every row of df.
+
+    Image data is read from the npz sidecar at data_file when present.
+    Images missing from it are decoded in parallel, and the sidecar is
+    updated, so later tasks can reuse the results.
+
+    Args:
+        df (pd.DataFrame): prepared data, with image paths in the "Path" column
+        data_path (str): location of the prepared data
+        data_file (str, optional): path of the image data sidecar
+        workers (int, optional): number of processes used to decode images
+
+    Returns:
+        pd.DataFrame: image data, aligned with df
+    """
+    img_data = None
+    if data_file is not None and os.path.exists(data_file):
+        img_data = load_image_data(data_file)
 
+    paths = df["Path"]
+    missing = paths.drop_duplicates()
+    if img_data is not None:
+        missing = missing[~missing.isin(img_data.index)]
 
-def get_image_data_df(df, data_path):
-    img_df = df.apply(
-        lambda x: get_image_data(x["Path"], data_path), axis=1, result_type="expand"
-    )
-    img_df = img_df.rename(
-        {0: "width", 1: "height", 2: "min", 3: "max", 4: "mean", 5: "std"}, axis=1
-    )
+    if len(missing):
+        missing = missing.tolist()
+        get_data = partial(get_image_data, data_path=data_path)
+        chunksize = max(1, len(missing) // (4 * (workers or os.cpu_count() or 1)))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(get_data, missing, chunksize=chunksize))
+        new_data = pd.DataFrame(results, index=missing, columns=IMAGE_DATA_COLS)
+        img_data = new_data if img_data is None else pd.concat([img_data, new_data])
+        if data_file is not None:
+            save_image_data(img_data, data_file)
+
+    img_df = img_data.loc[paths.values, IMAGE_DATA_COLS]
+    img_df.index = df.index
     return img_df
 
 
 def get_image_data(img_path, data_path):
     img_path = os.path.join(data_path, img_path)
     with Image.open(img_path) as im:
-        img = np.array(im)
-        w, h = img.shape
-        min_val = img.min()
-        max_val = img.max()
-        mean_val = img.mean()
-        std_val = img.std()
+        return image_data(im)
+
+
+def image_data(im):
+    img = np.asarray(im)
+    w, h = img.shape
+    if img.dtype != np.uint8:
+        return [w, h, img.min(), img.max(), img.mean(), img.std()]
+
+    # 8-bit images are reduced to a histogram in a single pass, and every
+    # statistic is derived from the 256 bins
+    hist = np.bincount(img.ravel(), minlength=256)
+    values = np.nonzero(hist)[0]
+    levels = np.arange(256, dtype=np.float64)
+    mean_val = hist @ levels / img.size
+    std_val = np.sqrt(hist @ (levels - mean_val) ** 2 / img.size)
+
+    return [w, h, values[0], values[-1], mean_val, std_val]
+
+
+def save_image_data(img_df, out_file):
+    """Stores per-image data as a columnar npz sidecar. The index of
+    img_df must contain the image paths relative to the prepared data path
+    """
+    columns = {col: img_df[col].to_numpy() for col in IMAGE_DATA_COLS}
+    np.savez(out_file, Path=img_df.index.to_numpy(dtype=str), **columns)
+
+
+def load_image_data(data_file):
+    """Loads an image data sidecar created by save_image_data"""
+    with np.load(data_file) as data:
+        columns = {col: data[col] for col in IMAGE_DATA_COLS}
+        return pd.DataFrame(columns, index=data["Path"])
+
+
+def transfer_file(src, dest, mode="copy", read_data=False):
+    """Places src at dest.
+
+    Args:
+        src (str): path of the file to transfer
+        dest (str): destination path
+        mode (str): "copy" duplicates the file contents. "hardlink" links
+            dest to src, falling back to a copy when both paths are on
+            different filesystems.
+        read_data (bool): Whether to also return the image data of the
+            transferred file. The file is only read once.
+
+    Returns:
+        list: image data of the file if read_data is set, None otherwise
+    """
+    if mode == "hardlink":
+        if os.path.lexists(dest):
+            os.remove(dest)
+        try:
+            os.link(src, dest)
+            mode = "linked"
+        except OSError:
+            mode = "copy"
+
+    if not read_data:
+        if mode == "copy":
+            copyfile(src, dest)
+        return None
+
+    with open(src, "rb") as f:
+        content = f.read()
+    if mode == "copy":
+        with open(dest, "wb") as f:
+            f.write(content)
+    with Image.open(io.BytesIO(content)) as im:
+        return image_data(im)
+
+
+def transfer_files(srcs, dests, mode="copy", workers=8, read_data=False):
+    """Transfers files concurrently, reporting progress.
+
+    Args:
+        srcs (list): paths of the files to transfer
+        dests (list): destination paths, one per source
+        mode (str): transfer mode. See transfer_file
+        workers (int): number of threads doing the transfers
+        read_data (bool): Whether to extract image data in the same pass
 
-    return [w, h, min_val, max_val, mean_val, std_val]
+    Returns:
+        pd.DataFrame: image data indexed by destination if read_data is set,
+            None otherwise
+    """
+    transfer = lambda paths: transfer_file(*paths, mode=mode, read_data=read_data)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = list(
+            tqdm(
+                pool.map(transfer, zip(srcs, dests)),
+                total=len(srcs),
+                desc="Copying images",
+                unit="img",
+            )
+        )
 
+    if not read_data:
+        return None
+    return pd.DataFrame(results, index=dests, columns=IMAGE_DATA_COLS)
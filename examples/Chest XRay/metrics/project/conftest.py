@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The cube image copies the common modules next to the project code
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "..", "common"))
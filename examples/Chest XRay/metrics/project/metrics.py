@@ -1,8 +1,11 @@
 import argparse
 import yaml
+import numpy as np
 import pandas as pd
 from sklearn.metrics import roc_auc_score, f1_score
 
+from bootstrap import bootstrap_ci, bootstrap_params
+
 
 class AUC:
     @staticmethod
@@ -19,6 +22,189 @@ class F1:
         return results.tolist()
 
 
+class StreamingMetrics:
+    """Computes AUC and F1 incrementally over chunks of predictions.
+
+    For every class, scores are accumulated into fixed-width histograms,
+    one for positive and one for negative samples, from which AUC is
+    derived. Scores falling in the same bin count as ties, so AUC matches
+    the exact value within roughly 1 / bins. F1 is computed exactly from
+    accumulated confusion counts.
+
+    Args:
+        n_classes (int): number of label columns
+        bins (int): number of histogram bins used for AUC
+        score_range (tuple): expected range of prediction scores. Scores
+            outside of it are clipped
+    """
+
+    def __init__(self, n_classes, bins=100000, score_range=(0.0, 1.0)):
+        self.bins = bins
+        self.low, self.high = score_range
+        self.pos_hist = np.zeros((n_classes, bins), dtype=np.int64)
+        self.neg_hist = np.zeros((n_classes, bins), dtype=np.int64)
+        self.tp = np.zeros(n_classes, dtype=np.int64)
+        self.fp = np.zeros(n_classes, dtype=np.int64)
+        self.fn = np.zeros(n_classes, dtype=np.int64)
+
+    def update(self, labels, preds):
+        """Adds a chunk of paired labels and predictions
+
+        Args:
+            labels (np.ndarray): binary labels of shape (n_samples, n_classes)
+            preds (np.ndarray): prediction scores of shape (n_samples, n_classes)
+        """
+        labels = labels == 1
+        scaled = (preds - self.low) / (self.high - self.low) * self.bins
+        bin_ids = np.clip(scaled.astype(np.int64), 0, self.bins - 1)
+        # one bincount per histogram, covering all classes at once
+        offsets = np.arange(labels.shape[1]) * self.bins
+        bin_ids = bin_ids + offsets
+        size = self.pos_hist.size
+        self.pos_hist += np.bincount(bin_ids[labels], minlength=size).reshape(
+            self.pos_hist.shape
+        )
+        self.neg_hist += np.bincount(bin_ids[~labels], minlength=size).reshape(
+            self.neg_hist.shape
+        )
+
+        pred_labels = preds > 0.5
+        self.tp += (pred_labels & labels).sum(axis=0)
+        self.fp += (pred_labels & ~labels).sum(axis=0)
+        self.fn += (~pred_labels & labels).sum(axis=0)
+
+    def auc(self):
+        n_pos = self.pos_hist.sum(axis=1)
+        n_neg = self.neg_hist.sum(axis=1)
+        # negatives scored strictly lower than each bin
+        neg_below = np.cumsum(self.neg_hist, axis=1) - self.neg_hist
+        wins = (self.pos_hist * (neg_below + 0.5 * self.neg_hist)).sum(axis=1)
+        return (wins / (n_pos * n_neg)).tolist()
+
+    def f1(self):
+        denom = 2 * self.tp + self.fp + self.fn
+        f1 = np.divide(
+            2 * self.tp, denom, out=np.zeros(len(denom)), where=denom > 0
+        )
+        return f1.tolist()
+
+
+def bootstrap_data(labels, preds):
+    """Precomputes per-sample statistics used to bootstrap AUC and F1.
+
+    For AUC, samples of every class are sorted by score once and grouped
+    by tied scores. For F1, per-sample confusion indicators are stored.
+
+    Args:
+        labels (np.ndarray): binary labels of shape (n_samples, n_classes)
+        preds (np.ndarray): prediction scores of shape (n_samples, n_classes)
+
+    Returns:
+        dict: per-sample statistics for bootstrap_statistic
+    """
+    labels = np.asarray(labels) == 1
+    preds = np.asarray(preds, dtype=np.float64)
+    auc_data = []
+    for col in range(labels.shape[1]):
+        order = np.argsort(preds[:, col], kind="mergesort")
+        scores = preds[order, col]
+        tie_starts = np.flatnonzero(np.r_[True, scores[1:] != scores[:-1]])
+        auc_data.append((order, labels[order, col], tie_starts))
+
+    pred_labels = preds > 0.5
+    return {
+        "auc": auc_data,
+        "tp": (pred_labels & labels).astype(np.float64),
+        "fp": (pred_labels & ~labels).astype(np.float64),
+        "fn": (~pred_labels & labels).astype(np.float64),
+    }
+
+
+def bootstrap_statistic(weights, data):
+    """AUC and F1 of every bootstrap replicate
+
+    Args:
+        weights (np.ndarray): times each sample is drawn, of shape (replicates, n_samples)
+        data (dict): statistics returned by bootstrap_data
+
+    Returns:
+        np.ndarray: array of shape (replicates, 2, n_classes) with AUC and F1
+    """
+    weights = weights.astype(np.float64)
+    aucs = []
+    for order, labels, tie_starts in data["auc"]:
+        sorted_weights = weights[:, order]
+        pos = np.add.reduceat(sorted_weights * labels, tie_starts, axis=1)
+        neg = np.add.reduceat(sorted_weights * ~labels, tie_starts, axis=1)
+        neg_below = np.cumsum(neg, axis=1) - neg
+        wins = (pos * (neg_below + 0.5 * neg)).sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            aucs.append(wins / (pos.sum(axis=1) * neg.sum(axis=1)))
+
+    tp = weights @ data["tp"]
+    fp = weights @ data["fp"]
+    fn = weights @ data["fn"]
+    denom = 2 * tp + fp + fn
+    f1 = np.divide(2 * tp, denom, out=np.zeros_like(denom), where=denom > 0)
+    return np.stack([np.stack(aucs, axis=1), f1], axis=1)
+
+
+def streaming_evaluate(labels_csv, preds_csv, params):
+    """Computes metrics without loading the predictions in memory.
+
+    Labels are loaded once into a compact matrix together with an index
+    over their ids. Predictions are then read in chunks, joined to their
+    labels through that index and accumulated into StreamingMetrics.
+    Every label must have exactly one prediction: unknown, duplicated or
+    missing prediction ids raise a ValueError.
+
+    Args:
+        labels_csv (str): file containing the labels
+        preds_csv (str): file containing the predictions
+        params (dict): evaluation parameters
+
+    Returns:
+        tuple: list of label columns and the accumulated StreamingMetrics
+    """
+    label_cols = params["label columns"]
+    id_col = params["id column"]
+    chunksize = params["chunk size"]
+    select_cols = label_cols + [id_col]
+
+    ids = []
+    label_chunks = []
+    for chunk in pd.read_csv(labels_csv, usecols=select_cols, chunksize=chunksize):
+        ids.append(chunk[id_col].to_numpy())
+        label_chunks.append(chunk[label_cols].to_numpy(dtype=np.int8))
+    id_index = pd.Index(np.concatenate(ids))
+    if not id_index.is_unique:
+        raise ValueError(f"Values in the '{id_col}' column must be unique")
+    labels = np.concatenate(label_chunks)
+
+    metrics = StreamingMetrics(
+        len(label_cols),
+        bins=params.get("auc bins", 100000),
+        score_range=tuple(params.get("score range", (0.0, 1.0))),
+    )
+    seen = np.zeros(len(labels), dtype=bool)
+    for chunk in pd.read_csv(preds_csv, usecols=select_cols, chunksize=chunksize):
+        rows = id_index.get_indexer(chunk[id_col])
+        unknown = np.count_nonzero(rows < 0)
+        if unknown:
+            raise ValueError(f"{unknown} predictions have ids without labels")
+        repeated = np.count_nonzero(seen[rows]) + len(rows) - len(np.unique(rows))
+        if repeated:
+            raise ValueError(f"{repeated} predictions have duplicated ids")
+        seen[rows] = True
+        chunk_preds = chunk[label_cols].to_numpy(dtype=np.float64)
+        metrics.update(labels[rows], chunk_preds)
+
+    missing = np.count_nonzero(~seen)
+    if missing:
+        raise ValueError(f"{missing} labels have no matching prediction")
+    return label_cols, metrics
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -56,8 +242,18 @@ def main():
     with open(args.parameters_file, "r") as f:
         params = yaml.full_load(f)
 
-    labels = pd.read_csv(args.labels_csv)
-    preds = pd.read_csv(args.preds_csv)
+    if params.get("chunk size"):
+        results = run_streaming(args.labels_csv, args.preds_csv, params)
+    else:
+        results = run_in_memory(args.labels_csv, args.preds_csv, params)
+
+    with open(args.output_file, "w") as f:
+        yaml.dump(results, f)
+
+
+def run_in_memory(labels_csv, preds_csv, params):
+    labels = pd.read_csv(labels_csv)
+    preds = pd.read_csv(preds_csv)
 
     labels = reformat_data(labels, params)
     preds = reformat_data(preds, params)
@@ -74,8 +270,38 @@ def main():
         scores = {col: score for col, score in zip(cols, scores)}
         results[metric_name] = scores
 
-    with open(args.output_file, "w") as f:
-        yaml.dump(results, f)
+    config = bootstrap_params(params)
+    if config is not None:
+        data = bootstrap_data(labels.to_numpy(), preds.to_numpy())
+        lower, upper = bootstrap_ci(bootstrap_statistic, data, len(labels), **config)
+        results["bootstrap"] = {
+            "replicates": config["n_replicates"],
+            "confidence": config["confidence"],
+        }
+        for idx, metric_name in enumerate(["AUC", "F1"]):
+            if metric_name not in params["metrics"]:
+                continue
+            results["bootstrap"][metric_name] = {
+                col: [float(low), float(up)]
+                for col, low, up in zip(cols, lower[idx], upper[idx])
+            }
+    return results
+
+
+def run_streaming(labels_csv, preds_csv, params):
+    if bootstrap_params(params) is not None:
+        print("Bootstrap confidence intervals are not available in streaming mode")
+    cols, metrics = streaming_evaluate(labels_csv, preds_csv, params)
+    available_metrics = {
+        "AUC": metrics.auc,
+        "F1": metrics.f1,
+    }
+    results = {}
+    for metric_name in params["metrics"]:
+        scores = available_metrics[metric_name]()
+        scores = {col: score for col, score in zip(cols, scores)}
+        results[metric_name] = scores
+    return results
 
 
 def reformat_data(df, params):
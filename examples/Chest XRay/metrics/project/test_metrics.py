@@ -0,0 +1,118 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from sklearn.metrics import roc_auc_score, f1_score
+
+from bootstrap import bootstrap_ci
+from metrics import run_in_memory, run_streaming, bootstrap_data, bootstrap_statistic
+
+LABEL_COLS = ["Atelectasis", "Cardiomegaly", "Consolidation", "Edema"]
+
+
+def write_csvs(tmp_path, labels, preds, label_ids, pred_ids):
+    labels_csv = tmp_path / "labels.csv"
+    preds_csv = tmp_path / "preds.csv"
+    labels = pd.DataFrame(labels, columns=LABEL_COLS).assign(Path=label_ids)
+    preds = pd.DataFrame(preds, columns=LABEL_COLS).assign(Path=pred_ids)
+    labels.to_csv(labels_csv, index=False)
+    preds.to_csv(preds_csv, index=False)
+    return str(labels_csv), str(preds_csv)
+
+
+@pytest.fixture
+def params():
+    return {
+        "metrics": ["AUC", "F1"],
+        "label columns": LABEL_COLS,
+        "id column": "Path",
+        "chunk size": 37,
+        "bootstrap": {"replicates": 0},
+    }
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    n_samples = 500
+    labels = rng.integers(0, 2, (n_samples, len(LABEL_COLS)))
+    preds = np.clip(0.3 * labels + 0.7 * rng.random(labels.shape), 0, 1)
+    ids = np.array([f"img_{i}.png" for i in range(n_samples)])
+    return labels, preds, ids
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_streaming_matches_in_memory(tmp_path, params, data, seed):
+    # Arrange
+    labels, preds, ids = data
+    # predictions may come in any order
+    order = np.random.default_rng(seed).permutation(len(ids))
+    files = write_csvs(tmp_path, labels, preds[order], ids, ids[order])
+
+    # Act
+    expected = run_in_memory(*files, params)
+    results = run_streaming(*files, params)
+
+    # Assert
+    for metric_name in params["metrics"]:
+        for col in LABEL_COLS:
+            exp_value = expected[metric_name][col]
+            assert results[metric_name][col] == pytest.approx(exp_value, abs=1e-4)
+
+
+@pytest.mark.parametrize(
+    "pred_rows,pred_ids",
+    [
+        # unknown id
+        (slice(None), lambda ids: np.r_[ids[:-1], ["unknown.png"]]),
+        # duplicated id in another chunk
+        (slice(None), lambda ids: np.r_[ids[:-1], ids[:1]]),
+        # missing prediction
+        (slice(1, None), lambda ids: ids[1:]),
+    ],
+)
+def test_streaming_rejects_mismatched_ids(tmp_path, params, data, pred_rows, pred_ids):
+    # Arrange
+    labels, preds, ids = data
+    files = write_csvs(tmp_path, labels, preds[pred_rows], ids, pred_ids(ids))
+
+    # Act & Assert
+    with pytest.raises(ValueError):
+        run_streaming(*files, params)
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_bootstrap_statistic_matches_sklearn_on_resampled_data(data, seed):
+    # Arrange
+    labels, preds, _ = data
+    # coarse scores, so that resampled data has ties
+    preds = np.round(preds, 2)
+    rng = np.random.default_rng(seed)
+    samples = rng.integers(0, len(labels), (5, len(labels)))
+    weights = np.stack([np.bincount(s, minlength=len(labels)) for s in samples])
+
+    # Act
+    values = bootstrap_statistic(weights, bootstrap_data(labels, preds))
+
+    # Assert
+    for replicate, sample in enumerate(samples):
+        exp_auc = roc_auc_score(labels[sample], preds[sample], average=None)
+        exp_f1 = f1_score(labels[sample], preds[sample] > 0.5, average=None)
+        assert values[replicate, 0] == pytest.approx(exp_auc)
+        assert values[replicate, 1] == pytest.approx(exp_f1)
+
+
+def test_bootstrap_ci_doesnt_depend_on_workers(data):
+    # Arrange
+    labels, preds, _ = data
+    stats = bootstrap_data(labels, preds)
+
+    # Act
+    intervals = [
+        bootstrap_ci(bootstrap_statistic, stats, len(labels), 250, workers=workers)
+        for workers in [1, 2]
+    ]
+
+    # Assert
+    for single, parallel in zip(*intervals):
+        np.testing.assert_array_equal(single, parallel)
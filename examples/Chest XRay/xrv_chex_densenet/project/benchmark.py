@@ -0,0 +1,57 @@
+import time
+import torch
+from torch.utils.data import DataLoader, Dataset
+import typer
+
+import models
+
+app = typer.Typer()
+
+
+class SyntheticDataset(Dataset):
+    """Random single-channel images mimicking normalized XRVDataset samples"""
+
+    def __init__(self, size, resolution):
+        self.size = size
+        self.resolution = resolution
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, idx):
+        img = torch.rand(1, self.resolution, self.resolution) * 2048 - 1024
+        return img, str(idx)
+
+
+def throughput(model, loader):
+    """Returns images per second processed by the model over the loader"""
+    n_imgs = 0
+    start = time.perf_counter()
+    with torch.inference_mode():
+        for imgs, _ in loader:
+            model(imgs)
+            n_imgs += len(imgs)
+    return n_imgs / (time.perf_counter() - start)
+
+
+@app.command()
+def benchmark(
+    n_imgs: int = typer.Option(256, "--n_imgs"),
+    resolution: int = typer.Option(320, "--resolution"),
+    batch_sizes: str = typer.Option("1,8,16,32", "--batch_sizes"),
+    num_workers: int = typer.Option(2, "--num_workers"),
+    threads: int = typer.Option(0, "--threads"),
+):
+    if threads > 0:
+        torch.set_num_threads(threads)
+    model = models.DenseNet(num_classes=13)
+    model.eval()
+    data = SyntheticDataset(n_imgs, resolution)
+
+    for batch_size in [int(bs) for bs in batch_sizes.split(",")]:
+        loader = DataLoader(data, batch_size=batch_size, num_workers=num_workers)
+        print(f"batch_size={batch_size}: {throughput(model, loader):.1f} images/sec")
+
+
+if __name__ == "__main__":
+    app()
@@ -1,6 +1,9 @@
 from torch.utils.data import Dataset
+import torch
+import torch.nn.functional as F
 import numpy as np
 import collections
+from collections import OrderedDict
 import os
 import pprint
 import pandas as pd
@@ -42,18 +45,100 @@ def normalize(img, maxval, reshape=False):
     img = (2 * (img.astype(np.float32) / maxval) - 1.0) * 1024
 
     if reshape:
-        # Check that images are 2D arrays
-        if len(img.shape) > 2:
-            img = img[:, :, 0]
-        if len(img.shape) < 2:
-            print("error, dimension lower than 2 for image")
-
-        # add color channel
-        img = img[None, :, :]
+        img = add_channel(img)
 
     return img
 
 
+def add_channel(img):
+    """Turns an image into a single-channel (1, H, W) array"""
+    # Check that images are 2D arrays
+    if len(img.shape) > 2:
+        img = img[:, :, 0]
+    if len(img.shape) < 2:
+        print("error, dimension lower than 2 for image")
+
+    # add color channel
+    return img[None, :, :]
+
+
+def normalize_batch(imgs, maxval):
+    """Scales a batch of images to be roughly [-1024 1024].
+
+    Vectorized version of normalize, taking either a numpy array or a
+    torch tensor holding the whole batch.
+    """
+
+    if torch.is_tensor(imgs):
+        imgs = imgs.to(torch.float32)
+    else:
+        imgs = imgs.astype(np.float32)
+
+    max_val = imgs.max()
+    if max_val > maxval:
+        raise Exception(
+            "max image value ({}) higher than expected bound ({}).".format(
+                max_val, maxval
+            )
+        )
+
+    return (2 * (imgs / maxval) - 1.0) * 1024
+
+
+def collate_samples(samples, resolution=224, maxval=255):
+    """Collates XRVDataset samples into an image batch and their paths.
+    Samples must hold raw integer images (XRVDataset with normalize_imgs=False),
+    which are normalized as a batch. Images of different sizes are resized
+    to the model's native resolution, as the model would do for each of
+    them individually."""
+    imgs = [torch.from_numpy(sample["img"]) for sample in samples]
+    paths = [sample["Path"] for sample in samples]
+    for img in imgs:
+        if img.dtype.is_floating_point or img.dtype.is_complex or img.dtype == torch.bool:
+            raise Exception(
+                "collate_samples expects raw integer images, got {}. "
+                "Load them with normalize_imgs=False".format(img.dtype)
+            )
+    if all(img.shape == imgs[0].shape for img in imgs):
+        batch = normalize_batch(torch.stack(imgs), maxval)
+        return batch, paths
+
+    batch = []
+    for img in imgs:
+        img = normalize_batch(img, maxval)
+        img = F.interpolate(
+            img[None], size=(resolution, resolution), mode="bilinear", align_corners=False
+        )
+        batch.append(img[0])
+    return torch.stack(batch), paths
+
+
+class ImageCache:
+    """LRU cache for decoded images, bounded by their total size in bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.images = OrderedDict()
+
+    def get(self, key):
+        img = self.images.get(key)
+        if img is not None:
+            self.images.move_to_end(key)
+        return img
+
+    def put(self, key, img):
+        if img.nbytes > self.max_bytes:
+            return
+        if key in self.images:
+            self.nbytes -= self.images.pop(key).nbytes
+        self.images[key] = img
+        self.nbytes += img.nbytes
+        while self.nbytes > self.max_bytes:
+            _, evicted = self.images.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+
 class Dataset:
     def __init__(self):
         pass
@@ -79,7 +164,24 @@ class Dataset:
 
 
 class XRVDataset(Dataset):
-    def __init__(self, datapath, transform=None, seed=0):
+    """CheXpert-like dataset prepared by the data preparation cube.
+
+    Args:
+        datapath: location of the prepared data
+        transform: optional transform applied to every image
+        seed: random seed
+        normalize_imgs: whether to normalize images. If False, images are
+            returned as uint8 arrays of shape (1, H, W), so they can be
+            normalized later as a batch with normalize_batch
+        cache_bytes: size of an LRU cache of decoded images. The cache
+            lives in the process loading the images and isn't persisted:
+            DataLoader workers each fill their own copy, discarded after
+            every pass, so it only helps when iterating again in the same
+            process (num_workers=0 or persistent workers). A single
+            inference pass doesn't benefit from it. 0 disables caching
+    """
+
+    def __init__(self, datapath, transform=None, seed=0, normalize_imgs=True, cache_bytes=0):
         super(XRVDataset, self).__init__()
         np.random.seed(seed)
         self.imgpath = datapath
@@ -105,6 +207,10 @@ class XRVDataset(Dataset):
 
         self.check_paths_exist()
         self.csv = pd.read_csv(self.csvpath)
+        self.paths = self.csv["Path"].to_numpy()
+        self.labels = self.csv.drop(["Path"], axis=1).to_numpy()
+        self.normalize_imgs = normalize_imgs
+        self.cache = ImageCache(cache_bytes) if cache_bytes > 0 else None
 
     def string(self):
         return self.__class__.__name__ + " num_samples={}".format(len(self))
@@ -116,14 +222,15 @@ class XRVDataset(Dataset):
 
         sample = {}
         sample["idx"] = idx
-        sample["Path"] = self.csv["Path"].iloc[idx]
-        sample["lab"] = self.csv.drop(["Path"], axis=1).iloc[idx].values
+        sample["Path"] = self.paths[idx]
+        sample["lab"] = self.labels[idx]
 
-        imgid = self.csv["Path"].iloc[idx]
-        img_path = os.path.join(self.imgpath, imgid)
-        img = imread(img_path)
+        img = self.load_image(idx)
 
-        sample["img"] = normalize(img, maxval=255, reshape=True)
+        if self.normalize_imgs:
+            sample["img"] = normalize(img, maxval=255, reshape=True)
+        else:
+            sample["img"] = add_channel(img)
 
         transform_seed = np.random.randint(2147483647)
 
@@ -132,3 +239,16 @@ class XRVDataset(Dataset):
             sample["img"] = self.transform(sample["img"])
 
         return sample
+
+    def load_image(self, idx):
+        if self.cache is not None:
+            img = self.cache.get(idx)
+            if img is not None:
+                return img
+
+        img_path = os.path.join(self.imgpath, self.paths[idx])
+        img = imread(img_path)
+
+        if self.cache is not None:
+            self.cache.put(idx, img)
+        return img
@@ -1,5 +1,5 @@
 import os
-import pandas as pd
+import csv
 import torch
 import torchxrayvision as xrv
 from torch.utils.data import DataLoader
@@ -7,7 +7,7 @@ import typer
 import yaml
 from tqdm import tqdm
 
-from data.dataset import XRVDataset
+from data.dataset import XRVDataset, collate_samples
 import models
 
 xrv.models = models
@@ -32,16 +32,42 @@ class XRVInference(object):
             print("The specified model couldn't be found")
             exit()
 
-        preds = []
-        data = XRVDataset(data_path)
-        with torch.no_grad():
-            for sample in tqdm(data):
-                out = model(torch.from_numpy(sample["img"]).unsqueeze(0))
-                preds.append([sample["Path"]] + out.tolist()[0])
+        threads = params.get("threads", 0)
+        if threads > 0:
+            torch.set_num_threads(threads)
 
-        pred_cols = ["Path"] + model.pathologies
-        preds_df = pd.DataFrame(data=preds, columns=pred_cols)
-        preds_df.to_csv(out_path, index=False)
+        data = XRVDataset(
+            data_path,
+            normalize_imgs=False,
+            cache_bytes=params.get("cache_bytes", 0),
+        )
+        loader = DataLoader(
+            data,
+            batch_size=params.get("batch_size", 16),
+            num_workers=params.get("num_workers", 0),
+            collate_fn=collate_samples,
+        )
+        XRVInference.predict(model, loader, out_path)
+
+    @staticmethod
+    def predict(model, loader, out_path):
+        """Runs the model over every batch of the loader, streaming
+        predictions into a csv file
+
+        Args:
+            model: model used for inference
+            loader: DataLoader yielding (images, paths) batches
+            out_path: csv file to write the predictions to
+        """
+        model.eval()
+        with open(out_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Path"] + model.pathologies)
+            with torch.inference_mode():
+                for imgs, paths in tqdm(loader):
+                    out = model(imgs)
+                    for path, row in zip(paths, out.tolist()):
+                        writer.writerow([path] + row)
 
 
 @app.command("infer")
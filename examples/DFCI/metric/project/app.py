@@ -25,42 +25,65 @@ import time
 from typing import List
 
 import metric_utils
-from metric_utils import dice_coef_multilabel, dice_coef
+from metric_utils import dice_coef_multilabel, dice_coef, DiceAccumulator, case_id, bootstrap_dice
+from bootstrap import bootstrap_ci, bootstrap_params
+from predictions import PredictionReader
 import yaml
 # Define PyTorch Dataloader
 class CTScanDataset(Dataset):
     """
     KAGGLE dataset.
     Accredit to https://pytorch.org/tutorials/beginner/data_loading_tutorial.html
+
+    Slices are opened as copy-on-write memory maps, so only the pages that
+    are actually used get read from disk, and features and labels are
+    returned without copies whenever they are already stored in the
+    expected dtype.
     """
 
-    def __init__(self, data_dir, transform=None):
+    def __init__(self, data_dir, transform=None, feature_dtype='float32', label_dtype='int8'):
         """
         Args:
             data_dir: data folder directory
             transform (callable, optional): Optional transform to be applied
                 on a sample.
+            feature_dtype: dtype of the returned features
+            label_dtype: dtype of the returned labels
         """
         self.root_dir = data_dir
-        self.files = os.listdir(data_dir)
+        # list the folder once. The sorted listing is reused by every
+        # worker and gives a stable order across cubes
+        with os.scandir(data_dir) as entries:
+            self.files = sorted(
+                entry.name for entry in entries
+                if entry.is_file() and entry.name.endswith('.npy')
+            )
+        self.paths = [os.path.join(data_dir, fn) for fn in self.files]
         self.transform = transform
+        self.feature_dtype = np.dtype(feature_dtype)
+        self.label_dtype = np.dtype(label_dtype)
 
     def __len__(self):
         return len(self.files)
 
+    @staticmethod
+    def _to_tensor(array, dtype):
+        if array.dtype == dtype:
+            # views of a copy-on-write memmap are writable, so torch can
+            # share their memory instead of copying
+            return torch.from_numpy(array)
+        return torch.from_numpy(array.astype(dtype))
+
     def __getitem__(self, idx):
         if torch.is_tensor(idx):
             idx = idx.tolist()
-        
-        # file_path = os.path.join(self.root_dir, self.files[idx])
 
-        with open(os.path.join(self.root_dir, self.files[idx]), 'rb') as f:
-            data = np.load(f)
-            feature = data[:-1, :, :].astype('float32')
-            label = data[-1, :, :].astype('int8')
+        data = np.load(self.paths[idx], mmap_mode='c')
+        feature = self._to_tensor(data[:-1, :, :], self.feature_dtype)
+        label = self._to_tensor(data[-1, :, :], self.label_dtype)
 
         if self.transform:
-            sample = self.transform(sample)
+            feature = self.transform(feature)
 
         return feature, label
     
@@ -89,25 +112,26 @@ def unet_metrics(images_path, preds, output):
     dice_class0_avg = 0
     dice_class1_avg = 0
     
-    included_extensions = ['.npy']
-    file_names = [fn for fn in os.listdir(preds)
-              if any(fn.endswith(ext) for ext in included_extensions)]
+    dice_acc = DiceAccumulator(numLabels=2)
+    predictions = PredictionReader(preds)
+    file_names = test_dataset.files
 
-    print('ap', file_names)
     idx = 0
     with torch.no_grad():
         for data in testloader:
             images, targets = data
             images, targets = images.to(device=device, dtype=torch.float), targets.to(device=device)
+            target_labels = targets
             targets = F.one_hot(targets.long(), num_classes=2)
             targets = torch.permute(targets, (0, 3, 1, 2))
             # outputs = net(images)
-            labels = torch.load(os.path.join(preds, file_names[idx]))
-            labels = torch.unsqueeze(labels, 0)
-            print("labels", labels)
+            labels = predictions[file_names[idx]]
+            labels = torch.unsqueeze(labels, 0).to(device=device)
             loss += criterion(labels, targets.float()).item()
 
-            outputs_cat = F.one_hot(torch.argmax(labels, axis=1), num_classes=2)
+            pred_labels = torch.argmax(labels, axis=1)
+            dice_acc.update(target_labels, pred_labels, [case_id(file_names[idx])])
+            outputs_cat = F.one_hot(pred_labels, num_classes=2)
             outputs_cat = torch.permute(outputs_cat, (0, 3, 1, 2))
 
             dice_avg, dice_class = dice_coef_multilabel(targets, outputs_cat, numLabels=2)
@@ -120,7 +144,7 @@ def unet_metrics(images_path, preds, output):
     dice_class0_avg /= len(testloader)
     dice_class1_avg /= len(testloader)
 
-    return loss, dice_total_avg, dice_class0_avg, dice_class1_avg
+    return loss, dice_total_avg, dice_class0_avg, dice_class1_avg, dice_acc
 
 
 if __name__ == '__main__':
@@ -156,7 +180,10 @@ if __name__ == '__main__':
     args = parser.parse_args()
 
 
-    loss, dice_total_avg, dice_class0_avg, dice_class1_avg = unet_metrics(args.labels_csv, args.preds_csv, args.output_file)
+    with open(args.parameters_file, "r") as f:
+        params = yaml.safe_load(f) or {}
+
+    loss, dice_total_avg, dice_class0_avg, dice_class1_avg, dice_acc = unet_metrics(args.labels_csv, args.preds_csv, args.output_file)
     list_vals = [loss, dice_total_avg, dice_class0_avg, dice_class1_avg]
 
     
@@ -168,6 +195,27 @@ if __name__ == '__main__':
         results[metric_name] = list_vals[idx]
         idx += 1
 
+    # exact, voxel-weighted scores over the whole dataset and per case
+    dice = dice_acc.dice()
+    case_dice = dice_acc.case_dice()
+    results['dice_total'] = float(dice.mean())
+    for label, value in enumerate(dice):
+        results[f'dice_class{label}'] = float(value)
+    results['dice_case_avg'] = float(np.mean([d.mean() for d in case_dice.values()])) if case_dice else 0.
+    if params.get('report_per_case', False):
+        results['dice_per_case'] = {case: float(d.mean()) for case, d in case_dice.items()}
+
+    config = bootstrap_params(params)
+    if config is not None and case_dice:
+        lower, upper = bootstrap_ci(bootstrap_dice, dice_acc.case_confusion, len(case_dice), **config)
+        names = ['dice_total'] + [f'dice_class{label}' for label in range(len(dice))]
+        results['bootstrap'] = {
+            'replicates': config['n_replicates'],
+            'confidence': config['confidence'],
+        }
+        for name, low, up in zip(names, lower, upper):
+            results['bootstrap'][name] = [float(low), float(up)]
+
     with open(args.output_file, "w") as f:
         yaml.dump(results, f)
         
@@ -0,0 +1,59 @@
+# Dice Benchmark
+#
+# Compares the per-batch, per-label Dice loop against the streaming
+# DiceAccumulator on synthetic label volumes. Not used by the MLCube.
+import argparse
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from metric_utils import dice_coef_multilabel, DiceAccumulator
+
+
+def synthetic_volumes(cases, slices, size, num_labels, seed):
+    """Yields (case, true, pred) batches where each batch is a full case"""
+    rng = np.random.default_rng(seed)
+    for case in range(cases):
+        true = rng.integers(0, num_labels, size=(slices, size, size))
+        noise = rng.random((slices, size, size)) < 0.1
+        pred = np.where(noise, rng.integers(0, num_labels, size=true.shape), true)
+        yield str(case), torch.from_numpy(true), torch.from_numpy(pred)
+
+
+def loop_dice(batches, num_labels):
+    dice_total = 0
+    for _, true, pred in batches:
+        true_1h = torch.permute(F.one_hot(true.long(), num_classes=num_labels), (0, 3, 1, 2))
+        pred_1h = torch.permute(F.one_hot(pred.long(), num_classes=num_labels), (0, 3, 1, 2))
+        dice_avg, _ = dice_coef_multilabel(true_1h, pred_1h, numLabels=num_labels)
+        dice_total += dice_avg.item()
+    return dice_total / len(batches)
+
+
+def accumulated_dice(batches, num_labels):
+    acc = DiceAccumulator(numLabels=num_labels)
+    for case, true, pred in batches:
+        acc.update(true, pred, [case] * len(true))
+    return acc.dice().mean()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser("DFCI Dice benchmark")
+    parser.add_argument('--cases', type=int, default=10, help="number of synthetic cases")
+    parser.add_argument('--slices', type=int, default=32, help="slices per case")
+    parser.add_argument('--size', type=int, default=512, help="slice height and width")
+    parser.add_argument('--labels', type=int, default=2, help="number of classes")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    batches = list(synthetic_volumes(args.cases, args.slices, args.size, args.labels, args.seed))
+    voxels = args.cases * args.slices * args.size * args.size
+
+    for name, fn in [("per-label loop", loop_dice), ("accumulator", accumulated_dice)]:
+        start = time.perf_counter()
+        dice = fn(batches, args.labels)
+        elapsed = time.perf_counter() - start
+        print("{:>15}: dice={:.6f} time={:.3f}s ({:.1f} Mvoxels/s)".format(
+            name, dice, elapsed, voxels / elapsed / 1e6))
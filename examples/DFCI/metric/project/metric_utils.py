@@ -3,58 +3,66 @@
 # =======================================================
 
 import os
-import matplotlib.pyplot as plt
-#import cv2
 
-from PIL import Image
 import numpy as np
-import nibabel as nib
-
-# !pip install -q torch_snippets pytorch_model_summary
-#from torch_snippets import *
-from torchvision import transforms
-#from sklearn.model_selection import train_test_split
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset
 import torch
 import torch.nn as nn
-import torch.nn.functional as F
-from torchvision.models import vgg16_bn
-import time
-from typing import List
 
 class CTScanDataset(Dataset):
     """
     KAGGLE dataset.
     Accredit to https://pytorch.org/tutorials/beginner/data_loading_tutorial.html
+
+    Slices are opened as copy-on-write memory maps, so only the pages that
+    are actually used get read from disk, and features and labels are
+    returned without copies whenever they are already stored in the
+    expected dtype.
     """
 
-    def __init__(self, data_dir, transform=None):
+    def __init__(self, data_dir, transform=None, feature_dtype='float32', label_dtype='int8'):
         """
         Args:
             data_dir: data folder directory
             transform (callable, optional): Optional transform to be applied
                 on a sample.
+            feature_dtype: dtype of the returned features
+            label_dtype: dtype of the returned labels
         """
         self.root_dir = data_dir
-        self.files = os.listdir(data_dir)
+        # list the folder once. The sorted listing is reused by every
+        # worker and gives a stable order across cubes
+        with os.scandir(data_dir) as entries:
+            self.files = sorted(
+                entry.name for entry in entries
+                if entry.is_file() and entry.name.endswith('.npy')
+            )
+        self.paths = [os.path.join(data_dir, fn) for fn in self.files]
         self.transform = transform
+        self.feature_dtype = np.dtype(feature_dtype)
+        self.label_dtype = np.dtype(label_dtype)
 
     def __len__(self):
         return len(self.files)
 
+    @staticmethod
+    def _to_tensor(array, dtype):
+        if array.dtype == dtype:
+            # views of a copy-on-write memmap are writable, so torch can
+            # share their memory instead of copying
+            return torch.from_numpy(array)
+        return torch.from_numpy(array.astype(dtype))
+
     def __getitem__(self, idx):
         if torch.is_tensor(idx):
             idx = idx.tolist()
-        
-        # file_path = os.path.join(self.root_dir, self.files[idx])
 
-        with open(os.path.join(self.root_dir, self.files[idx]), 'rb') as f:
-            data = np.load(f)
-            feature = data[:-1, :, :].astype('float32')
-            label = data[-1, :, :].astype('int8')
+        data = np.load(self.paths[idx], mmap_mode='c')
+        feature = self._to_tensor(data[:-1, :, :], self.feature_dtype)
+        label = self._to_tensor(data[-1, :, :], self.label_dtype)
 
         if self.transform:
-            sample = self.transform(sample)
+            feature = self.transform(feature)
 
         return feature, label
 
@@ -115,3 +123,100 @@ def dice_coef_multilabel(y_true, y_pred, numLabels):
         dice_classes.append(dice_class)
     return dice/numLabels, dice_classes
 
+
+def case_id(file_name):
+    """Returns the case a slice belongs to. Prepared slices are named
+    `<case>_<slice>.npy`"""
+    return os.path.splitext(file_name)[0].rsplit('_', 1)[0]
+
+
+def dice_from_confusion(confusion):
+    """Dice per class from a (true, pred) confusion matrix. Classes absent
+    from both the labels and the predictions score 1, as with smoothing"""
+    confusion = np.asarray(confusion, dtype=np.float64)
+    intersection = np.diagonal(confusion, axis1=-2, axis2=-1)
+    cardinality = confusion.sum(axis=-1) + confusion.sum(axis=-2)
+    dice = np.ones_like(intersection)
+    np.divide(2. * intersection, cardinality, out=dice, where=cardinality > 0)
+    return dice
+
+
+class DiceAccumulator:
+    """
+    Streaming multi-label Dice.
+
+    Every batch is reduced to a confusion matrix with a single bincount
+    over `case * numLabels**2 + true * numLabels + pred`, so all classes
+    and all cases in the batch are counted at once. Matrices are summed
+    across batches, which makes the dataset-level Dice exact (weighted by
+    voxels) instead of an average of per-batch scores. Per-case matrices
+    are kept in a list, and only stacked when case_confusion is read.
+
+    Args:
+        numLabels: number of classes in the label maps
+    """
+
+    def __init__(self, numLabels):
+        self.numLabels = numLabels
+        self.confusion = np.zeros((numLabels, numLabels), dtype=np.int64)
+        self.case_index = {}
+        self.case_rows = []
+
+    def update(self, y_true, y_pred, cases):
+        """Adds a batch of label maps
+
+        Args:
+            y_true: integer tensor of shape (batch, ...) with the ground truth
+            y_pred: integer tensor of shape (batch, ...) with the predicted labels
+            cases: case id of every sample in the batch
+        """
+        n = self.numLabels
+        for case in cases:
+            if case not in self.case_index:
+                self.case_index[case] = len(self.case_rows)
+                self.case_rows.append(np.zeros((n, n), dtype=np.int64))
+
+        batch_cases = sorted(set(cases), key=cases.index)
+        local = {case: i for i, case in enumerate(batch_cases)}
+        offsets = torch.tensor([local[case] * n * n for case in cases], device=y_true.device)
+        offsets = offsets.view((-1,) + (1,) * (y_true.dim() - 1))
+        codes = offsets + y_true.long() * n + y_pred.long()
+        counts = torch.bincount(codes.flatten(), minlength=len(batch_cases) * n * n)
+        counts = counts.cpu().numpy().reshape(len(batch_cases), n, n)
+
+        for case, case_counts in zip(batch_cases, counts):
+            self.case_rows[self.case_index[case]] += case_counts
+        self.confusion += counts.sum(axis=0)
+
+    @property
+    def case_confusion(self):
+        """Per-case confusion matrices, of shape (cases, numLabels, numLabels)"""
+        if not self.case_rows:
+            return np.zeros((0, self.numLabels, self.numLabels), dtype=np.int64)
+        return np.stack(self.case_rows)
+
+    def dice(self):
+        """Dataset-level Dice per class"""
+        return dice_from_confusion(self.confusion)
+
+    def case_dice(self):
+        """Dice per class for every case"""
+        per_case = dice_from_confusion(self.case_confusion)
+        return {case: per_case[i] for case, i in self.case_index.items()}
+
+
+def bootstrap_dice(weights, case_confusion):
+    """Dataset-level Dice of every bootstrap replicate, resampling cases
+
+    Args:
+        weights: times each case is drawn, of shape (replicates, cases)
+        case_confusion: per-case confusion matrices, of shape (cases, numLabels, numLabels)
+
+    Returns:
+        array of shape (replicates, numLabels + 1), with the mean Dice
+        followed by the Dice of every class
+    """
+    cases, n, _ = case_confusion.shape
+    summed = weights @ case_confusion.reshape(cases, -1)
+    dice = dice_from_confusion(summed.reshape(-1, n, n))
+    return np.concatenate([dice.mean(axis=1, keepdims=True), dice], axis=1)
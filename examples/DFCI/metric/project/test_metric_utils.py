@@ -0,0 +1,63 @@
+import pytest
+import numpy as np
+
+torch = pytest.importorskip("torch")
+
+import torch.nn.functional as F
+from metric_utils import DiceAccumulator, dice_coef_multilabel
+
+NUM_LABELS = 2
+
+
+def synthetic_cases(seed, n_cases=4, shape=(16, 16)):
+    rng = np.random.default_rng(seed)
+    cases = []
+    for case in range(n_cases):
+        n_slices = int(rng.integers(1, 6))
+        labels = rng.random((n_slices, *shape)) < rng.random()
+        flips = rng.random((n_slices, *shape)) < 0.2
+        cases.append((f"case{case}", torch.from_numpy(labels), torch.from_numpy(labels ^ flips)))
+    return cases
+
+
+def one_hot(labels):
+    return torch.permute(F.one_hot(labels.long(), NUM_LABELS), (0, 3, 1, 2))
+
+
+def per_case_dice(y_true, y_pred):
+    # previous computation: Dice per class over the one-hot volume of a case
+    _, dice_classes = dice_coef_multilabel(one_hot(y_true), one_hot(y_pred), NUM_LABELS)
+    return np.array([dice.item() for dice in dice_classes])
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("batch_size", [1, 3])
+def test_dice_accumulator_matches_per_case_dice(seed, batch_size):
+    # Arrange
+    cases = synthetic_cases(seed)
+    y_true = torch.cat([labels for _, labels, _ in cases])
+    y_pred = torch.cat([preds for _, _, preds in cases])
+    slice_cases = [case for case, labels, _ in cases for _ in range(len(labels))]
+    acc = DiceAccumulator(NUM_LABELS)
+
+    # Act
+    for start in range(0, len(slice_cases), batch_size):
+        end = start + batch_size
+        acc.update(y_true[start:end], y_pred[start:end], slice_cases[start:end])
+
+    # Assert
+    case_dice = acc.case_dice()
+    assert list(case_dice) == [case for case, _, _ in cases]
+    for case, labels, preds in cases:
+        assert case_dice[case] == pytest.approx(per_case_dice(labels, preds), abs=1e-4)
+    assert acc.dice() == pytest.approx(per_case_dice(y_true, y_pred), abs=1e-4)
+    assert acc.case_confusion.shape == (len(cases), NUM_LABELS, NUM_LABELS)
+
+
+def test_dice_accumulator_without_cases():
+    # Act
+    acc = DiceAccumulator(NUM_LABELS)
+
+    # Assert
+    assert acc.case_confusion.shape == (0, NUM_LABELS, NUM_LABELS)
+    assert acc.case_dice() == {}
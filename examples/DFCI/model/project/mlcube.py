@@ -38,7 +38,7 @@ def infer(
     print("out p", out_path)
     
     with open(params_file, "r") as f:
-        params = yaml.safe_load(f)
+        params = yaml.safe_load(f) or {}
 
     model_file = os.path.join(model_info, "unet_full.pth")
     
@@ -50,6 +50,9 @@ def infer(
     # data, additional files, output
     #cmd = f"python3 app.py --data_p = {data_path} --model_info={model_file} --out={out_path}"
     cmd = f"python3 app.py --names={names_file} --model_info={model_file} --out={out_path}"
+    for param in ["batch_size", "num_workers", "threads", "output_format", "shard_size"]:
+        if param in params:
+            cmd += f" --{param}={params[param]}"
     print("cmd")
     #if uppercase:
     #    cmd += f" --uppercase={uppercase}"
@@ -26,6 +26,7 @@ from typing import List
 
 import UNet
 from UNet import dice_coef_multilabel, dice_coef
+from predictions import PredictionWriter
 import monai
 
 # Define PyTorch Dataloader
@@ -33,92 +34,110 @@ class CTScanDataset(Dataset):
     """
     KAGGLE dataset.
     Accredit to https://pytorch.org/tutorials/beginner/data_loading_tutorial.html
+
+    Slices are opened as copy-on-write memory maps, so only the pages that
+    are actually used get read from disk, and features and labels are
+    returned without copies whenever they are already stored in the
+    expected dtype.
     """
 
-    def __init__(self, data_dir, transform=None):
+    def __init__(self, data_dir, transform=None, feature_dtype='float32', label_dtype='int8'):
         """
         Args:
             data_dir: data folder directory
             transform (callable, optional): Optional transform to be applied
                 on a sample.
+            feature_dtype: dtype of the returned features
+            label_dtype: dtype of the returned labels
         """
         self.root_dir = data_dir
-        self.files = os.listdir(data_dir)
-        #print("self files:", self.files)
+        # list the folder once. The sorted listing is reused by every
+        # worker and gives a stable order across cubes
+        with os.scandir(data_dir) as entries:
+            self.files = sorted(
+                entry.name for entry in entries
+                if entry.is_file() and entry.name.endswith('.npy')
+            )
+        self.paths = [os.path.join(data_dir, fn) for fn in self.files]
         self.transform = transform
+        self.feature_dtype = np.dtype(feature_dtype)
+        self.label_dtype = np.dtype(label_dtype)
 
     def __len__(self):
         return len(self.files)
 
+    @staticmethod
+    def _to_tensor(array, dtype):
+        if array.dtype == dtype:
+            # views of a copy-on-write memmap are writable, so torch can
+            # share their memory instead of copying
+            return torch.from_numpy(array)
+        return torch.from_numpy(array.astype(dtype))
+
     def __getitem__(self, idx):
         if torch.is_tensor(idx):
             idx = idx.tolist()
-        
-        # file_path = os.path.join(self.root_dir, self.files[idx])
 
-        with open(os.path.join(self.root_dir, self.files[idx]), 'rb') as f:
-            data = np.load(f)
-            feature = data[:-1, :, :].astype('float32')
-            label = data[-1, :, :].astype('int8')
-            #print("len label:", label)
+        data = np.load(self.paths[idx], mmap_mode='c')
+        feature = self._to_tensor(data[:-1, :, :], self.feature_dtype)
+        label = self._to_tensor(data[-1, :, :], self.label_dtype)
 
         if self.transform:
-            sample = self.transform(sample)
+            feature = self.transform(feature)
 
         return feature, label
     
 
-def unet_model(images, model_path, output):
+def unet_model(images, model_path, output, batch_size=8, num_workers=0, threads=0,
+               output_format="array", shard_size=1024):
     """
     Generates predictions for images
-    
+
     Args:
-        images: images to be predicted
-        model_path: path to PyTorch model"""
+        images: directory containing the images to be predicted
+        model_path: path to PyTorch model
+        output: directory to store the predictions
+        batch_size: number of slices per inference batch
+        num_workers: number of DataLoader worker processes
+        threads: number of intra-op CPU threads. 0 keeps the torch default
+        output_format: "array" streams predictions into memory-mapped shards
+            plus an index. "files" stores one tensor per input file
+        shard_size: maximum number of predictions per shard"""
     device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    test_dataset = images
-    # define test loader
-    test_loader = DataLoader(test_dataset, batch_size=1, shuffle=False, num_workers=0)
-    print("t l:", len(test_loader))
+    if threads > 0:
+        torch.set_num_threads(threads)
     # load pre-trained torch model 
     #net = torch.load(model_path, map_location=torch.device(device))
     net = monai.networks.nets.BasicUNet(in_channels=3, out_channels=2, features=(16, 32, 64, 128, 256, 128), spatial_dims=2)
     net.load_state_dict(torch.load(model_path, map_location=torch.device(device)))
-    criterion = nn.BCEWithLogitsLoss(pos_weight=torch.tensor(50))
-    optimizer = torch.optim.SGD(net.parameters(), lr=0.01, momentum=0.9, weight_decay=0.0001)
+    net.to(device)
+    net.eval()
     # load dataset
     test_dataset = CTScanDataset(images)
     #define test_loader
-    testloader = DataLoader(test_dataset, batch_size=8,
-                             shuffle=False, num_workers=0)
-    #print("len testloader:", len(testloader))
-
-    file_names = os.listdir(images)
-    print(file_names)
+    testloader = DataLoader(test_dataset, batch_size=batch_size, shuffle=False,
+                            num_workers=num_workers, pin_memory=device == 'cuda')
+    print("Running inference on {} slices in {} batches".format(len(test_dataset), len(testloader)))
+
+    file_names = test_dataset.files
+    writer = None
+    if output_format == "array":
+        writer = PredictionWriter(output, len(test_dataset), shard_size=shard_size)
     idx = 0
-    with torch.no_grad():
-        print(len(testloader))
-        for data in testloader:
-            images, targets = data
-            images, targets = images.to(device=device, dtype=torch.float), targets.to(device=device)
-            print(images)
-            targets = F.one_hot(targets.long(), num_classes=2)
-            targets = torch.permute(targets, (0, 3, 1, 2))
+    with torch.inference_mode():
+        for images, _ in testloader:
+            images = images.to(device=device, dtype=torch.float, non_blocking=True)
             outputs = net(images)
-            print("saving:", file_names[idx])
-            for row in range(len(outputs)):
-                pred = outputs[row] 
-                torch.save(pred, os.path.join(output, file_names[idx]))
-                idx = idx + 1
-            #print(outputs)
-            #print("save:",os.path.join(output, file_names[idx]))
-            #np.save(outputs, os.path.join(output, file_names[idx]))
-            #outputs_cat = F.one_hot(torch.argmax(outputs, axis=1), num_classes=2)
-            #outputs_cat = torch.permute(outputs_cat, (0, 3, 1, 2))
-
-            #torch.save(outputs_cat, os.path.join(output, file_names[idx]))
-            #idx += 1
-            
+            names = file_names[idx:idx + len(outputs)]
+            if writer is not None:
+                writer.write(names, outputs)
+            else:
+                for name, pred in zip(names, outputs.cpu()):
+                    torch.save(pred.clone(), os.path.join(output, name))
+            idx += len(outputs)
+    if writer is not None:
+        writer.close()
+    print("Saved {} predictions".format(idx))
 
 
 if __name__ == '__main__':
@@ -128,6 +147,12 @@ if __name__ == '__main__':
     parser.add_argument('--out', dest="out", type=str, help="path to store resulting predictions")
 
     parser.add_argument('--model_info', dest="model_info", type=str, help="directory containing model info")
+    parser.add_argument('--batch_size', dest="batch_size", type=int, default=8, help="number of slices per batch")
+    parser.add_argument('--num_workers', dest="num_workers", type=int, default=0, help="number of data loading workers")
+    parser.add_argument('--threads', dest="threads", type=int, default=0, help="number of CPU threads used by torch")
+    parser.add_argument('--output_format', dest="output_format", type=str, default="array",
+                        choices=["array", "files"], help="how to store the predictions")
+    parser.add_argument('--shard_size', dest="shard_size", type=int, default=1024, help="predictions per shard")
 
     #parser.add_argument('--data_p', dest="data", type=str, help="directory containing images")
 
@@ -136,7 +161,9 @@ if __name__ == '__main__':
     print(args.model_info)
     print(args.names)
     print("run unet model")
-    unet_model(args.names, args.model_info, args.out)
+    unet_model(args.names, args.model_info, args.out, batch_size=args.batch_size,
+               num_workers=args.num_workers, threads=args.threads,
+               output_format=args.output_format, shard_size=args.shard_size)
     #list_vals = [loss, dice_total_avg, dice_class0_avg, dice_class1_avg]
     #loss, dice_total_avg, dice_class0_avg, dice_class1_avg = unet_model(args.names, args.model_info)
     #list_vals = [loss, dice_total_avg, dice_class0_avg, dice_class1_avg]
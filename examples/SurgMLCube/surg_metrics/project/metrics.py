@@ -1,86 +1,90 @@
 import argparse
-import csv
 from pathlib import Path
 import yaml
 import numpy as np
-from sklearn.metrics import (f1_score, accuracy_score,
-                            jaccard_score, recall_score, precision_score)
 
+from bootstrap import bootstrap_ci, bootstrap_params
+
+
+def confusion_matrix(labels, preds, num_classes):
+    """Counts (label, prediction) pairs with a single bincount
 
-class MetricsClass:
-    """Class wrapper for calculating the supported metrics
-    
     Args:
+        labels (1D-array[int]): The ground-truth labels
+        preds (1D-array[int]): The predictions
         num_classes (int): The number of classes in the dataset
 
+    Returns:
+        np.ndarray: (num_classes, num_classes) matrix, rows being labels
     """
+    labels = np.asarray(labels, dtype=np.int64)
+    preds = np.asarray(preds, dtype=np.int64)
+    for name, values in [("labels", labels), ("predictions", preds)]:
+        if values.size and (values.min() < 0 or values.max() >= num_classes):
+            raise ValueError(f"Found {name} outside of [0, {num_classes})")
+    counts = np.bincount(labels * num_classes + preds, minlength=num_classes ** 2)
+    return counts.reshape(num_classes, num_classes)
 
-    def __init__(self, num_classes):
-        self.num_classes = num_classes
 
-    def f1_score(self, labels, preds):
-        """Calculates the F1-score metric using scikit-learn library
-        with macro-averaging across classes.
-    
-        Args:
-            labels (1D-array[int]): The ground-truth labels
-            preds (1D-array[int]): The predictions
-
-        Returns:
-            float: the F1-score metric
-        """
-        return f1_score(labels, preds, average='macro', labels=list(range(self.num_classes)))
-    
-    def precision(self, labels, preds):
-        """Calculates the Precision metric using scikit-learn library
-        with macro-averaging across classes.
-    
-        Args:
-            labels (1D-array[int]): The ground-truth labels
-            preds (1D-array[int]): The predictions
-
-        Returns:
-            float: the Precision metric
-        """
-        return precision_score(labels, preds, average='macro', labels=list(range(self.num_classes)))
-    
-    def jaccard(self, labels, preds):
-        """Calculates the Jaccard-score metric using scikit-learn library
-        with macro-averaging across classes.
-    
-        Args:
-            labels (1D-array[int]): The ground-truth labels
-            preds (1D-array[int]): The predictions
-
-        Returns:
-            float: the Jaccard-score metric
-        """
-        return jaccard_score(labels, preds, average='macro', labels=list(range(self.num_classes)))
-    
-    def recall(self, labels, preds):
-        """Calculates the Recall metric using scikit-learn library
-        with macro-averaging across classes.
-    
-        Args:
-            labels (1D-array[int]): The ground-truth labels
-            preds (1D-array[int]): The predictions
-
-        Returns:
-            float: the Recall metric
-        """
-        return recall_score(labels, preds, average='macro', labels=list(range(self.num_classes)))
-    
-    def accuracy(self, labels, preds):
-        """Calculates the Accuracy metric using scikit-learn library
-    
-        Args:
-            labels (1D-array[int]): The ground-truth labels
-            preds (1D-array[int]): The predictions
+def confusion_metrics(confusion):
+    """Derives the supported metrics from confusion matrices, macro-averaging
+    across classes. Classes without support score 0, as in scikit-learn.
+
+    Args:
+        confusion (np.ndarray): array of shape (..., num_classes, num_classes)
+
+    Returns:
+        dict: metric name to array of shape (...)
+    """
+    confusion = np.asarray(confusion, dtype=np.float64)
+    tp = np.diagonal(confusion, axis1=-2, axis2=-1)
+    fp = confusion.sum(axis=-2) - tp
+    fn = confusion.sum(axis=-1) - tp
+
+    def ratio(num, denom):
+        return np.divide(num, denom, out=np.zeros_like(num), where=denom > 0)
 
-        Returns:
-            float: the Accuracy metric
-        """
-        return accuracy_score(labels, preds)
+    total = confusion.sum(axis=(-2, -1))
+    return {
+        "f1-score": ratio(2 * tp, 2 * tp + fp + fn).mean(axis=-1),
+        "recall": ratio(tp, tp + fn).mean(axis=-1),
+        "precision": ratio(tp, tp + fp).mean(axis=-1),
+        "jaccard": ratio(tp, tp + fp + fn).mean(axis=-1),
+        "accuracy": ratio(tp.sum(axis=-1), total),
+    }
+
+
+def load_predictions(file):
+    """Reads the labels and predictions columns of a per-video csv file
+
+    Args:
+        file (Path|str): csv file with a header and
+            (frame_path, label, prediction) rows
+
+    Returns:
+        tuple: labels and predictions as 1D integer arrays
+    """
+    data = np.loadtxt(
+        file, delimiter=",", skiprows=1, usecols=(1, 2), dtype=np.int64, ndmin=2
+    )
+    return data[:, 0], data[:, 1]
+
+
+def bootstrap_statistic(weights, data):
+    """Overall metrics of every bootstrap replicate, resampling videos
+
+    Args:
+        weights (np.ndarray): times each video is drawn, of shape (replicates, n_videos)
+        data (dict): per-video confusion matrices and the metrics to compute
+
+    Returns:
+        np.ndarray: array of shape (replicates, n_metrics)
+    """
+    confusion = data["confusion"]
+    n_videos, num_classes, _ = confusion.shape
+    summed = weights @ confusion.reshape(n_videos, -1)
+    scores = confusion_metrics(summed.reshape(-1, num_classes, num_classes))
+    return np.stack([scores[name] for name in data["metrics"]], axis=1)
 
 
 class Evaluation:
@@ -102,49 +106,46 @@ class Evaluation:
         with open(parameters_file, "r") as f:
             self.params = yaml.full_load(f)
 
-        metrics_class = MetricsClass(self.params["num_classes"])
-        self.available_metrics = {
-            "f1-score": metrics_class.f1_score,
-            "recall": metrics_class.recall,
-            "precision": metrics_class.precision,
-            "jaccard": metrics_class.jaccard,
-            "accuracy": metrics_class.accuracy,
-        }
-
+        self.num_classes = self.params["num_classes"]
         self.output_file = output_file
         self.preds_path = Path(preds_path)
     
     def run(self):
-        labels = list()
-        preds = list()
+        # One confusion matrix per video. Every metric, for every video
+        # and overall, is derived from them
+        confusion = list()
 
         preds_files = self.preds_path.glob("*.csv")
         for file in preds_files:
-            labels.append([])
-            preds.append([])
-            with open(file) as f:
-                reader = csv.reader(f)
-                for i, row in enumerate(reader):
-                    if i == 0:
-                        continue
-                    labels[-1].append(int(row[1]))
-                    preds[-1].append(int(row[2]))
-        
+            labels, preds = load_predictions(file)
+            confusion.append(confusion_matrix(labels, preds, self.num_classes))
+        confusion = np.stack(confusion)
+
+        scores_per_video = confusion_metrics(confusion)
+        overall_scores = confusion_metrics(confusion.sum(axis=0))
+
         results = {"overall": {}, "per_video": {}}
 
         for metric_name in self.params["metrics"]:
-            metric = self.available_metrics[metric_name]
-            scores_per_video = []
-            for vid_labels, vid_preds in zip(labels, preds):
-                scores = metric(vid_labels, vid_preds)
-                scores_per_video.append(float(scores))
-            scores = metric(sum(labels, []), sum(preds, []))
-            results["overall"][metric_name] = float(scores)
+            results["overall"][metric_name] = float(overall_scores[metric_name])
             results["per_video"][metric_name] = {
-                                            "mean": float(np.mean(scores_per_video)),
-                                            "std": float(np.std(scores_per_video))
+                                            "mean": float(np.mean(scores_per_video[metric_name])),
+                                            "std": float(np.std(scores_per_video[metric_name]))
                                             }
 
+        config = bootstrap_params(self.params)
+        if config is not None:
+            data = {"confusion": confusion, "metrics": self.params["metrics"]}
+            lower, upper = bootstrap_ci(bootstrap_statistic, data, len(confusion), **config)
+            results["bootstrap"] = {
+                "replicates": config["n_replicates"],
+                "confidence": config["confidence"],
+                "overall": {
+                    name: [float(low), float(up)]
+                    for name, low, up in zip(self.params["metrics"], lower, upper)
+                },
+            }
+
         with open(self.output_file, "w") as f:
             yaml.dump(results, f)
 
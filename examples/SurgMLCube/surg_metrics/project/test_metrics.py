@@ -0,0 +1,82 @@
+import csv
+import pytest
+import numpy as np
+
+from metrics import confusion_matrix, confusion_metrics, load_predictions
+
+sklearn_metrics = pytest.importorskip("sklearn.metrics")
+
+
+def sklearn_scores(labels, preds, num_classes):
+    classes = list(range(num_classes))
+    kwargs = {"average": "macro", "labels": classes, "zero_division": 0}
+    return {
+        "f1-score": sklearn_metrics.f1_score(labels, preds, **kwargs),
+        "recall": sklearn_metrics.recall_score(labels, preds, **kwargs),
+        "precision": sklearn_metrics.precision_score(labels, preds, **kwargs),
+        "jaccard": sklearn_metrics.jaccard_score(labels, preds, **kwargs),
+        "accuracy": sklearn_metrics.accuracy_score(labels, preds),
+    }
+
+
+@pytest.mark.parametrize("num_classes", [2, 7])
+@pytest.mark.parametrize("n_frames", [1, 50, 1000])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_confusion_metrics_match_sklearn(num_classes, n_frames, seed):
+    # Arrange
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, num_classes, n_frames)
+    noise = rng.integers(0, num_classes, n_frames)
+    preds = np.where(rng.random(n_frames) < 0.6, labels, noise)
+    expected = sklearn_scores(labels, preds, num_classes)
+
+    # Act
+    scores = confusion_metrics(confusion_matrix(labels, preds, num_classes))
+
+    # Assert
+    for name, value in expected.items():
+        assert scores[name] == pytest.approx(value)
+
+
+def test_summed_confusion_matches_sklearn_on_concatenated_videos():
+    # Arrange
+    num_classes = 7
+    rng = np.random.default_rng(0)
+    videos = [
+        (rng.integers(0, num_classes, n), rng.integers(0, num_classes, n))
+        for n in [10, 200, 35]
+    ]
+    labels = np.concatenate([labels for labels, _ in videos])
+    preds = np.concatenate([preds for _, preds in videos])
+    expected = sklearn_scores(labels, preds, num_classes)
+
+    # Act
+    confusion = sum(confusion_matrix(l, p, num_classes) for l, p in videos)
+    scores = confusion_metrics(confusion)
+
+    # Assert
+    for name, value in expected.items():
+        assert scores[name] == pytest.approx(value)
+
+
+def test_confusion_matrix_rejects_out_of_range_labels():
+    # Act & Assert
+    with pytest.raises(ValueError):
+        confusion_matrix([0, 3], [0, 1], num_classes=3)
+
+
+def test_load_predictions_reads_label_and_prediction_columns(tmp_path):
+    # Arrange
+    file = tmp_path / "video.csv"
+    rows = [("frames/video/0.png", 1, 2), ("frames/video/25.png", 3, 3)]
+    with open(file, "w") as f:
+        writer = csv.writer(f)
+        writer.writerow(["frame_path", "label", "prediction"])
+        writer.writerows(rows)
+
+    # Act
+    labels, preds = load_predictions(file)
+
+    # Assert
+    assert labels.tolist() == [1, 3]
+    assert preds.tolist() == [2, 3]
@@ -2,6 +2,7 @@ import csv
 from functools import partial
 from pathlib import Path
 
+import numpy as np
 import tensorflow as tf
 from tensorflow.keras.applications.resnet import preprocess_input
 from tensorflow.keras.layers.experimental.preprocessing import Resizing
@@ -49,6 +50,36 @@ def read_image(data):
 
     return new_data
 
+def frames_array_reader(frames):
+    """Creates a map function reading batches of frames from a memory-mapped
+    frames array, as prepared in the "mmap" frames format.
+
+    Args:
+        frames (np.memmap): A uint8 array of shape (frames, height, width, 3).
+
+    Returns:
+        callable: A function taking a dictionary being at least {'frame_index': 1D-Tensor[tf.int64]},
+                  returning the same input dict with an additional item: {'image': 4D-Tensor[tf.uint8]},
+                  the read frames.
+
+    """
+    def read_frames(data):
+        imgs = tf.numpy_function(lambda idx: frames[idx], [data["frame_index"]], tf.uint8)
+        imgs.set_shape((None,) + frames.shape[1:])
+
+        new_data = {"image": imgs}
+        new_data.update(data)
+
+        return new_data
+
+    return read_frames
+
+def parse_frame_reference(frame_ref):
+    """Splits a frame reference of form '<frames array path>:<frame index>'
+    into the path of the frames array and the index of the frame."""
+    array_path, index = frame_ref.rsplit(":", 1)
+    return array_path, int(index)
+
 @tf.function
 def resize_map(data):
     """Resizes images to (224,224,3).
@@ -69,6 +100,35 @@ def resize_map(data):
     return new_data
 
 
+def read_video_csv(csv_file):
+    """Reads the frames and labels of a video from its csv file.
+
+    Args:
+        csv_file (Path|str): The csv file of the video, as generated by the data preparation MLCube.
+
+    Returns:
+        A tuple consisting of:
+            List[str]: Frame paths, relative to the data folder.
+            List[int]: Labels of the frames.
+            List[int]: Frame IDs (the row of each frame in the csv file).
+
+    """
+    frames = list()
+    labels = list()
+    frame_ids = list()
+
+    with open(csv_file) as f:
+        reader = csv.reader(f)
+        for frame_id, row in enumerate(reader):
+            if frame_id == 0:
+                continue
+            frames.append(row[0])
+            labels.append(int(row[1]))
+            frame_ids.append(frame_id)
+
+    return frames, labels, frame_ids
+
+
 def backbone_dataset(data_root,
                      batch_size):
     
@@ -95,6 +155,11 @@ def backbone_dataset(data_root,
                                     ├── some_video_name.csv
                                     ├── other_video_name.csv
                                     └ ...
+
+                         In the "mmap" frames format, each video folder is replaced by a single
+                         uint8 array 'frames/<video_name>.npy' of shape (frames, height, width, 3),
+                         and csv files refer to frames as '<array path>:<frame index>'. Frames are
+                         then read in batches from the memory-mapped array, without decoding images.
         
         batch_size (int): The batch size.
 
@@ -120,28 +185,34 @@ def backbone_dataset(data_root,
     csv_file_names = list()
     
     to_dict_fn = lambda img, label, frame_id: {"image_path":img, "label":label, "frame_id":frame_id}
+    to_array_dict_fn = lambda img, label, frame_id, frame_index: {"image_path":img, "label":label, "frame_id":frame_id, "frame_index":frame_index}
 
     for csv_file in csv_files:
-        frames = list()
-        labels = list()
-        frame_ids = list()
-
-        with open(csv_file) as f:
-            reader = csv.reader(f)
-            for frame_id, row in enumerate(reader):
-                if frame_id == 0:
-                    continue
-                frames.append(row[0])
-                labels.append(int(row[1]))
-                frame_ids.append(frame_id)
-
-        frames = list(map(lambda path: str(data_root / path), frames))
-        
+        frames, labels, frame_ids = read_video_csv(csv_file)
+
         csv_file_names.append(csv_file.name)
-        datasets.append(tf.data.Dataset.from_tensor_slices((frames, labels, frame_ids))
+
+        if frames and frames[0].rsplit(":", 1)[0].endswith(".npy"):
+            array_path, _ = parse_frame_reference(frames[0])
+            frames_array = np.load(data_root / array_path, mmap_mode="r")
+            frame_indices = [parse_frame_reference(frame)[1] for frame in frames]
+            frames = list(map(lambda path: str(data_root / path), frames))
+
+            dataset = (tf.data.Dataset.from_tensor_slices((frames, labels, frame_ids, frame_indices))
+                        .map(to_array_dict_fn)
+                        .batch(batch_size)
+                        .map(frames_array_reader(frames_array), num_parallel_calls=AUTOTUNE)
+            )
+        else:
+            frames = list(map(lambda path: str(data_root / path), frames))
+
+            dataset = (tf.data.Dataset.from_tensor_slices((frames, labels, frame_ids))
                         .map(to_dict_fn)
                         .map(read_image, num_parallel_calls=AUTOTUNE)
                         .batch(batch_size)
+            )
+
+        datasets.append(dataset
                         .map(resize_map, num_parallel_calls=AUTOTUNE)
                         .map(partial(preprocess_input_fn, preprocessor=preprocess_input), num_parallel_calls=AUTOTUNE)
                         .prefetch(AUTOTUNE)
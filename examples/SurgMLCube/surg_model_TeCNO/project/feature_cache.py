@@ -0,0 +1,100 @@
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+
+from dataset import parse_frame_reference
+
+# Bump when feature extraction changes (preprocessing, backbone architecture, ...)
+# to invalidate existing cache entries
+CACHE_VERSION = 1
+
+HASH_CHUNK_BYTES = 1 << 20
+
+
+def _update_with_file(hasher, path):
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            hasher.update(chunk)
+
+
+def weights_hash(weights_path):
+    """Hashes the content of the checkpoint files of a model.
+
+    Args:
+        weights_path (Path|str): A folder containing TensorFlow checkpoint files.
+
+    Returns:
+        str: The hex digest of the weights.
+
+    """
+    hasher = hashlib.sha256(f"tecno-features-v{CACHE_VERSION}".encode())
+    for file in sorted(Path(weights_path).iterdir()):
+        if file.is_file():
+            hasher.update(file.name.encode())
+            _update_with_file(hasher, file)
+    return hasher.hexdigest()
+
+
+def frames_hash(data_root, frames):
+    """Hashes the content of the frames of a video, in order.
+
+    Args:
+        data_root (Path|str): The data folder.
+        frames (List[str]): Frame paths relative to data_root. In the "mmap" frames
+                            format, frame references of form '<array path>:<frame index>'.
+
+    Returns:
+        str: The hex digest of the frames.
+
+    """
+    data_root = Path(data_root)
+    hasher = hashlib.sha256()
+    hashed_arrays = set()
+    for frame in frames:
+        if frame.rsplit(":", 1)[0].endswith(".npy"):
+            array_path, index = parse_frame_reference(frame)
+            if array_path not in hashed_arrays:
+                hasher.update(array_path.encode())
+                _update_with_file(hasher, data_root / array_path)
+                hashed_arrays.add(array_path)
+            hasher.update(f":{index}".encode())
+        else:
+            _update_with_file(hasher, data_root / frame)
+    return hasher.hexdigest()
+
+
+class FeatureCache:
+    def __init__(self, cache_path, weights_path):
+        """On-disk cache of the features extracted by the backbone of TeCNO.
+
+        The features of a video are stored as a float32 matrix of shape (frames, features)
+        in '<cache_path>/<backbone weights hash>/<frames hash>.npy', and loaded as a memory map.
+        Runs that only differ in their temporal stage (MS-TCN) reuse the same features.
+
+        Args:
+            cache_path (Path|str): The cache folder.
+            weights_path (Path|str): The folder of the backbone weights.
+
+        """
+        self.path = Path(cache_path) / weights_hash(weights_path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def file(self, key):
+        return self.path / f"{key}.npy"
+
+    def load(self, key):
+        """Returns the cached features of a video as a memory-mapped array, or None if missing."""
+        file = self.file(key)
+        if not file.exists():
+            return None
+        return np.load(file, mmap_mode="r")
+
+    def save(self, key, features):
+        """Stores the features of a video. The file is written under a temporary
+        name first, so interrupted runs don't leave incomplete entries."""
+        file = self.file(key)
+        tmp_file = file.with_suffix(".tmp.npy")
+        np.save(tmp_file, np.asarray(features, dtype=np.float32))
+        os.replace(tmp_file, file)
@@ -3,16 +3,18 @@ import argparse
 import csv
 from pathlib import Path
 
-from dataset import backbone_dataset
+from dataset import backbone_dataset, read_video_csv
 import tensorflow as tf
 from models import MultiStageModel
+from feature_cache import FeatureCache, frames_hash
 
 class Inference:
     def __init__(self, data_root,
                        params_file,
                        feature_extraction_weights_path,
                        mstcn_weights_path,
-                       output_path):
+                       output_path,
+                       feature_cache_path=None):
 
         """Class wrapper for executing model inference.
 
@@ -42,11 +44,19 @@ class Inference:
             feature_extraction_weights_path (str): feature extraction model weights location
             mstcn_weights_path (str): multi-stage temporal convolutional network weights location
             output_path (str): location to store predictions
+            feature_cache_path (str, optional): location of the features cache. Features extracted
+                                                by the backbone are stored there, keyed by the content
+                                                of the frames and of the backbone weights, so that later
+                                                runs (e.g. with different MS-TCN weights) only run the
+                                                temporal stage. Caching is disabled if not given.
         
         """
 
         # TODO: generalize this
         feature_extraction_weights_path = Path(feature_extraction_weights_path)
+        self.feature_cache = None
+        if feature_cache_path is not None:
+            self.feature_cache = FeatureCache(feature_cache_path, feature_extraction_weights_path)
         prefix = list(feature_extraction_weights_path.glob("*.index"))[0].name.replace(".index", "")
         feature_extraction_weights_path = feature_extraction_weights_path / prefix
 
@@ -81,24 +91,19 @@ class Inference:
 
 
     @tf.function
-    def one_video_inference(self, dataset):
-        """Runs inference on one video
+    def extract_features(self, dataset):
+        """Runs the feature extractor on the frames of one video
 
         Args:
             dataset (tf.data.Dataset): a TensorFlow dataset of a video
 
         Returns:
-            A tuple consisting of:
-                1D-Tensor[tf.int32]: Predictions for all frames of the video.
-                1D-Tensor[tf.int32]: Ground-truth labels for all frames of the video.
-                1D-Tensor[tf.string]: frame paths for all frames of the video.
+            2D-Tensor[tf.float32]: Features of all frames of the video, sorted by frame ID.
 
         """
         num_batches = dataset.cardinality()
         num_batches = tf.cast(num_batches, tf.int32)
         features_tensor_array = tf.TensorArray(dtype=tf.float32, element_shape=[None, 2048], size=num_batches)
-        labels_tensor_array = tf.TensorArray(dtype=tf.int32, element_shape=[None], size=num_batches)
-        frame_path_tensor_array = tf.TensorArray(dtype=tf.string, element_shape=[None], size=num_batches)
         frame_id_tensor_array = tf.TensorArray(dtype=tf.int32, element_shape=[None], size=num_batches)
 
         writer_index = tf.constant(0, dtype=tf.int32)
@@ -108,44 +113,69 @@ class Inference:
             tf.print("batch", writer_index, "/", num_batches)
 
             images = data_instance["image"]
-            labels = data_instance["label"]
-            images_paths = data_instance["image_path"]
             frame_ids = data_instance["frame_id"]
 
             features = self.feature_extractor(images, training=False)
 
             features_tensor_array = features_tensor_array.write(writer_index, features)
-            labels_tensor_array = labels_tensor_array.write(writer_index, labels)
-            frame_path_tensor_array = frame_path_tensor_array.write(writer_index, images_paths)
             frame_id_tensor_array = frame_id_tensor_array.write(writer_index, frame_ids)
 
             writer_index += 1
         
         tf.print(f"sorting:")
         video_features = features_tensor_array.concat()
-        video_labels = labels_tensor_array.concat()
-        video_frame_path = frame_path_tensor_array.concat()
         video_frame_id = frame_id_tensor_array.concat()
 
         sorting_indices = tf.argsort(video_frame_id)
 
-        video_features = tf.gather(video_features, sorting_indices)
-        video_labels = tf.gather(video_labels, sorting_indices)
-        video_frame_path = tf.gather(video_frame_path, sorting_indices)
+        return tf.gather(video_features, sorting_indices)
 
+    @tf.function
+    def temporal_inference(self, video_features):
+        """Runs the multi-stage temporal convolutional network on the features of one video
+
+        Args:
+            video_features (2D-Tensor[tf.float32]): Features of all frames of the video, sorted by frame ID.
+
+        Returns:
+            1D-Tensor[tf.int64]: Predictions for all frames of the video.
+
+        """
         tf.print(f"running mstcn:")
         video_probas = self.mstcn(video_features, training=False)
-        video_predictions = tf.argmax(video_probas, axis=1)
+        return tf.argmax(video_probas, axis=1)
 
-        return video_predictions, video_labels, video_frame_path
+    def video_features(self, i, frames):
+        """Returns the features of the i-th video, from the cache if available.
+
+        Args:
+            i (int): index of the video
+            frames (List[str]): frame paths of the video, relative to the data folder, sorted by frame ID.
+
+        Returns:
+            2D-Tensor[tf.float32]: Features of all frames of the video, sorted by frame ID.
+
+        """
+        if self.feature_cache is None:
+            return self.extract_features(self.datasets[i])
+
+        key = frames_hash(self.data_root, frames)
+        cached = self.feature_cache.load(key)
+        if cached is not None:
+            tf.print("Using cached features")
+            return tf.convert_to_tensor(cached)
+
+        features = self.extract_features(self.datasets[i])
+        self.feature_cache.save(key, features.numpy())
+        return features
 
     def save_video_predictions(self, preds, labels, paths, out_file):
         """saves video predictions
 
         Args:
             preds (1D-array[np.int32]): Predictions for all frames of the video.
-            labels (1D-array[np.int32]): Ground-truth labels for all frames of the video.
-            labels (1D-array[str]): frame paths for all frames of the video.
+            labels (List[int]): Ground-truth labels for all frames of the video.
+            paths (List[str]): frame paths for all frames of the video, relative to the data folder.
             out_file (Path|str): output csv file path to store predictions in.
 
         """
@@ -154,9 +184,7 @@ class Inference:
         with open(out_file, "w") as f:
             writer = csv.writer(f)
             writer.writerow(["frame_path", "label", "prediction"])
-            for frame_path, label, pred in zip(paths, labels, preds):
-                frame_path = Path(frame_path.decode("utf-8")).relative_to(self.data_root)
-                writer.writerow([frame_path, label, pred])
+            writer.writerows(zip(paths, labels, preds.tolist()))
 
     def run(self):
         """ Runs inference on each video and stores the predicitons."""
@@ -164,9 +192,12 @@ class Inference:
         num_vids = len(self.datasets)
         for i in range(num_vids):
             tf.print(f"Video {i+1}/{num_vids}")
-            preds, labels, paths = self.one_video_inference( self.datasets[i])
+            # csv rows are already sorted by frame ID
+            frames, labels, _ = read_video_csv(self.data_root / "data_csv" / self.video_file_names[i])
+            features = self.video_features(i, frames)
+            preds = self.temporal_inference(features)
             out_file = self.out_path / self.video_file_names[i]
-            self.save_video_predictions(preds.numpy(), labels.numpy(), paths.numpy(), out_file)
+            self.save_video_predictions(preds.numpy(), labels, frames, out_file)
         
 
 
@@ -218,12 +249,21 @@ if __name__ == "__main__":
         help="Location to store the predictions",
     )
 
+    parser.add_argument(
+        "--feature_cache_path",
+        "--feature-cache-path",
+        type=str,
+        default=None,
+        help="Location of the backbone features cache. Caching is disabled if not given",
+    )
+
     args = parser.parse_args()
     inference_model = Inference(args.data_path,
                                 args.params_file,
                                 args.feature_extraction_weights_path,
                                 args.mstcn_weights_path,
-                                args.output_path
+                                args.output_path,
+                                args.feature_cache_path
                                 )
                                 
     inference_model.run()
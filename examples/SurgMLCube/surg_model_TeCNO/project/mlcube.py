@@ -24,13 +24,16 @@ class InferenceTask(object):
     - mstcn_weights_path: multi-stage temporal convolutional network weights location
     - params_file: yaml file with additional parameters
     - output_path: location to store predictions
+    - feature_cache_path: (optional) location of the backbone features cache
     """
 
     @staticmethod
     def run(
-        data_root: str, feature_extraction_weights_path: str, mstcn_weights_path: str, params_file: str, output_path: str
+        data_root: str, feature_extraction_weights_path: str, mstcn_weights_path: str, params_file: str, output_path: str, feature_cache_path: str = None
     ) -> None:
         cmd = f"python3 inference.py --data_path={data_root} --feature_extraction_weights_path={feature_extraction_weights_path} --mstcn_weights_path={mstcn_weights_path} --params_file={params_file} --output_path={output_path}"
+        if feature_cache_path:
+            cmd += f" --feature_cache_path={feature_cache_path}"
         exec_python(cmd)
 
 
@@ -42,8 +45,9 @@ def prepare(
     mstcn_weights: str = typer.Option(..., "--mstcn_weights"),
     parameters_file: str = typer.Option(..., "--parameters_file"),
     output_path: str = typer.Option(..., "--output_path"),
+    feature_cache: str = typer.Option(None, "--feature_cache"),
 ):
-    InferenceTask.run(data_path, feature_extractor_weights, mstcn_weights, parameters_file, output_path)
+    InferenceTask.run(data_path, feature_extractor_weights, mstcn_weights, parameters_file, output_path, feature_cache)
 
 @app.command("dummy")
 def dummy():
@@ -1,9 +1,123 @@
 import os
+import struct
 import yaml
 import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
 from utils import get_file_basename, get_file_extention
 
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def png_size(png_file):
+    """Reads the (width, height) of a PNG image from its header, without decoding it.
+
+    Raises:
+        AssertionError: if the file is not a PNG image.
+    """
+    with open(png_file, "rb") as f:
+        header = f.read(24)
+    assert len(header) == 24 and header[:8] == PNG_SIGNATURE and header[12:16] == b"IHDR", \
+        f"{png_file}: not a valid png file"
+    return struct.unpack(">II", header[16:24])
+
+
+def read_csv_rows(csv_file, data_path, accepted_labels):
+    """Reads a video csv file and checks its structure and labels in bulk.
+
+    Returns:
+        np.ndarray[str]: The frame paths of the csv file.
+
+    Raises:
+        AssertionError: if the csv file structure or its labels are invalid.
+    """
+    with open(csv_file, newline="") as f:
+        rows = [line.rstrip("\r\n").split(",") for line in f]
+
+    assert rows and all(len(row) == 2 for row in rows), \
+        "csv files are supposed to have two columns seperated by a comma"
+
+    header1, header2 = rows[0]
+    assert not os.path.exists(os.path.join(data_path, header1.strip())) or header2 not in accepted_labels,\
+        "csv files must contain a header line"
+
+    rows = np.array(rows[1:], dtype=str).reshape(-1, 2)
+    frame_paths = np.char.strip(rows[:, 0])
+    labels = rows[:, 1]
+
+    num_labels = len(accepted_labels)
+    assert np.isin(labels, accepted_labels).all(), f"labels are supposed to be integers between 0 and {num_labels}"
+    return frame_paths
+
+
+def check_png_video(csv_file, data_path, videos, accepted_labels, scale, num_samples):
+    """Checks the csv file of a video prepared in the "png" frames format.
+
+    Each frames folder referenced by the csv file is listed once, and frame paths
+    are checked against the listing. Frame dimensions are checked on a sample of
+    frames by reading their PNG headers only, warning about unexpected sizes.
+
+    Raises:
+        AssertionError: if any check fails.
+    """
+    frame_paths = read_csv_rows(csv_file, data_path, accepted_labels)
+    if not len(frame_paths):
+        return
+
+    assert (np.char.rpartition(frame_paths, ".")[:, 2] == "png").all(), f"frames should be .png"
+
+    folders, _, names = np.moveaxis(np.char.rpartition(frame_paths, "/"), -1, 0)
+    for folder in np.unique(folders):
+        frames_folder = os.path.join(data_path, folder)
+        assert frames_folder in videos, f"csv files try to read frames from {frames_folder}"
+
+        with os.scandir(frames_folder) as entries:
+            existing = {entry.name for entry in entries}
+        missing = set(names[folders == folder].tolist()) - existing
+        assert not missing, f"{os.path.join(frames_folder, sorted(missing)[0])}: file doesn't exist"
+
+    if num_samples:
+        sampled = np.unique(np.linspace(0, len(frame_paths) - 1, num_samples).astype(int))
+        for frame_path in frame_paths[sampled]:
+            frame_path = os.path.join(data_path, frame_path)
+            size = png_size(frame_path)
+            if size != tuple(scale):
+                print(f"Warning: {frame_path} has size {size[0]}x{size[1]}, expected {scale[0]}x{scale[1]}")
+
+
+def check_mmap_video(csv_file, data_path, videos, accepted_labels, scale):
+    """Checks the csv file of a video prepared in the "mmap" frames format. Frame
+    dimensions are checked from the header of the frames arrays, warning about
+    unexpected sizes as for the "png" format.
+
+    Raises:
+        AssertionError: if any check fails.
+    """
+    frame_paths = read_csv_rows(csv_file, data_path, accepted_labels)
+    if not len(frame_paths):
+        return
+
+    arrays, _, indices = np.moveaxis(np.char.rpartition(frame_paths, ":"), -1, 0)
+    assert (arrays != "").all() and np.char.isdigit(indices).all(), \
+        "frames are supposed to be referenced as <frames array>:<frame index>"
+    indices = indices.astype(np.int64)
+
+    for array in np.unique(arrays):
+        array_path = os.path.join(data_path, array)
+        assert array_path in videos, f"csv files try to read frames from {array_path}"
+
+        frames = np.load(array_path, mmap_mode="r")
+        assert frames.dtype == np.uint8 and frames.ndim == 4 and frames.shape[3] == 3, \
+            f"{array_path}: frames are supposed to be a uint8 array of shape (frames, height, width, 3)"
+        height, width = frames.shape[1:3]
+        if (width, height) != tuple(scale):
+            print(f"Warning: {array_path} has frames of size {width}x{height}, expected {scale[0]}x{scale[1]}")
+
+        out_of_range = indices[(arrays == array) & (indices >= len(frames))]
+        assert not len(out_of_range), f"{array_path}: frame {out_of_range[0]} doesn't exist"
+
+
 class SanityChecks:
     def __init__(self, data_path, params_file):
         """A class wrapper for doing sanity checks on prepared dataset.
@@ -16,11 +130,18 @@ class SanityChecks:
             the csv data folder contains folders,
             the csv data folder contains non-csv files,
             a csv file doesn't have a corresponding frames folder,
-            any extracted video frame is not .png,
+            any extracted video frame is not .png (or, in the "mmap" frames format,
+                any video frames file is not a .npy array or a frame index is out of range),
+            "mmap" frames arrays are not uint8 arrays of shape (frames, height, width, 3),
             labels are not integers between 0 and <total number of labels>,
             csv files contain invalid frames paths,
             csv files have incorrect structure.
 
+        A warning is printed when frames don't have the configured scale. In the "png"
+        format, "check_samples" frames per video (10 by default) are checked.
+
+        Videos are checked in parallel by up to "max_cpus" processes (all CPUs by default).
+
         Args:
             data_path (str): The path to the folder of the prepared data, generated 
                              by the preparation step of the MLCube.
@@ -46,52 +167,47 @@ class SanityChecks:
         assert os.path.exists(frames_path), "frames folder doesn't exist"
         assert os.path.exists(csv_path), "csv data folder doesn't exist"
 
-        videos = os.listdir(frames_path)
-        csv_files = os.listdir(csv_path)
+        with os.scandir(frames_path) as entries:
+            videos = {entry.path: entry.is_dir() for entry in entries}
+        with os.scandir(csv_path) as entries:
+            csv_files = {entry.path: entry.is_file() for entry in entries}
 
         assert videos, "frames folder is empty"
         assert csv_files, "csv data folder is empty"
 
-        videos = list(map(lambda vidname: os.path.join(frames_path, vidname), videos))
-        csv_files = list(map(lambda csvname: os.path.join(csv_path, csvname), csv_files))
-
-        assert all(map(os.path.isdir, videos)), "frames folder contains files"
-        assert all(map(os.path.isfile, csv_files)), "csv data folder contains folders"
+        mmap_format = self.params.get("frames_format", "png") == "mmap"
+        if mmap_format:
+            assert all(get_file_extention(file) == '.npy' for file in videos), "frames folder contains non-npy files"
+        else:
+            assert all(videos.values()), "frames folder contains files"
+        assert all(csv_files.values()), "csv data folder contains folders"
 
-        assert all(map(lambda file: get_file_extention(file) == '.csv', csv_files)), "csv data folder contains non-csv files"
+        assert all(get_file_extention(file) == '.csv' for file in csv_files), "csv data folder contains non-csv files"
 
         assert set(map(get_file_basename, csv_files)).issubset(map(get_file_basename, videos)), \
                 "some csv files don't have corresponding frames folder"
         
         num_labels = len(self.params['labels'])
         accepted_labels = [str(i) for i in range(num_labels)]
-        for csv_file in csv_files:
-            with open(csv_file) as read_file:
-                frame = 0
-                for line in read_file.readlines():
-                    if not frame: # header line
-                        frame += 1
-                        try:
-                            header1, header2 = line.strip().split(",")
-                        except ValueError:
-                            raise AssertionError("csv files are supposed to have two columns seperated by a comma")
-                        
-                        assert not os.path.exists(os.path.join(self.data_path, header1.strip())) or header2 not in accepted_labels,\
-                            "csv files must contain a header line"
-                        continue
-
-                    try:
-                        frame_path, label = line.strip().split(",")
-                    except ValueError:
-                        raise AssertionError("csv files are supposed to have two columns seperated by a comma")
-                    
-                    frame_path = os.path.join(self.data_path, frame_path.strip())
-                    
-                    assert os.path.exists(frame_path), f"{frame_path}: file doesn't exist"
-                    assert get_file_extention(frame_path) == ".png", f"frames should be .png"
-                    # TODO: assert frames have correct height and width
-                    assert os.path.split(frame_path)[0] in videos, f"csv files try to read frames from {os.path.split(frame_path)[0]}"
-                    assert label in accepted_labels, f"labels are supposed to be integers between 0 and {num_labels}"
+        videos = set(videos)
+        scale = self.params["scale"]
+
+        csv_files = sorted(csv_files)
+        if mmap_format:
+            check = lambda pool, file: pool.submit(
+                check_mmap_video, file, self.data_path, videos, accepted_labels, scale
+            )
+        else:
+            num_samples = self.params.get("check_samples", 10)
+            check = lambda pool, file: pool.submit(
+                check_png_video, file, self.data_path, videos, accepted_labels, scale, num_samples
+            )
+
+        with ProcessPoolExecutor(max_workers=self.params.get("max_cpus")) as pool:
+            futures = [check(pool, csv_file) for csv_file in csv_files]
+            for future in futures:
+                # raises the AssertionError of the first failed video
+                future.result()
         
         # TODO: assert frames are sampled according to fps
         print("Prepared data sucessfully passed all tests")
@@ -3,10 +3,19 @@ import os
 import yaml
 import argparse
 import csv
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from utils import get_file_basename, get_file_extention, get_video_fps
+import numpy as np
+
+from utils import get_file_basename, get_file_extention, get_video_info
+from utils import stream_to_npy, frame_reference
 from utils import LabelsParser
 
+# Written in a frames folder once ffmpeg extracted all of its frames
+EXTRACTED_MARKER = ".extracted"
+
 
 class DataPreparation:
     def __init__(self, data_path, labels_path, params_file, output_path):
@@ -38,12 +47,19 @@ class DataPreparation:
 
         self.supported_videos_paths = []
         self.supported_labels_paths = []
+        # videos ffmpeg failed to extract, skipped when processing labels
+        self.failed_videos = set()
 
         # TODO: check what ffmpeg is not capable of handling, or what it can handle but in a different way
         self.supported_video_extensions = [".mp4"]
         # TODO: check what other labels file structures have been used
         self.supported_labels_paths_extensions = [".txt", ".csv", ".json"]
 
+        # "png": a folder of .png files per video
+        # "mmap": a single .npy uint8 array of shape (frames, height, width, 3) per video
+        self.frames_format = self.params.get("frames_format", "png")
+        assert self.frames_format in ["png", "mmap"], f"Unsupported frames format: {self.frames_format}"
+
     
     def get_and_check_video_files(self):
         """Checks every file in 'self.data_path' folder.
@@ -81,7 +97,8 @@ class DataPreparation:
         'self.videos_labels_pairs' of the form:
             {<video_path>:{
                             "labels": <labels_file_path>,
-                            "fps": <video_fps>
+                            "fps": <video_fps>,
+                            "duration": <video duration in seconds>
                             }
                 }
         
@@ -133,7 +150,7 @@ class DataPreparation:
                 label_index = unique_labels.index(expected_label)
                 label_file = self.supported_labels_paths[label_index]
 
-                self.videos_labels_pairs[vid_path] = {"labels": label_file, "fps": get_video_fps(vid_path)}
+                self.videos_labels_pairs[vid_path] = {"labels": label_file, **get_video_info(vid_path)}
                 matched_labels.append(label_file)
             else:
                 print(f"Warning: {self.supported_videos_paths[i]} has no associated labels. It will be ignored")
@@ -145,14 +162,117 @@ class DataPreparation:
                     print(f"Warning: {self.supported_labels_paths[i]} has no associated video. It will be ignored")
 
 
+    def expected_frames(self, vid_path):
+        """Number of frames ffmpeg is expected to extract from a video, or None if unknown."""
+        duration = self.videos_labels_pairs[vid_path]["duration"]
+        if duration is None:
+            return None
+        return round(duration * self.params["fps"])
+
+    def frames_output(self, frames_path, vid_path):
+        """Path of the extracted frames of a video: a folder of .png files, or
+        a .npy file in the "mmap" format."""
+        file_name = get_file_basename(vid_path)
+        if self.frames_format == "mmap":
+            return os.path.join(frames_path, file_name + ".npy")
+        return os.path.join(frames_path, file_name)
+
+    def count_frames(self, out):
+        """Number of frames extracted at the frames output path of a video."""
+        if self.frames_format == "mmap":
+            return len(np.load(out, mmap_mode="r"))
+        return sum(1 for frame in os.scandir(out) if frame.name.endswith(".png"))
+
+    def extraction_settings(self):
+        """Settings a frames folder is extracted with, stored in its completion marker."""
+        scale = self.params["scale"]
+        return f"scale={scale[0]}:{scale[1]},fps={self.params['fps']}"
+
+    def is_extracted(self, out, expected):
+        """Checks whether a frames output holds a complete extraction. Frames
+        folders are complete once their marker holds the current settings.
+        Folders without marker are checked against the expected frame count,
+        as ffmpeg's fps filter may produce one frame more or less."""
+        if self.frames_format == "mmap" and expected is None:
+            # .npy files are only moved to their final path once complete
+            return True
+        if self.frames_format == "png":
+            marker = os.path.join(out, EXTRACTED_MARKER)
+            if os.path.exists(marker):
+                with open(marker) as f:
+                    return f.read() == self.extraction_settings()
+        if expected is None:
+            return False
+        return abs(self.count_frames(out) - expected) <= 1
+
+    def ffmpeg_command(self, vid_path, threads, output):
+        scale = self.params["scale"]
+        fps = self.params["fps"]
+        return [
+            "ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+            "-threads", str(threads), "-i", vid_path,
+            "-vf", f"scale={scale[0]}:{scale[1]},fps={fps}",
+            "-threads", str(threads), "-filter_threads", str(threads),
+            *output,
+        ]
+
+    def extract_frames(self, vid_path, out, threads):
+        """Runs ffmpeg to extract the frames of a single video.
+
+        Returns:
+            str: ffmpeg error output if extraction failed, None otherwise.
+        """
+        if self.frames_format == "mmap":
+            return self.extract_frames_array(vid_path, out, threads)
+
+        imgs_prefix_name = os.path.join(out, get_file_basename(vid_path))
+        # WARNING: videos with more than 10^6 frames may cause problems?
+        cmd = self.ffmpeg_command(vid_path, threads, [f"{imgs_prefix_name}_%06d.png"])
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            return result.stderr
+        with open(os.path.join(out, EXTRACTED_MARKER), "w") as f:
+            f.write(self.extraction_settings())
+        return None
+
+    def extract_frames_array(self, vid_path, out_file, threads):
+        """Decodes a video through an ffmpeg rawvideo pipe straight into a .npy
+        uint8 array of shape (frames, height, width, 3), without encoding images.
+
+        Returns:
+            str: ffmpeg error output if extraction failed, None otherwise.
+        """
+        scale = self.params["scale"]
+        cmd = self.ffmpeg_command(vid_path, threads, ["-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:"])
+        partial_file = out_file + ".partial"
+        # stderr goes to a file so that a verbose ffmpeg can't block on a full pipe
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr)
+            with process.stdout:
+                stream_to_npy(process.stdout, partial_file, (scale[1], scale[0], 3))
+            returncode = process.wait()
+            if returncode != 0:
+                os.remove(partial_file)
+                stderr.seek(0)
+                return stderr.read().decode(errors="replace")
+        os.replace(partial_file, out_file)
+        return None
+
     def process_videos(self):
         """
         Extracts frames from each video using ffmpeg according to 
         the FPS and the frame size specified in the configuration file.
+
+        Videos are extracted concurrently by several ffmpeg processes. The
+        total number of threads used by them is bounded by the "max_cpus"
+        parameter (all CPUs by default), each process using "ffmpeg_threads"
+        of them.
         
         Warns:
             If the output path already contains files or folders,
-            If a video has already been extracted (skips, even if it was partially extracted).
+            If a video has already been extracted (skips it),
+            If a video was partially extracted (extracts it again),
+            If ffmpeg fails to extract a video (records it in failed_videos).
 
         
         Note: videos with more than 10^6 frames will cause current ffmpeg command to overwrite extra frames.
@@ -172,25 +292,49 @@ class DataPreparation:
         scale = self.params["scale"]
         fps = self.params["fps"]
 
-        print(f"Extracting videos:\n\tSampling: {fps} frames per second\n\toutput frame scale: {scale[0]}-by-{scale[1]}\n")
-        for vid_path in tqdm(self.videos_labels_pairs.keys()):
+        pending = []
+        for vid_path in self.videos_labels_pairs.keys():
             file_name = get_file_basename(vid_path)
-            out_folder = os.path.join(frames_path, file_name)
-
-            if not os.path.exists(out_folder):
-                os.mkdir(out_folder)
-            else:
-                if os.listdir(out_folder):
-                    print(f"Warning: It seems that the video ({file_name}) has already been already extracted. Skipping.")
-                    continue
-
-            imgs_prefix_name = os.path.join(out_folder, file_name)
-
-            os.system(
-                f'ffmpeg -loglevel quiet -i {vid_path} -vf "scale={scale[0]}:{scale[1]},fps={fps}" {imgs_prefix_name}_%06d.png'
-            ) # WARNING: videos with more than 10^6 frames may cause problems?
-
-            print(f"Done extracting: {vid_path}")
+            out = self.frames_output(frames_path, vid_path)
+
+            if self.frames_format == "mmap":
+                if os.path.exists(out + ".partial"):
+                    os.remove(out + ".partial")
+                if os.path.exists(out):
+                    if self.is_extracted(out, self.expected_frames(vid_path)):
+                        print(f"Warning: It seems that the video ({file_name}) has already been already extracted. Skipping.")
+                        continue
+                    print(f"Warning: The video ({file_name}) seems to be partially extracted. Extracting it again.")
+            elif not os.path.exists(out):
+                os.mkdir(out)
+            elif self.is_extracted(out, self.expected_frames(vid_path)):
+                print(f"Warning: It seems that the video ({file_name}) has already been already extracted. Skipping.")
+                continue
+            elif os.listdir(out):
+                print(f"Warning: The video ({file_name}) seems to be partially extracted. Extracting it again.")
+                for frame in os.scandir(out):
+                    os.remove(frame.path)
+
+            pending.append((vid_path, out))
+
+        max_cpus = self.params.get("max_cpus") or os.cpu_count() or 1
+        threads = max(1, min(self.params.get("ffmpeg_threads", 2), max_cpus))
+        workers = max(1, max_cpus // threads)
+
+        print(f"Extracting videos:\n\tSampling: {fps} frames per second\n\toutput frame scale: {scale[0]}-by-{scale[1]}\n\tFrames format: {self.frames_format}\n\tConcurrent ffmpeg processes: {workers}\n")
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(self.extract_frames, vid_path, out, threads): vid_path
+                for vid_path, out in pending
+            }
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                vid_path = futures[future]
+                error = future.result()
+                if error:
+                    print(f"Warning: Failed extracting {vid_path}: {error.strip()}")
+                    self.failed_videos.add(vid_path)
+                else:
+                    print(f"Done extracting: {vid_path}")
 
     def process_labels(self):
         """
@@ -205,7 +349,8 @@ class DataPreparation:
             If the output path already contains files or folders,
             If any video frame has a missing label,
             If any extra label exists with no corresponding video frame,
-            If the parsing functions raise warnings.
+            If the parsing functions raise warnings,
+            If a video failed to be extracted (skips it).
         
 
         """
@@ -217,13 +362,22 @@ class DataPreparation:
                 print("Warning: found existing files/folders in csv files output path.")
 
         for vid in self.videos_labels_pairs.keys():
-            
             out_file = os.path.join(csv_out_path, get_file_basename(vid)+".csv")
+            if vid in self.failed_videos:
+                print(f"Warning: Skipping the labels of {vid}, since its frames couldn't be extracted.")
+                if os.path.exists(out_file):
+                    os.remove(out_file)
+                continue
 
-            frames_folder = os.path.join(self.output_path, "frames", get_file_basename(vid))
+            frames_out = self.frames_output(os.path.join(self.output_path, "frames"), vid)
+            frames_rel = os.path.relpath(frames_out, self.output_path)
 
-            frames = os.listdir(frames_folder)
-            frames.sort()
+            if self.frames_format == "mmap":
+                frames = [frame_reference(frames_rel, i) for i in range(self.count_frames(frames_out))]
+            else:
+                frames = [frame for frame in os.listdir(frames_out) if frame.endswith(".png")]
+                frames.sort()
+                frames = [os.path.join(frames_rel, frame) for frame in frames]
 
 
             labels_file = self.videos_labels_pairs[vid]["labels"]
@@ -252,19 +406,16 @@ class DataPreparation:
                 labels_data = labels_data[:len(frames)]
             
             # if there is any other missing label, remove the corresponding frames
-            frames = [frame for i, frame in enumerate(frames) if labels_data[i] != None]
+            labelled = ~np.ma.getmaskarray(labels_data)
+            frames = np.asarray(frames, dtype=str)[labelled]
             dropped_frames += len(labels_data) - len(frames)
-            labels_data = [label for label in labels_data if label != None]
-
-            frames = list(map(lambda x: os.path.join(frames_folder, x), frames))
-            frames = list(map(lambda x: os.path.relpath(x, self.output_path), frames))
+            labels_data = labels_data.compressed()
 
             # write the data
             with open(out_file, "w") as f:
                 writer = csv.writer(f)
                 writer.writerow(["frame_path", "label"])
-                for frame_path, label in zip(frames, labels_data):
-                    writer.writerow([frame_path, label])
+                writer.writerows(zip(frames.tolist(), labels_data.tolist()))
             
             if dropped_frames:
                 print(f"Warning: {dropped_frames} frames of the video {vid} have no corresponding labels.")
@@ -2,9 +2,56 @@ import os
 import yaml
 import argparse
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
 from utils import get_file_basename
 
+READ_CHUNK_BYTES = 1 << 20
+
+
+def scan_video_csv(csv_file, num_labels):
+    """Counts the rows and the labels of a video csv file in a single buffered pass,
+    without decoding or splitting lines.
+
+    Rows are counted as line breaks, and labels as occurrences of ',<label>' right
+    before a line break (csv files are written with '\\r\\n' line terminators, but
+    '\\n' is also accepted). Lines are never split across chunks.
+
+    Args:
+        csv_file (str): The csv file of the video, as generated by the 'prepare' task.
+        num_labels (int): The number of labels.
+
+    Returns:
+        A tuple consisting of:
+            int: The number of rows, excluding the header.
+            np.ndarray[int]: The number of frames of each label.
+    """
+    patterns = [
+        (f",{label}\r\n".encode(), f",{label}\n".encode()) for label in range(num_labels)
+    ]
+    rows = 0
+    label_counts = np.zeros(num_labels, dtype=np.int64)
+
+    def count(lines):
+        nonlocal rows
+        rows += lines.count(b"\n")
+        for label, (crlf, lf) in enumerate(patterns):
+            label_counts[label] += lines.count(crlf) + lines.count(lf)
+
+    tail = b""
+    with open(csv_file, "rb") as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_BYTES), b""):
+            data = tail + chunk
+            end = data.rfind(b"\n") + 1
+            count(data[:end])
+            tail = data[end:]
+
+    if tail.strip():
+        count(tail + b"\n") # last line without a line break
+
+    return max(rows - 1, 0), label_counts # header
+
+
 class Statistics:
     def __init__(self, data_path, params_file, out_path):
         """A class wrapper for calculating the statistics of the prepared dataset.
@@ -21,8 +68,22 @@ class Statistics:
                     <video name>: <Number of frames of the video>
                     <video name>: <Number of frames of the video>
                     ...
+            labels:
+                <label name>:
+                    frames: <Number of frames with this label>
+                    ratio: <Fraction of frames with this label>
+                ...
+            duration:
+                total: <total duration of the videos in seconds>
+                mean: <mean duration of the videos in seconds>
+                per_video:
+                    <video name>: <Duration of the labelled frames of the video in seconds>
+                    ...
         '
 
+        Each csv file is scanned once (see 'scan_video_csv'), and videos are processed
+        in parallel by up to "max_cpus" processes (all CPUs by default).
+
         Args:
             data_path (str): The path to the folder of the prepared data, generated 
                              by the preparation step of the MLCube.
@@ -40,26 +101,49 @@ class Statistics:
         self.out_path = out_path
     
     def run(self):
-        frames_per_video = {}
-        csv_files = os.path.join(self.data_path, "data_csv")
-        for csv_file in os.listdir(csv_files):
-            vid_name = get_file_basename(csv_file)
-            csv_file = os.path.join(csv_files, csv_file)
-            frames_per_video[vid_name] = len(open(csv_file).read().strip().split("\n")) - 1 # header
-        
+        csv_path = os.path.join(self.data_path, "data_csv")
+        csv_files = sorted(entry.path for entry in os.scandir(csv_path) if entry.is_file())
+        vid_names = list(map(get_file_basename, csv_files))
+
+        labels_names = self.params["labels"]
+        num_labels = len(labels_names)
+        with ProcessPoolExecutor(max_workers=self.params.get("max_cpus")) as pool:
+            results = list(pool.map(scan_video_csv, csv_files, [num_labels]*len(csv_files)))
+
+        frames_per_video = {vid_name: rows for vid_name, (rows, _) in zip(vid_names, results)}
+        label_counts = sum((counts for _, counts in results), np.zeros(num_labels, dtype=np.int64))
+
         as_list = list(frames_per_video.values())
+        total_frames = sum(as_list)
+
+        # each frame was sampled at the prepared frame rate
+        fps = self.params["fps"]
+        duration_per_video = {vid_name: frames / fps for vid_name, frames in frames_per_video.items()}
 
         stat = {
                 "num_vids": len(as_list),
                 "num_frames": {
-                        "total": sum(as_list),
+                        "total": total_frames,
                         "mean": float(np.mean(as_list)),
                         "stddev": float(np.std(as_list)),
                         "per_video": frames_per_video
+                },
+                "labels": {
+                        name: {
+                            "frames": int(count),
+                            "ratio": float(count / total_frames) if total_frames else 0.0,
+                        }
+                        for name, count in zip(labels_names, label_counts)
+                },
+                "duration": {
+                        "total": float(total_frames / fps),
+                        "mean": float(np.mean(list(duration_per_video.values()))),
+                        "per_video": duration_per_video
                 }
             }
         
-        yaml.safe_dump(stat, open(self.out_path, "w"))
+        with open(self.out_path, "w") as f:
+            yaml.safe_dump(stat, f)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,14 @@
+import io
 import os
 import csv
 import json
+import subprocess
+import numpy as np
+
+# Size reserved for the header of .npy frame arrays written by stream_to_npy.
+# numpy pads headers to a multiple of 64 bytes, and the header of a 4D uint8
+# array always fits in 128
+NPY_HEADER_BYTES = 128
 
 
 def get_file_basename(filename):
@@ -27,8 +35,38 @@ def get_file_extention(filename):
     """
     return os.path.splitext(filename)[1]
 
+def get_video_info(filename):
+    """A util function to get the FPS and the duration of a video file with a single ffprobe call.
+    
+    Args:
+        filename (str): The file name.
+
+    Returns:
+        dict: The FPS ("fps", rounded to an integer) and the duration in seconds ("duration") of the video.
+    
+    """
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=avg_frame_rate,r_frame_rate,duration:format=duration",
+        "-of", "json", filename,
+    ]
+    info = json.loads(subprocess.run(cmd, capture_output=True, check=True, text=True).stdout)
+    stream = info["streams"][0]
+
+    rate = stream.get("avg_frame_rate", "0/0")
+    if rate in ["0/0", "0/1"]:
+        rate = stream["r_frame_rate"]
+    num, den = rate.split("/")
+    fps = float(num) / float(den)
+
+    duration = stream.get("duration", info.get("format", {}).get("duration"))
+    return {
+        "fps": round(fps), # WARNING: would rounding cause issues in some videos?
+        "duration": float(duration) if duration is not None else None,
+    }
+
 def get_video_fps(filename):
-    """A util function to get the FPS of a video file using ffmpeg.
+    """A util function to get the FPS of a video file using ffprobe.
     
     Args:
         filename (str): The file name.
@@ -37,47 +75,188 @@ def get_video_fps(filename):
         int: The FPS of the video.
     
     """
-    cmd = f'ffmpeg -i {filename} 2>&1 | sed -n "s/.*, \(.*\) fp.*/\\1/p"'
-    return round(float(os.popen(cmd).read().strip())) # WARNING: would rounding cause issues in some videos?
+    return get_video_info(filename)["fps"]
+
+def stream_to_npy(stream, out_file, frame_shape, chunk_frames=64):
+    """Writes raw uint8 frames read from a stream (e.g. an ffmpeg rawvideo pipe)
+    into a .npy file, which can then be memory-mapped with np.load(mmap_mode="r").
+
+    Frames are written as they arrive, and the .npy header is written last, once
+    the number of frames is known. A trailing incomplete frame is dropped.
+
+    Args:
+        stream (file-like): A binary stream of raw frames.
+        out_file (str): The output .npy file.
+        frame_shape (tuple): The shape of a single frame, e.g. (height, width, 3).
+        chunk_frames (int): The number of frames read from the stream at once.
+
+    Returns:
+        int: The number of frames written.
+    
+    """
+    frame_bytes = int(np.prod(frame_shape))
+    total_bytes = 0
+    with open(out_file, "wb") as f:
+        f.seek(NPY_HEADER_BYTES)
+        while True:
+            chunk = stream.read(frame_bytes * chunk_frames)
+            if not chunk:
+                break
+            f.write(chunk)
+            total_bytes += len(chunk)
+
+        num_frames = total_bytes // frame_bytes
+        f.truncate(NPY_HEADER_BYTES + num_frames * frame_bytes)
+
+        header = io.BytesIO()
+        np.lib.format.write_array_header_1_0(header, {
+            "descr": np.lib.format.dtype_to_descr(np.dtype(np.uint8)),
+            "fortran_order": False,
+            "shape": (num_frames, *frame_shape),
+        })
+        header = header.getvalue()
+        assert len(header) == NPY_HEADER_BYTES, "unexpected .npy header size"
+        f.seek(0)
+        f.write(header)
+
+    return num_frames
+
+def frame_reference(array_path, index):
+    """A util function to refer to a frame stored in a .npy frames array, as
+    written in the csv files when frames are prepared in the "mmap" format.
+    
+    Args:
+        array_path (str): The path of the frames array.
+        index (int): The index of the frame in the array.
+
+    Returns:
+        str: The frame reference, of form '<array_path>:<index>'.
+    
+    """
+    return f"{array_path}:{index}"
+
+def parse_frame_reference(frame_ref):
+    """Splits a frame reference created by 'frame_reference'.
+    
+    Args:
+        frame_ref (str): The frame reference.
+
+    Returns:
+        tuple: The path of the frames array (str) and the index of the frame (int).
+    
+    """
+    array_path, index = frame_ref.rsplit(":", 1)
+    return array_path, int(index)
 
 
 class LabelsParser:
     """This class contains static methods for parsing .txt, .csv, and .json labels files. Expected file 
-    structures are described in the docstrings of each format parser function. All parsers return a list
-    of M values, where M is the total number of frames of the associated original video file without any 
-    frame sampling and trimming (using the FPS information). A value of this list is either an integer
-    corresponding to the label index in the labels names list, or None if the label is missing.
+    structures are described in the docstrings of each format parser function. All parsers return a masked
+    integer array of M values, where M is the total number of frames of the associated original video file
+    without any frame sampling and trimming (using the FPS information). A value of this array is the label
+    index in the labels names list, and is masked if the label is missing.
+
+    Per-frame timelines are built with NumPy from labelled segments (see 'build_timeline'), so parsing
+    doesn't involve any per-frame Python operation.
     """
 
-    def time_str_to_sec(time_str):
-        """A util function to convert a timestamp to seconds.
+    def time_str_to_sec(time_strs):
+        """A util function to convert timestamps to seconds.
 
         Args:
-            time_str (str): A timestamp of form 'hh:mm:ss.ss'.
+            time_strs (array-like of str): Timestamps of form 'hh:mm:ss.ss'.
 
         Returns:
-            float: The corresponding number of seconds.
+            np.ndarray[float]: The corresponding numbers of seconds.
         
+        Raises:
+            ValueError: if a timestamp is not of the expected form.
         """
-        hrs, min, sec = time_str.split(":")
-        hrs = int(hrs)
-        min = int(min)
-        sec = float(sec)
-        return hrs*3600 + min*60 + sec
+        time_strs = np.asarray(time_strs, dtype=str)
+        hrs, sep1, rest = np.moveaxis(np.char.partition(time_strs, ":"), -1, 0)
+        min, sep2, sec = np.moveaxis(np.char.partition(rest, ":"), -1, 0)
+        if not (np.all(sep1 == ":") and np.all(sep2 == ":")):
+            raise ValueError("timestamps must be of form 'hh:mm:ss.ss'")
+        return hrs.astype(int)*3600 + min.astype(int)*60 + sec.astype(float)
 
     def time_to_id(time_strs, fps):
         """A util function to convert timestamps to frame_ids.
 
         Args:
-            time_strs (List[str]): A list of timestamps of form 'hh:mm:ss.ss'.
+            time_strs (array-like of str): Timestamps of form 'hh:mm:ss.ss'.
             fps (int): The FPS of the associated video.
 
         Returns:
-            List[int]: The corresponding list of frame_ids.
+            np.ndarray[int]: The corresponding frame_ids.
         
         """
-        mapping = lambda time_str: round(fps*LabelsParser.time_str_to_sec(time_str))
-        return list(map(mapping, time_strs))
+        return np.rint(fps*LabelsParser.time_str_to_sec(time_strs)).astype(np.int64)
+
+    def labels_to_ids(labels, labels_names, file):
+        """Maps label names to their indices in the labels names list.
+
+        Args:
+            labels (array-like of str): Label names.
+            labels_names (List[str]): A list of expected labels.
+            file (str): The labels file name, for warnings.
+
+        Returns:
+            np.ndarray[int]: The label indices, -1 for unrecognized labels.
+
+        Warns:
+            if an unexpected label name is encountered (once per name).
+        """
+        unique_labels, inverse = np.unique(np.asarray(labels, dtype=str), return_inverse=True)
+        unique_ids = np.full(len(unique_labels), -1, dtype=np.int64)
+        for i, label in enumerate(unique_labels):
+            try:
+                unique_ids[i] = labels_names.index(label)
+            except ValueError:
+                print(f"Warning: file {file} contains an unrecognized label: {label}")
+        return unique_ids[inverse.reshape(-1)]
+
+    def build_timeline(starts, ends, label_ids, length=None):
+        """Builds a per-frame labels timeline from labelled segments of frames.
+
+        Segments are sorted by start frame, and each frame takes the label of the last
+        segment starting at or before it, if that segment ends after the frame. Frames
+        that are not covered by any segment, or covered by a segment with an unrecognized
+        label (a negative label_id), are masked.
+
+        Args:
+            starts (array-like of int): First frame of each segment.
+            ends (array-like of int): End frame (exclusive) of each segment.
+            label_ids (array-like of int): Label index of each segment.
+            length (int, optional): Number of frames of the timeline. Defaults to
+                                    the end of the last segment.
+
+        Returns:
+            np.ma.MaskedArray[int]: The per-frame labels.
+        
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        label_ids = np.asarray(label_ids, dtype=np.int64)
+
+        # a stable sort keeps the file order of segments starting at the same frame,
+        # so that the last one wins
+        order = np.argsort(starts, kind="stable")
+        starts, ends, label_ids = starts[order], ends[order], label_ids[order]
+
+        if length is None:
+            length = int(ends.max()) if len(ends) else 0
+
+        frames = np.arange(length)
+        segment = np.searchsorted(starts, frames, side="right") - 1
+        covered = segment >= 0
+        segment = np.maximum(segment, 0)
+        if len(starts):
+            covered &= frames < ends[segment]
+            timeline = label_ids[segment]
+        else:
+            timeline = np.full(length, -1, dtype=np.int64)
+
+        return np.ma.masked_array(timeline, mask=~covered | (timeline < 0))
 
     def check_csv_txt_structure(file):
         """Checks the structure of the .txt or .csv file. It should be
@@ -131,7 +310,7 @@ class LabelsParser:
             labels_names (List[str]): A list of expected labels.
 
         Returns:
-            List[int|None]: The parsed labels (Described in the class docstring)
+            np.ma.MaskedArray[int]: The parsed labels (Described in the class docstring)
         
         Raises:
             AssertionError: if the file structure is not supported.
@@ -140,36 +319,24 @@ class LabelsParser:
             if an unexpected label name is encountered.
         """
         delimiter = LabelsParser.check_csv_txt_structure(csv_txt_file)
-        identifiers = []
-        labels = []
         with open(csv_txt_file) as f:
-            reader = csv.reader(f, delimiter=delimiter)
-            for row in reader:
-                identifiers.append(row[0])
-                labels.append(row[1])
+            rows = np.array(list(csv.reader(f, delimiter=delimiter)), dtype=str).reshape(-1, 2)
         
-        identifiers = identifiers[1:]
-        labels = labels[1:]
+        identifiers = rows[1:, 0]
+        labels = rows[1:, 1]
 
         try:
-            identifiers = list(map(int, identifiers))
+            identifiers = identifiers.astype(np.int64)
         except ValueError:
             try:
                 identifiers = LabelsParser.time_to_id(identifiers, fps)
             except ValueError:
                 raise AssertionError(f"Invalid file {csv_txt_file}. Label files first column entries must be integers as frame IDs or a timestamp in the form of 'hh:mm:ss.ss'")
         
+        label_ids = LabelsParser.labels_to_ids(labels, labels_names, csv_txt_file)
 
-        max_len = max(identifiers)
-        parsed = [None]*(max_len + 1)
-
-        for i, frame_id in enumerate(identifiers):
-            try:
-                parsed[frame_id] = labels_names.index(labels[i])
-            except ValueError:
-                print(f"Warning: file {csv_txt_file} contains an unrecognized label: {labels[i]}")
-        
-        return parsed
+        # each row labels a single frame
+        return LabelsParser.build_timeline(identifiers, identifiers + 1, label_ids)
 
 
 
@@ -196,7 +363,7 @@ class LabelsParser:
             labels_names (List[str]): A list of expected labels.
 
         Returns:
-            List[int|None]: The parsed labels (Described in the class docstring)
+            np.ma.MaskedArray[int]: The parsed labels (Described in the class docstring)
         
         Raises:
             AssertionError: if the file structure is not supported.
@@ -207,13 +374,12 @@ class LabelsParser:
         """
 
         with open(json_file) as f:
-            labels_dict = json.load(f)
+            phases = json.load(f)
         
-        labels_dict.sort(key=lambda x:x['timestamp'])
-
-        frame_id_end = 0
-        parsed = []
-        for phase in f:
+        timestamps = []
+        durations = []
+        labels = []
+        for phase in phases:
             try:
                 duration, timestamp, label = phase['duration'], phase['timestamp'], phase['labelName']
             except KeyError:
@@ -221,22 +387,15 @@ class LabelsParser:
                     duration, timestamp, label = phase['duration'], phase['timestamp'], phase['label']['name']
                 except KeyError:
                     raise AssertionError(f"File {json_file} structure is not supported")
-            
-            try:
-                label_id = labels_names.index(label)
-            except ValueError:
-                print(f"Warning: file {json_file} contains an unrecognized label: {label}")
+            timestamps.append(timestamp)
+            durations.append(duration)
+            labels.append(label)
 
-            frame_id_start = round(timestamp*fps/1000)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        durations = np.asarray(durations, dtype=np.float64)
 
-            while frame_id_end < frame_id_start:
-                parsed.append(None)
-                frame_id_end += 1
+        starts = np.rint(timestamps*fps/1000).astype(np.int64)
+        ends = np.rint((timestamps + durations)*fps/1000).astype(np.int64)
+        label_ids = LabelsParser.labels_to_ids(labels, labels_names, json_file)
 
-            frame_id_end = round((timestamp + duration)*fps/1000)
-
-            while frame_id_start < frame_id_end:
-                parsed.append(label_id)
-                frame_id_start += 1
-        
-        return parsed
+        return LabelsParser.build_timeline(starts, ends, label_ids)
@@ -0,0 +1,89 @@
+"""Bootstrap confidence intervals for metrics
+
+Metrics are described by statistics computed once per sample. A
+bootstrap replicate is then represented by how many times each sample
+was drawn, so a whole chunk of replicates becomes a (replicates, samples)
+weights matrix, and metric functions compute every replicate of the chunk
+with vectorized NumPy operations. Chunks are spread across processes, each
+seeded from the configured seed, so results don't depend on the number of
+workers.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# Replicates computed per task, bounded so that a weights matrix has at
+# most MAX_CHUNK_ENTRIES entries. Chunks don't depend on the number of
+# workers, which keeps results reproducible
+CHUNK_REPLICATES = 100
+MAX_CHUNK_ENTRIES = 10_000_000
+
+
+def bootstrap_params(params):
+    """Reads bootstrap settings from the parameters file contents.
+
+    Expected format:
+
+        bootstrap:
+          replicates: 1000
+          seed: 0
+          confidence: 0.95
+          workers: 4
+
+    Returns:
+        dict: keyword arguments for bootstrap_ci. None if bootstrapping is disabled
+    """
+    config = params.get("bootstrap") or {}
+    if not config.get("replicates"):
+        return None
+    return {
+        "n_replicates": config["replicates"],
+        "seed": config.get("seed", 0),
+        "confidence": config.get("confidence", 0.95),
+        "workers": config.get("workers"),
+    }
+
+
+def _run_chunk(statistic, data, n_samples, n_replicates, seed):
+    rng = np.random.default_rng(seed)
+    weights = rng.multinomial(n_samples, np.full(n_samples, 1 / n_samples), size=n_replicates)
+    return np.asarray(statistic(weights, data), dtype=np.float64)
+
+
+def bootstrap_ci(
+    statistic, data, n_samples, n_replicates=1000, seed=0, confidence=0.95, workers=None
+):
+    """Computes percentile bootstrap confidence intervals.
+
+    Args:
+        statistic (callable): module-level function taking a (replicates, samples)
+            weights matrix and data, returning metric values of shape (replicates, ...)
+        data: precomputed per-sample statistics passed to statistic
+        n_samples (int): number of samples being resampled
+        n_replicates (int): number of bootstrap replicates
+        seed (int): seed for drawing the replicates
+        confidence (float): confidence level of the intervals
+        workers (int, optional): number of processes. Defaults to the CPU count
+
+    Returns:
+        tuple: lower and upper bounds, each with the shape of a single metric value
+    """
+    chunk_size = max(1, min(CHUNK_REPLICATES, MAX_CHUNK_ENTRIES // max(1, n_samples)))
+    sizes = [chunk_size] * (n_replicates // chunk_size)
+    if n_replicates % chunk_size:
+        sizes.append(n_replicates % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    if workers == 1 or len(sizes) == 1:
+        values = [_run_chunk(statistic, data, n_samples, size, s) for size, s in zip(sizes, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_run_chunk, statistic, data, n_samples, size, s)
+                for size, s in zip(sizes, seeds)
+            ]
+            values = [future.result() for future in futures]
+    values = np.concatenate(values)
+
+    alpha = (1 - confidence) / 2
+    lower, upper = np.nanquantile(values, [alpha, 1 - alpha], axis=0)
+    return lower, upper
@@ -0,0 +1,120 @@
+# Predictions storage
+#
+# Predictions are streamed into a set of memory-mappable `.npy` shards
+# plus a csv index mapping every input file name to its (shard, row)
+# location, instead of writing one pickle per slice.
+#
+# Shared by the DFCI model cubes, which write predictions, and the DFCI
+# metric cube, which reads them, so both always agree on the shard format.
+import os
+import csv
+
+import numpy as np
+import torch
+
+INDEX_FILE = "index.csv"
+SHARD_TEMPLATE = "preds_{:05d}.npy"
+
+
+class PredictionWriter:
+    """
+    Writes predictions into fixed-size memory-mapped shards.
+
+    Args:
+        out_dir: directory where shards and index are stored
+        total: total number of predictions that will be written
+        shard_size: maximum number of predictions per shard
+        dtype: numpy dtype used to store the predictions
+    """
+
+    def __init__(self, out_dir, total, shard_size=1024, dtype="float32"):
+        self.out_dir = out_dir
+        self.total = total
+        self.shard_size = max(1, shard_size)
+        self.dtype = np.dtype(dtype)
+        self.written = 0
+        self.shard = None
+        self.index = []
+
+    def _open_shard(self, sample_shape):
+        shard_id = self.written // self.shard_size
+        rows = min(self.shard_size, self.total - self.written)
+        path = os.path.join(self.out_dir, SHARD_TEMPLATE.format(shard_id))
+        self.shard = np.lib.format.open_memmap(
+            path, mode="w+", dtype=self.dtype, shape=(rows,) + tuple(sample_shape)
+        )
+        self.shard_id = shard_id
+
+    def write(self, names, preds):
+        """Stores a batch of predictions
+
+        Args:
+            names: file names of the samples in the batch
+            preds: tensor or array of shape (batch, ...) with the predictions
+        """
+        if torch.is_tensor(preds):
+            preds = preds.detach().cpu().numpy()
+        for name, pred in zip(names, preds):
+            if self.written >= self.total:
+                raise ValueError("Received more predictions than expected")
+            row = self.written % self.shard_size
+            if row == 0:
+                self.flush()
+                self._open_shard(pred.shape)
+            self.shard[row] = pred
+            self.index.append((name, self.shard_id, row))
+            self.written += 1
+
+    def flush(self):
+        if self.shard is not None:
+            self.shard.flush()
+            self.shard = None
+
+    def close(self):
+        """Flushes the last shard and writes the index file"""
+        self.flush()
+        index_path = os.path.join(self.out_dir, INDEX_FILE)
+        with open(index_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["name", "shard", "row"])
+            writer.writerows(self.index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class PredictionReader:
+    """
+    Gives access to predictions by input file name. Supports both the
+    sharded format written by `PredictionWriter` and the legacy layout
+    of one `torch.save`d tensor per input file.
+
+    Args:
+        preds_dir: directory containing the predictions
+    """
+
+    def __init__(self, preds_dir):
+        self.preds_dir = preds_dir
+        self.shards = {}
+        self.index = None
+        index_path = os.path.join(preds_dir, INDEX_FILE)
+        if os.path.exists(index_path):
+            self.index = {}
+            with open(index_path, "r", newline="") as f:
+                for row in csv.DictReader(f):
+                    self.index[row["name"]] = (int(row["shard"]), int(row["row"]))
+
+    def _shard(self, shard_id):
+        if shard_id not in self.shards:
+            path = os.path.join(self.preds_dir, SHARD_TEMPLATE.format(shard_id))
+            self.shards[shard_id] = np.load(path, mmap_mode="r")
+        return self.shards[shard_id]
+
+    def __getitem__(self, name):
+        if self.index is None:
+            return torch.load(os.path.join(self.preds_dir, name))
+        shard_id, row = self.index[name]
+        return torch.from_numpy(np.array(self._shard(shard_id)[row]))